@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+
+"""Benchmarks of RollTheLore hot paths.
+
+Run from the repository root:
+
+    python benchmarks/bench.py --output baseline.json
+    python benchmarks/bench.py --compare baseline.json
+
+Results are printed and optionally stored as JSON. When comparing with
+a baseline, the script exits with status 1 if any benchmark got slower by
+more than the given threshold.
+"""
+
+import json
+import os
+import platform
+import random
+import subprocess  # nosec
+import sys
+import timeit
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Both pylint and pycodestyle (make travis) check this file, each needs
+# its own marker for the import after the sys.path setup.
+# pylint: disable=wrong-import-position
+from loreroll import (  # noqa: E402
+    fastyaml, npc, population, settlement, unique, vectorized
+)
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name, number=1, repeat=5):
+    """Register a benchmark.
+
+    The decorated function sets up the benchmark and returns a callable
+    to be timed; it's called 'number' times per measurement and the best
+    of 'repeat' measurements is reported.
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = (setup, number, repeat)
+        return setup
+    return decorator
+
+
+def _run_python(code):
+    """Return a callable running the given code in a fresh interpreter."""
+    def run():
+        subprocess.run(  # nosec
+            [sys.executable, '-c', code], check=True, cwd=ROOT,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    return run
+
+
+@benchmark('import.bundle', repeat=10)
+def bench_import_bundle():
+    """Cold import and data load using the compiled bundle."""
+    return _run_python(
+        'import loreroll.npc as npc\n'
+        'for name in npc.NPC_DATA: npc.NPC_DATA[name]\n'
+    )
+
+
+@benchmark('import.yaml', repeat=3)
+def bench_import_yaml():
+    """Cold import and data load parsing the YAML data."""
+    return _run_python(
+        'import loreroll.npc as npc\n'
+        'npc.NPC_BUNDLE_FILENAME = ""\n'
+        'for name in npc.NPC_DATA: npc.NPC_DATA[name]\n'
+    )
+
+
+def _read_yaml():
+    """Return text of the YAML NPC data."""
+    with open(npc.NPC_FILENAME, encoding='utf-8') as yaml_file:
+        return yaml_file.read()
+
+
+@benchmark('parse_yaml.fast', number=10)
+def bench_parse_yaml_fast():
+    """Parsing the YAML data by the fast parser."""
+    text = _read_yaml()
+    return lambda: fastyaml.parse(text, npc.SECTION_KINDS,
+                                  npc.OPTIONAL_SECTIONS)
+
+
+@benchmark('parse_yaml.strictyaml', repeat=1)
+def bench_parse_yaml_strictyaml():
+    """Parsing the YAML data by StrictYAML (used for invalid data)."""
+    # pylint: disable=import-outside-toplevel
+    from strictyaml import load
+
+    text = _read_yaml()
+    schema = npc._strict_schema(  # pylint: disable=protected-access
+        npc.SECTION_KINDS, npc.OPTIONAL_SECTIONS
+    )
+    return lambda: load(text, schema)
+
+
+@benchmark('import.only', repeat=10)
+def bench_import_only():
+    """Cold import without loading any data."""
+    return _run_python('import loreroll.npc')
+
+
+@benchmark('weighted_random', number=10000)
+def bench_weighted_random():
+    """_weighted_random() on all the races."""
+    # pylint: disable=protected-access
+    races = npc.NPC_DATA['races']
+    return lambda: npc._weighted_random(races)
+
+
+@benchmark('weighted_sampler', number=100000)
+def bench_weighted_sampler():
+    """Drawing races from a prepared WeightedSampler."""
+    sampler = npc.WeightedSampler(npc.NPC_DATA['races'])
+    return sampler.sample
+
+
+def _bench_filter(terms):
+    """Filtering personality traits by the given number of terms."""
+    def setup():
+        # pylint: disable=protected-access
+        rng = random.Random(terms)
+        words = [trait.split()[0] for trait in npc.NPC_DATA['personality']]
+        allowed = tuple(rng.sample(words, terms))
+        disallowed = tuple(rng.sample(words, terms))
+        data_set = npc.NPC_DATA['personality']
+        return lambda: npc._filter_string_data(
+            data_set, allowed, disallowed
+        )
+    return setup
+
+
+for _terms in (1, 4, 16, 64):
+    benchmark(f'filter.terms_{_terms}', number=100)(_bench_filter(_terms))
+
+
+def _bench_generate(number, engine='python'):
+    """Generating the given number of NPCs."""
+    def setup():
+        rng = random.Random(number)
+        return lambda: npc.generate_npcs(number, engine=engine, rng=rng)
+    return setup
+
+
+for _number, _repeats in ((1, 10000), (1000, 10), (1000000, 1)):
+    benchmark(f'generate_npcs.{_number}', number=_repeats,
+              repeat=3 if _number > 1000 else 5)(_bench_generate(_number))
+    if vectorized.available():
+        benchmark(f'generate_npcs_numpy.{_number}', number=_repeats,
+                  repeat=3 if _number > 1000 else 5)(
+                      _bench_generate(_number, 'numpy')
+                  )
+
+
+@benchmark('generate_name.1000000', repeat=3)
+def bench_generate_name():
+    """Generating a million names one by one."""
+    rng = random.Random(1)
+    return lambda: [npc.generate_name(rng) for _ in range(1000000)]
+
+
+@benchmark('generate_names.1000000', repeat=3)
+def bench_generate_names():
+    """Generating a million names at once."""
+    rng = random.Random(1)
+    return lambda: npc.generate_names(1000000, rng=rng)
+
+
+@benchmark('generate_names_unique.1000000', repeat=3)
+def bench_generate_names_unique():
+    """Generating a million names repeating them only when exhausted."""
+    rng = random.Random(1)
+    return lambda: npc.generate_names(1000000, unique=True, rng=rng)
+
+
+@benchmark('generate_unique_npcs.100000', repeat=3)
+def bench_generate_unique_npcs():
+    """Generating 100000 distinct NPCs."""
+    rng = random.Random(1)
+    return lambda: unique.generate_unique_npcs(100000, rng=rng)
+
+
+@benchmark('indexed_population.100000', repeat=3)
+def bench_indexed_population():
+    """Indexing 100000 NPCs for queries."""
+    npcs = npc.generate_npcs(100000, traits=3, rng=random.Random(1))
+    return lambda: population.IndexedPopulation(npcs)
+
+
+@benchmark('population_query.100000', number=100)
+def bench_population_query():
+    """Querying 100000 indexed NPCs by age, race and a trait."""
+    indexed = population.IndexedPopulation(
+        npc.iter_npcs(100000, traits=3, rng=random.Random(1))
+    )
+    return lambda: indexed.query(age='old', race='tiefling', physical='scar')
+
+
+@benchmark('settlement.100000', repeat=3)
+def bench_settlement():
+    """Generating a city of about 100000 inhabitants in 20000 households."""
+    city = {
+        'name': 'city',
+        'mix': {'races': {'human': 6, 'elf (high)': 1, 'dwarf (hill)': 1}},
+        'children': [{
+            'name': 'district',
+            'count': 4,
+            'children': [{'name': 'household', 'count': 5000,
+                          'inhabitants': [1, 9]}],
+        }],
+    }
+    return lambda: settlement.generate_settlement(city, seed=1)
+
+
+@benchmark('cli.rollnpc', repeat=10)
+def bench_cli():
+    """End-to-end latency of generating an NPC from the command line."""
+    return _run_python(
+        'import sys; sys.argv[1:] = ["-s", "1"]\n'
+        'import rollnpc; rollnpc.generate()\n'
+    )
+
+
+def is_selected(name, selected):
+    """Tell whether the benchmark name matches any of the selections.
+
+    A selection matches the name itself or the names in the group it
+    denotes, so 'generate_npcs' selects 'generate_npcs.1000' but
+    'generate_npcs.1000' does not select 'generate_npcs.1000000'.
+    """
+    if not selected:
+        return True
+    return any(name == sel or name.startswith(sel.rstrip('.') + '.')
+               for sel in selected)
+
+
+def run_benchmarks(selected):
+    """Run the selected benchmarks, return dict of results."""
+    results = {}
+    for name, (setup, number, repeat) in BENCHMARKS.items():
+        if not is_selected(name, selected):
+            continue
+        timer = timeit.Timer(setup())
+        best = min(timer.repeat(repeat=repeat, number=number)) / number
+        results[name] = {'seconds': best, 'ops_per_second': 1 / best}
+        click.echo(f'{name:<28} {best * 1e6:14.2f} us/op')
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Compare results with a baseline, return list of regressions."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['seconds'] / baseline[name]['seconds']
+        marker = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            marker = '  REGRESSION'
+        click.echo(f'{name:<28} {ratio:8.2f}x{marker}')
+    return regressions
+
+
+@click.command()
+@click.option('--output', '-o', type=click.Path(dir_okay=False),
+              help='Store the results in the given JSON file.')
+@click.option('--compare', '-c', 'baseline_file',
+              type=click.Path(exists=True, dir_okay=False),
+              help='Compare the results with the given baseline JSON file.')
+@click.option('--threshold', '-t', default=0.2, show_default=True,
+              help='Relative slowdown reported as a regression.')
+@click.argument('selected', nargs=-1)
+def main(output, baseline_file, threshold, selected):
+    """Run benchmarks (optionally only SELECTED ones or groups of them)."""
+    results = run_benchmarks(selected)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if output:
+        with open(output, 'w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if baseline_file:
+        with open(baseline_file, encoding='utf-8') as input_file:
+            baseline = json.load(input_file)['results']
+        click.echo(f'\nCompared with {baseline_file}:')
+        if compare(results, baseline, threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,52 @@
+"""RollTheLore maintenance commands."""
+
+import click
+
+from loreroll.bundle import BundleError, compile_bundle, read_bundle
+from loreroll.npc import _parse_yaml, NPC_BUNDLE_FILENAME, NPC_FILENAME
+
+
+@click.group()
+def cli():
+    """RollTheLore maintenance commands."""
+
+
+@cli.command('compile-data')
+@click.option('--source', default=NPC_FILENAME, show_default=True,
+              type=click.Path(exists=True, dir_okay=False),
+              help='YAML data file to compile.')
+@click.option('--output', '-o', default=NPC_BUNDLE_FILENAME,
+              show_default=True, type=click.Path(dir_okay=False),
+              help='Where to write the compiled data bundle.')
+def compile_data(source, output):
+    """Compile YAML NPC data into a binary data bundle."""
+    compile_bundle(_parse_yaml(source), output, source)
+    click.echo(f'Compiled "{source}" into "{output}".')
+
+
+@cli.command('verify-data')
+@click.option('--source', default=NPC_FILENAME, show_default=True,
+              type=click.Path(exists=True, dir_okay=False),
+              help='YAML data file the bundle should be compiled from.')
+@click.option('--bundle', '-b', default=NPC_BUNDLE_FILENAME,
+              show_default=True, type=click.Path(dir_okay=False),
+              help='Data bundle to verify.')
+def verify_data(source, bundle):
+    """Check that the data bundle is compiled from the YAML NPC data.
+
+    Unlike loading the data, this always compares the checksum of the YAML
+    data so it also catches edits that kept its size and modification time.
+    """
+    try:
+        up_to_date = read_bundle(bundle).is_compiled_from(source, verify=True)
+    except (OSError, BundleError) as error:
+        raise click.ClickException(str(error)) from error
+    if not up_to_date:
+        raise click.ClickException(
+            f'"{bundle}" is out of date, run `loreroll compile-data`'
+        )
+    click.echo(f'"{bundle}" is up to date with "{source}".')
+
+
+if __name__ == '__main__':
+    cli()  # pylint: disable=no-value-for-parameter
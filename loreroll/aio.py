@@ -0,0 +1,139 @@
+"""Generating NPCs from asyncio code.
+
+Generating many NPCs at once blocks the event loop. The async iterators of
+this module generate NPCs in batches of batch_size and let other tasks run
+between the batches:
+
+    async for npc in aiter_npcs(100000, rng=random.Random(42)):
+        await post(npc)
+
+Generation is driven by the consumer - the next batch is only generated
+when the previous one has been consumed, so a slow consumer slows down the
+generation instead of piling up NPCs in memory.
+
+Large jobs may run in an executor (e.g. a ThreadPoolExecutor) instead so
+the event loop only waits for the batches. Up to prefetch batches are then
+generated ahead of the consumer, the executor waits while the consumer
+catches up.
+
+Each call uses its own random generator (a new one unless rng is given) so
+concurrent calls never share random state and the same seed gives the same
+NPCs as iter_npcs() regardless of the batch size or the executor.
+"""
+
+import asyncio
+import itertools
+import random
+
+from loreroll.npc import iter_npcs
+
+
+BATCH_SIZE = 256
+# Number of batches generated ahead of the consumer in an executor.
+PREFETCH = 4
+
+
+async def aiter_npc_batches(number=1, traits=2, filters=None,
+                            generate_adventurers=True, engine='python',
+                            rng=None, data=None, batch_size=BATCH_SIZE,
+                            executor=None, prefetch=PREFETCH):
+    """Generate NPCs asynchronously, yield them in lists of batch_size.
+
+    Takes the same parameters as iter_npcs() except for rng - if None,
+    a new random generator is used instead of the global random module.
+    Pass a random.Random instance to get reproducible NPCs, it must not be
+    used by anything else until the iteration finishes.
+
+    If executor (a concurrent.futures.Executor running threads) is given,
+    the batches are generated in it, up to prefetch batches ahead.
+    Errors of invalid parameters are raised when the first batch is
+    awaited.
+    """
+    if batch_size < 1 or prefetch < 1:
+        raise ValueError('Batch size and prefetch must be positive')
+    rng = random.Random() if rng is None else rng  # nosec
+    npcs = iter_npcs(number, traits, filters, generate_adventurers, engine,
+                     rng, data)
+
+    def next_batch():
+        return list(itertools.islice(npcs, batch_size))
+
+    if executor is None:
+        while batch := next_batch():
+            yield batch
+            # Let other tasks run before generating the next batch.
+            await asyncio.sleep(0)
+        return
+
+    batches = _prefetch(next_batch, executor, prefetch)
+    try:
+        async for batch in batches:
+            yield batch
+    finally:
+        await batches.aclose()
+
+
+async def _prefetch(next_batch, executor, prefetch):
+    """Yield batches generated by next_batch() in the executor.
+
+    The batches are passed through a queue of prefetch batches - the
+    producer task waits whenever the queue is full.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(prefetch)
+
+    async def produce():
+        try:
+            while batch := await loop.run_in_executor(executor, next_batch):
+                await queue.put(batch)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            await queue.put(error)
+        else:
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (batch := await queue.get()) is not None:
+            if isinstance(batch, Exception):
+                raise batch
+            yield batch
+    finally:
+        # A batch being generated is finished by the executor but nothing
+        # else is generated once the consumer stops.
+        producer.cancel()
+
+
+async def aiter_npcs(number=1, traits=2, filters=None,
+                     generate_adventurers=True, engine='python', rng=None,
+                     data=None, batch_size=BATCH_SIZE, executor=None,
+                     prefetch=PREFETCH):
+    """Generate NPCs asynchronously, yield them one by one.
+
+    See aiter_npc_batches() for the parameters.
+    """
+    batches = aiter_npc_batches(number, traits, filters,
+                                generate_adventurers, engine, rng, data,
+                                batch_size, executor, prefetch)
+    try:
+        async for batch in batches:
+            for npc in batch:
+                yield npc
+    finally:
+        await batches.aclose()
+
+
+async def agenerate_npcs(number=1, traits=2, filters=None,
+                         generate_adventurers=True, engine='python',
+                         rng=None, data=None, batch_size=BATCH_SIZE,
+                         executor=None, prefetch=PREFETCH):
+    """Generate a list of NPCs asynchronously.
+
+    See aiter_npc_batches() for the parameters.
+    """
+    npcs = []
+    async for batch in aiter_npc_batches(number, traits, filters,
+                                         generate_adventurers, engine, rng,
+                                         data, batch_size, executor,
+                                         prefetch):
+        npcs.extend(batch)
+    return npcs
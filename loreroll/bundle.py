@@ -0,0 +1,294 @@
+"""Compiled binary bundle of NPC data.
+
+Parsing the YAML source data is slow, so it is compiled ahead of time (see
+``loreroll compile-data``) into a simple binary format that can be
+memory-mapped and decoded lazily, one section at a time.
+
+The bundle layout (all numbers little-endian):
+
+* header - magic, format version, number of sections and the size and
+  SHA-512 digest of the YAML file it was compiled from
+* section directory - name, kind, item count and offsets of the section data
+* section data - a table of string offsets (uint32, one more than the number
+  of strings) followed by the UTF-8 encoded string blob and, for weighted
+  sections, a packed array of ``count`` weights (float64)
+
+Group sections (sequences of sequences of strings) store all the strings of
+all ``count`` groups in one string table and the end offsets of the groups
+in that table as a packed array of ``count`` uint32 numbers instead of the
+weights.
+"""
+
+import hashlib
+import itertools
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+
+
+MAGIC = b'RTLB'
+FORMAT_VERSION = 3
+
+KIND_STRINGS = 0
+KIND_WEIGHTED = 1
+KIND_GROUPS = 2
+
+_HEADER = struct.Struct('<4sHHQ64s')
+
+# How much newer than the bundle the YAML file may be and still count as
+# unchanged. Checkouts and installations write both files anew, in any order.
+MTIME_TOLERANCE_NS = 60 * 10**9
+_SECTION = struct.Struct('<32sBIQQ')
+
+
+class BundleError(Exception):
+    """Raised when a data bundle can't be read."""
+
+
+def _little_endian(values):
+    """Convert the given array from/to little-endian byte order in place."""
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _yaml_fingerprint(yaml_path):
+    """Return size and SHA-512 digest of a YAML file."""
+    with open(yaml_path, 'rb') as yaml_file:
+        contents = yaml_file.read()
+    return len(contents), hashlib.sha512(contents).digest()
+
+
+def _section_kind(items):
+    """Determine the kind of the given section items."""
+    if all(isinstance(item, str) for item in items):
+        return KIND_STRINGS
+    if all(isinstance(item, Mapping) and set(item) == {'v', 'w'}
+           for item in items):
+        return KIND_WEIGHTED
+    if all(isinstance(item, (list, tuple))
+           and all(isinstance(value, str) for value in item)
+           for item in items):
+        return KIND_GROUPS
+    raise BundleError('Only sequences of strings, {v, w} mappings or '
+                      'sequences of strings can be stored in a data bundle.')
+
+
+def _encode_section(items, kind):
+    """Encode the given section items, return (strings, extra) bytes.
+
+    Extra bytes are the weights of weighted sections and the group ends of
+    group sections.
+    """
+    if kind == KIND_STRINGS:
+        values = items
+    elif kind == KIND_WEIGHTED:
+        values = [item['v'] for item in items]
+    else:
+        values = [value for item in items for value in item]
+    blob = bytearray()
+    offsets = array('I', [0])
+    for value in values:
+        blob += str(value).encode()
+        offsets.append(len(blob))
+    strings = _little_endian(offsets).tobytes() + bytes(blob)
+
+    extra = b''
+    if kind == KIND_WEIGHTED:
+        extra = _little_endian(
+            array('d', [float(item['w']) for item in items])
+        ).tobytes()
+    elif kind == KIND_GROUPS:
+        extra = _little_endian(
+            array('I', itertools.accumulate(len(item) for item in items))
+        ).tobytes()
+    return strings, extra
+
+
+def compile_bundle(data, bundle_path, yaml_path=None):
+    """Compile the parsed NPC data into a bundle file.
+
+    The data need to be a mapping of section names to sequences of either
+    strings, {v, w} mappings (values and weights) or sequences of strings
+    (groups). The yaml_path is the YAML file the data were parsed from and
+    its fingerprint is stored in the bundle so that stale bundles can be
+    detected. If there is no single YAML file (e.g. for merged data), an
+    empty fingerprint is stored instead.
+
+    The bundle is written to a temporary file first and then moved to
+    bundle_path so readers never see a partially written bundle.
+    """
+    if yaml_path is None:
+        size, digest = 0, bytes(64)
+    else:
+        size, digest = _yaml_fingerprint(yaml_path)
+
+    directory_size = _HEADER.size + _SECTION.size * len(data)
+    directory = []
+    payload = bytearray()
+    for name, items in data.items():
+        encoded_name = name.encode()
+        if len(encoded_name) > 32:
+            raise BundleError(f'Section name too long: "{name}"')
+        kind = _section_kind(items)
+        strings, extra = _encode_section(items, kind)
+        strings_offset = directory_size + len(payload)
+        payload += strings
+        extra_offset = 0
+        if kind != KIND_STRINGS:
+            # Keep the packed array aligned.
+            payload += bytes(-(directory_size + len(payload)) % 8)
+            extra_offset = directory_size + len(payload)
+            payload += extra
+        directory.append(_SECTION.pack(
+            encoded_name, kind, len(items), strings_offset, extra_offset
+        ))
+
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, len(data), size, digest
+    )
+    tmp_path = f'{bundle_path}.tmp{os.getpid()}'
+    with open(tmp_path, 'wb') as bundle_file:
+        bundle_file.write(header)
+        bundle_file.writelines(directory)
+        bundle_file.write(payload)
+    os.replace(tmp_path, bundle_path)
+
+
+class Bundle(Mapping):
+    """Read-only, lazily decoded view of a data bundle.
+
+    The bundle file is memory-mapped and sections are only decoded on first
+    access. Decoded sections have the same structure as the data parsed
+    from YAML - lists of strings, lists of {v, w} dictionaries or lists of
+    lists of strings.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as bundle_file:
+            try:
+                self._buffer = mmap.mmap(
+                    bundle_file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+                self.mtime_ns = os.fstat(bundle_file.fileno()).st_mtime_ns
+            except ValueError as error:
+                raise BundleError(f'Empty bundle file "{path}"') from error
+
+        try:
+            (magic, version, sections,
+             self.yaml_size, self.yaml_digest) = _HEADER.unpack_from(
+                 self._buffer
+             )
+        except struct.error as error:
+            raise BundleError(f'Truncated bundle file "{path}"') from error
+        if magic != MAGIC:
+            raise BundleError(f'Not a data bundle: "{path}"')
+        if version != FORMAT_VERSION:
+            raise BundleError(
+                f'Unsupported bundle format version {version} of "{path}"'
+            )
+
+        self._sections = {}
+        for index in range(sections):
+            name, kind, count, strings_offset, extra_offset = (
+                _SECTION.unpack_from(
+                    self._buffer, _HEADER.size + index * _SECTION.size
+                )
+            )
+            self._sections[name.rstrip(b'\0').decode()] = (
+                kind, count, strings_offset, extra_offset
+            )
+        self._decoded = {}
+
+    def __getitem__(self, name):
+        try:
+            return self._decoded[name]
+        except KeyError:
+            pass
+
+        kind = self._sections[name][0]
+        values = self.strings(name)
+        if kind == KIND_WEIGHTED:
+            values = [
+                {'v': value, 'w': weight}
+                for value, weight in zip(values, self.weights(name))
+            ]
+        elif kind == KIND_GROUPS:
+            ends = self._group_ends(name)
+            values = [
+                values[start:end]
+                for start, end in zip(itertools.chain([0], ends), ends)
+            ]
+        self._decoded[name] = values
+        return values
+
+    def __iter__(self):
+        return iter(self._sections)
+
+    def __len__(self):
+        return len(self._sections)
+
+    def strings(self, name):
+        """Return the string values of the given section.
+
+        Strings of all the groups are returned in one list for group
+        sections.
+        """
+        kind, count, offset, _ = self._sections[name]
+        if kind == KIND_GROUPS:
+            ends = self._group_ends(name)
+            count = ends[-1] if ends else 0
+        offsets = array('I')
+        offsets.frombytes(self._buffer[offset:offset + 4 * (count + 1)])
+        _little_endian(offsets)
+        blob = self._buffer[offset + 4 * (count + 1):
+                            offset + 4 * (count + 1) + offsets[-1]]
+        return [
+            blob[start:end].decode()
+            for start, end in zip(offsets, offsets[1:])
+        ]
+
+    def weights(self, name):
+        """Return the packed weights of the given weighted section."""
+        kind, count, _, offset = self._sections[name]
+        if kind != KIND_WEIGHTED:
+            raise BundleError(f'Section "{name}" is not weighted')
+        weights = array('d')
+        weights.frombytes(self._buffer[offset:offset + 8 * count])
+        return _little_endian(weights)
+
+    def _group_ends(self, name):
+        """Return the end offsets of groups of the given group section."""
+        _, count, _, offset = self._sections[name]
+        ends = array('I')
+        ends.frombytes(self._buffer[offset:offset + 4 * count])
+        return _little_endian(ends)
+
+    def is_compiled_from(self, yaml_path, verify=False):
+        """Check whether the bundle is up to date with the given YAML file.
+
+        The YAML file is not read, the bundle is up to date unless the file
+        size differs from the one the bundle was compiled from or the file
+        has been modified after the bundle (allowing MTIME_TOLERANCE_NS for
+        checkouts and installations). With verify, the SHA-512 digest of the
+        YAML file is compared instead, catching any edit.
+        """
+        if verify:
+            return _yaml_fingerprint(yaml_path) == (self.yaml_size,
+                                                    self.yaml_digest)
+        stat = os.stat(yaml_path)
+        return (stat.st_size == self.yaml_size
+                and stat.st_mtime_ns <= self.mtime_ns + MTIME_TOLERANCE_NS)
+
+    def close(self):
+        """Close the underlying memory map."""
+        self._buffer.close()
+
+
+def read_bundle(path):
+    """Open the data bundle stored at the given path."""
+    return Bundle(path)
@@ -0,0 +1,222 @@
+"""Registry of NPC data sets.
+
+A data set is the package NPC data with any number of YAML data files
+layered on top of it - e.g. homebrew races or names of a campaign setting.
+Layer files have the same format as the package data file (see
+loreroll/data/npc.yaml) but all the sections are optional. Their items are
+added to the items of the layers below (weights of already existing values
+are replaced) unless the section is listed in the 'replace' section:
+
+    replace:
+    - names
+    names:
+    - Geralt
+    - Yennefer
+
+Merging the layers is done only once - the merged data are compiled into
+a data bundle (see loreroll.bundle) cached in the user cache directory (see
+cache_dir()) and shared by all the processes using the same layers. Data
+providers are shared as well so layering costs nothing at generation time.
+
+    register_dataset('witcher', ['witcher.yaml'])
+    npcs = generate_npcs(10, data=get_dataset('witcher'))
+"""
+
+import hashlib
+import os
+import sys
+import threading
+
+from loreroll import fastyaml
+from loreroll.bundle import BundleError, compile_bundle, FORMAT_VERSION
+from loreroll.bundle import read_bundle
+from loreroll.npc import (
+    _check_exclusive,
+    _load_yaml,
+    _read_data,
+    DataProvider,
+    NPC_DATA,
+    NPC_FILENAME,
+    SECTION_KINDS,
+)
+
+
+DEFAULT_DATASET = 'default'
+
+# Layer file sections - the NPC data sections and names of the sections
+# replacing the sections of the layers below.
+LAYER_KINDS = {**SECTION_KINDS, 'replace': fastyaml.KIND_STRINGS}
+
+_lock = threading.Lock()
+# Data set names mapped to tuples of layer file paths.
+_registry = {DEFAULT_DATASET: ()}
+# Tuples of layer file paths mapped to data providers.
+_providers = {(): NPC_DATA}
+
+
+class DatasetError(Exception):
+    """Raised for unknown data sets or invalid layer files."""
+
+
+def cache_dir():
+    """Return the directory to cache compiled data sets in.
+
+    It's $ROLLTHELORE_CACHE_DIR if set, rollthelore directory in
+    $XDG_CACHE_HOME (~/.cache by default) otherwise.
+    """
+    path = os.environ.get('ROLLTHELORE_CACHE_DIR')
+    if path:
+        return path
+    cache_home = (os.environ.get('XDG_CACHE_HOME')
+                  or os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'rollthelore')
+
+
+def _read_layers(layers):
+    """Read the layer files, return list of their texts."""
+    texts = []
+    for path in layers:
+        try:
+            with open(path, 'r', encoding='utf-8') as layer_file:
+                texts.append(layer_file.read())
+        except OSError as error:
+            raise DatasetError(f'Could not read data file "{path}": '
+                               f'{error}') from error
+    return texts
+
+
+def _cache_key(texts):
+    """Return cache key of the package data with the given layers."""
+    key = hashlib.sha256(f'{FORMAT_VERSION}'.encode())
+    with open(NPC_FILENAME, 'rb') as yaml_file:
+        key.update(hashlib.sha256(yaml_file.read()).digest())
+    for text in texts:
+        key.update(hashlib.sha256(text.encode()).digest())
+    return key.hexdigest()
+
+
+def _merge_section(kind, items, layer_items):
+    """Add items of a layer to the items of a section."""
+    if kind == fastyaml.KIND_GROUPS:
+        return [*items, *layer_items]
+    if kind == fastyaml.KIND_STRINGS:
+        known = set(items)
+        return [*items, *(item for item in layer_items if item not in known)]
+
+    merged = list(items)
+    positions = {item['v']: index for index, item in enumerate(merged)}
+    for item in layer_items:
+        if item['v'] in positions:
+            merged[positions[item['v']]] = item
+        else:
+            positions[item['v']] = len(merged)
+            merged.append(item)
+    return merged
+
+
+def _parse_layer(path, text):
+    """Parse and validate a layer file."""
+    try:
+        layer = _load_yaml(text, LAYER_KINDS, optional=tuple(LAYER_KINDS))
+    except Exception as error:  # pylint: disable=broad-exception-caught
+        # StrictYAML errors with details about the invalid data
+        raise DatasetError(f'Invalid data file "{path}": {error}') from error
+
+    unknown = set(layer.get('replace', ())) - set(SECTION_KINDS)
+    if unknown:
+        raise DatasetError(f'Unknown sections to replace in "{path}": '
+                           f'{", ".join(sorted(unknown))}')
+    return layer
+
+
+def merge_layers(layers, texts=None):
+    """Merge the given layer files into the package data.
+
+    Layers are paths of the layer files, texts their contents if they have
+    already been read. Returns a dictionary of merged sections.
+    """
+    if texts is None:
+        texts = _read_layers(layers)
+    base = _read_data()
+    data = {name: base[name] for name in base}
+    for path, text in zip(layers, texts):
+        layer = _parse_layer(path, text)
+        replace = set(layer.pop('replace', ()))
+        for name, items in layer.items():
+            if name in replace or name not in data:
+                data[name] = items
+            else:
+                data[name] = _merge_section(SECTION_KINDS[name], data[name],
+                                            items)
+    try:
+        _check_exclusive(data)
+    except ValueError as error:
+        raise DatasetError(str(error)) from error
+    return data
+
+
+def _load_layers(layers):
+    """Load the package data with the given layers, use the cache."""
+    texts = _read_layers(layers)
+    path = os.path.join(cache_dir(), f'{_cache_key(texts)}.bin')
+    try:
+        return read_bundle(path)
+    except (OSError, BundleError):
+        pass
+
+    data = merge_layers(layers, texts)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compile_bundle(data, path)
+    except OSError as error:
+        print(f'WARNING: Could not cache the data set ("{path}"): {error}',
+              file=sys.stderr)
+    return data
+
+
+def layered_data(paths):
+    """Return data provider of the package data with the given layers.
+
+    Paths are the layer YAML files, the last one on top. Providers of the
+    same layers are shared.
+    """
+    layers = tuple(os.path.abspath(path) for path in paths)
+    with _lock:
+        if layers not in _providers:
+            _providers[layers] = DataProvider(lambda: _load_layers(layers))
+        return _providers[layers]
+
+
+def register_dataset(name, paths, base=DEFAULT_DATASET):
+    """Register a data set layering the given YAML files over a base one.
+
+    Paths are the layer YAML files, the last one on top. Registering an
+    already registered name replaces the data set.
+    """
+    for path in paths:
+        if not os.path.isfile(path):
+            raise DatasetError(f'Data file "{path}" does not exist')
+    with _lock:
+        if name == DEFAULT_DATASET:
+            raise DatasetError(f'Data set "{name}" can not be replaced')
+        _registry[name] = dataset_layers(base) + tuple(
+            os.path.abspath(path) for path in paths
+        )
+
+
+def dataset_layers(name):
+    """Return tuple of layer file paths of the given data set."""
+    try:
+        return _registry[name]
+    except KeyError as error:
+        raise DatasetError(f'Unknown data set "{name}"') from error
+
+
+def datasets():
+    """Return list of names of the registered data sets."""
+    return list(_registry)
+
+
+def get_dataset(name=DEFAULT_DATASET):
+    """Return data provider of the given registered data set."""
+    return layered_data(dataset_layers(name))
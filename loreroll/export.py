@@ -0,0 +1,325 @@
+"""Machine-readable export and import of NPCs.
+
+Supported formats:
+
+* text - human-readable text, export only
+* jsonl - one JSON object per line
+* csv - comma separated values with a header, traits are joined by '; '
+* columnar - binary, dictionary-encoded columns (see write_columnar())
+
+Writers stream NPCs from any iterable in chunks of CHUNK_SIZE NPCs, readers
+give the NPCs back without the need to generate them again.
+"""
+
+import csv
+import itertools
+import json
+import struct
+import sys
+from array import array
+
+from loreroll.npc import NPC
+from loreroll.population import FIELDS, Population, TRAIT_FIELDS
+
+
+FORMATS = ('jsonl', 'csv', 'columnar')
+
+# Number of NPCs serialized and written at once.
+CHUNK_SIZE = 65536
+
+CSV_FIELDS = ('name', 'age', 'race', 'class', 'physical', 'personality')
+CSV_HEADER = ','.join(CSV_FIELDS) + '\n'
+TRAIT_SEPARATOR = '; '
+
+COLUMNAR_MAGIC = b'RTLC'
+COLUMNAR_VERSION = 1
+
+_UINT32 = struct.Struct('<I')
+_ARRAY_HEADER = struct.Struct('<cI')
+
+
+class ExportError(Exception):
+    """Raised when exported data can't be read."""
+
+
+def _chunks(iterable, size):
+    """Split the iterable into lists of the given size."""
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def _join_lines(lines, chunk_size):
+    """Join the lines in chunks, yield the joined chunks."""
+    for chunk in _chunks(lines, chunk_size):
+        yield ''.join(chunk)
+
+
+def format_text(npc):
+    """Return the given NPC as human-readable text."""
+    lines = [
+        f'Name: {npc.name}\n',
+        f'Age: {npc.age}\n',
+        f'Race: {npc.race}\n',
+    ]
+    if npc.class_:
+        lines.append(f'Class: {npc.class_}\n')
+    if npc.physical:
+        lines.append(f'Appearance: {", ".join(npc.physical)}\n')
+    if npc.personality:
+        lines.append(f'Personality: {", ".join(npc.personality)}\n')
+    lines.append('\n')
+    return ''.join(lines)
+
+
+def iter_text(npcs, chunk_size=CHUNK_SIZE):
+    """Format the NPCs as human-readable text, yield chunks of text."""
+    return _join_lines(map(format_text, npcs), chunk_size)
+
+
+def npc_to_dict(npc):
+    """Return the NPC as a dictionary."""
+    return {
+        'name': npc.name,
+        'age': npc.age,
+        'race': npc.race,
+        'class': npc.class_,
+        'physical': list(npc.physical),
+        'personality': list(npc.personality),
+    }
+
+
+def npc_from_dict(data):
+    """Create NPC from a dictionary created by npc_to_dict()."""
+    return NPC(
+        name=data['name'],
+        age=data['age'],
+        race=data['race'],
+        class_=data['class'],
+        physical=list(data['physical']),
+        personality=list(data['personality']),
+    )
+
+
+def format_jsonl(npc):
+    """Return the NPC as a JSON line."""
+    return json.dumps(npc_to_dict(npc), ensure_ascii=False) + '\n'
+
+
+def iter_jsonl(npcs, chunk_size=CHUNK_SIZE):
+    """Serialize the NPCs as JSON lines, yield chunks of text."""
+    return _join_lines(map(format_jsonl, npcs), chunk_size)
+
+
+def write_jsonl(npcs, stream, chunk_size=CHUNK_SIZE):
+    """Write the NPCs to a text stream as JSON lines."""
+    stream.writelines(iter_jsonl(npcs, chunk_size))
+
+
+def read_jsonl(stream):
+    """Read NPCs from a text stream of JSON lines, yield them one by one."""
+    for line in stream:
+        if line.strip():
+            yield npc_from_dict(json.loads(line))
+
+
+def _csv_field(value):
+    """Quote the value for CSV if needed."""
+    if any(char in value for char in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def format_csv(npc):
+    """Return the NPC as a CSV line (see CSV_HEADER)."""
+    return ','.join((
+        _csv_field(npc.name),
+        _csv_field(npc.age),
+        _csv_field(npc.race),
+        _csv_field(npc.class_ or ''),
+        _csv_field(TRAIT_SEPARATOR.join(npc.physical)),
+        _csv_field(TRAIT_SEPARATOR.join(npc.personality)),
+    )) + '\n'
+
+
+def iter_csv(npcs, chunk_size=CHUNK_SIZE):
+    """Serialize the NPCs as CSV with a header, yield chunks of text."""
+    yield CSV_HEADER
+    yield from _join_lines(map(format_csv, npcs), chunk_size)
+
+
+def write_csv(npcs, stream, chunk_size=CHUNK_SIZE):
+    """Write the NPCs to a text stream as CSV with a header."""
+    stream.writelines(iter_csv(npcs, chunk_size))
+
+
+# Functions formatting single NPCs for text output formats.
+LINE_FORMATTERS = {
+    'text': format_text,
+    'jsonl': format_jsonl,
+    'csv': format_csv,
+}
+
+
+def _split_traits(traits):
+    """Split traits joined by format_csv()."""
+    return traits.split(TRAIT_SEPARATOR) if traits else []
+
+
+def read_csv(stream):
+    """Read NPCs from a CSV text stream, yield them one by one."""
+    for row in csv.DictReader(stream):
+        yield NPC(
+            name=row['name'],
+            age=row['age'],
+            race=row['race'],
+            class_=row['class'] or None,
+            physical=_split_traits(row['physical']),
+            personality=_split_traits(row['personality']),
+        )
+
+
+def _pack_array(values):
+    """Pack the array with its typecode and size, little-endian."""
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    data = values.tobytes()
+    return _ARRAY_HEADER.pack(values.typecode.encode(), len(data)) + data
+
+
+def _pack_table(values):
+    """Pack the table of strings."""
+    encoded = [value.encode() for value in values]
+    return b''.join(
+        [_UINT32.pack(len(encoded))]
+        + [_UINT32.pack(len(value)) + value for value in encoded]
+    )
+
+
+def iter_columnar(npcs, chunk_size=CHUNK_SIZE):
+    """Serialize the NPCs in the columnar format, yield chunks of bytes.
+
+    The stream starts with a magic and a format version followed by row
+    groups of up to chunk_size NPCs. Each row group starts with the number
+    of NPCs, then for each field (see loreroll.population.FIELDS) it holds
+    the field's dictionary (table of distinct values) and a column of
+    indices into the dictionary. Trait fields also hold a column of end
+    offsets of each NPC's traits. Class index 0 means no class and it's
+    not stored in the class dictionary. All numbers are little-endian,
+    strings are UTF-8.
+    """
+    yield COLUMNAR_MAGIC + struct.pack('<H', COLUMNAR_VERSION)
+    for chunk in _chunks(npcs, chunk_size):
+        population = Population(chunk)
+        parts = [_UINT32.pack(len(population))]
+        for field in FIELDS:
+            table = population.tables[field]
+            if field == 'class_':
+                table = table[1:]
+            parts.append(_pack_table(table))
+            parts.append(_pack_array(population.columns[field]))
+            if field in TRAIT_FIELDS:
+                parts.append(_pack_array(population.ends[field]))
+        yield b''.join(parts)
+
+
+def write_columnar(npcs, stream, chunk_size=CHUNK_SIZE):
+    """Write the NPCs to a binary stream in the columnar format.
+
+    See iter_columnar() for description of the format.
+    """
+    stream.writelines(iter_columnar(npcs, chunk_size))
+
+
+def _read_exactly(stream, size):
+    """Read exactly size bytes from the stream."""
+    data = stream.read(size)
+    if len(data) != size:
+        raise ExportError('Unexpected end of columnar data')
+    return data
+
+
+def _unpack_array(stream):
+    """Read an array packed by _pack_array()."""
+    typecode, size = _ARRAY_HEADER.unpack(
+        _read_exactly(stream, _ARRAY_HEADER.size)
+    )
+    values = array(typecode.decode())
+    values.frombytes(_read_exactly(stream, size))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _unpack_table(stream):
+    """Read a table packed by _pack_table()."""
+    count = _UINT32.unpack(_read_exactly(stream, _UINT32.size))[0]
+    table = []
+    for _ in range(count):
+        size = _UINT32.unpack(_read_exactly(stream, _UINT32.size))[0]
+        table.append(_read_exactly(stream, size).decode())
+    return table
+
+
+def read_columnar(stream):
+    """Read NPCs from a binary stream in the columnar format.
+
+    Returns a Population, the NPCs are never materialized while reading.
+    """
+    header = stream.read(len(COLUMNAR_MAGIC) + 2)
+    if header[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+        raise ExportError('Not a columnar NPC stream')
+    version = struct.unpack('<H', header[len(COLUMNAR_MAGIC):])[0]
+    if version != COLUMNAR_VERSION:
+        raise ExportError(f'Unsupported columnar format version {version}')
+
+    population = Population()
+    while rows := stream.read(_UINT32.size):
+        if len(rows) != _UINT32.size:
+            raise ExportError('Unexpected end of columnar data')
+        tables, columns, ends = {}, {}, {}
+        for field in FIELDS:
+            tables[field] = _unpack_table(stream)
+            columns[field] = _unpack_array(stream)
+            if field in TRAIT_FIELDS:
+                ends[field] = _unpack_array(stream)
+        tables['class_'].insert(0, None)
+        population.extend_columns(tables, columns, ends)
+    return population
+
+
+def iter_serialized(npcs, format_, chunk_size=CHUNK_SIZE):
+    """Serialize the NPCs in the given format (see FORMATS) or as text.
+
+    Yields chunks of bytes for the columnar format and chunks of text for
+    the others.
+    """
+    serializers = {
+        'text': iter_text,
+        'jsonl': iter_jsonl,
+        'csv': iter_csv,
+        'columnar': iter_columnar,
+    }
+    return serializers[format_](npcs, chunk_size)
+
+
+def write_npcs(npcs, stream, format_, chunk_size=CHUNK_SIZE):
+    """Write the NPCs to the stream in the given format (see FORMATS).
+
+    The columnar format requires a binary stream, the others a text one.
+    """
+    stream.writelines(iter_serialized(npcs, format_, chunk_size))
+
+
+def read_npcs(stream, format_):
+    """Read NPCs written by write_npcs() in the given format.
+
+    Returns an iterable of NPCs (or NPC views for the columnar format).
+    """
+    readers = {
+        'jsonl': read_jsonl,
+        'csv': read_csv,
+        'columnar': read_columnar,
+    }
+    return readers[format_](stream)
@@ -0,0 +1,131 @@
+"""Fast parser of the YAML NPC data.
+
+StrictYAML parses and validates the NPC data in seconds. The data only use
+a narrow subset of YAML though - top-level sections holding sequences of
+strings, sequences of {v, w} mappings or sequences of sequences of strings -
+which this module parses line by line in a few milliseconds.
+
+The parser is deliberately strict: anything it doesn't fully understand or
+anything the schema wouldn't allow raises FastYAMLError. Callers are
+expected to parse such input with StrictYAML which either gives the same
+data or a detailed error message.
+"""
+
+import re
+
+
+KIND_STRINGS = 'strings'
+KIND_WEIGHTED = 'weighted'
+KIND_GROUPS = 'groups'
+
+_SECTION = re.compile(r'([A-Za-z_]\w*):[ ]*$')
+_NUMBER = re.compile(r'[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$')
+# Characters that have a special meaning at the start of a plain scalar.
+_INDICATORS = frozenset('-?:,[]{}#&*!|>\'"%@`~')
+
+
+class FastYAMLError(Exception):
+    """Raised for input the fast parser can't (or won't) parse."""
+
+
+def _plain_scalar(text, line):
+    """Parse a plain (unquoted) scalar, cut off any trailing comment."""
+    comment = text.find(' #')
+    if comment >= 0:
+        text = text[:comment]
+    text = text.strip(' ')
+    if (not text or text[0] in _INDICATORS or ': ' in text
+            or text.endswith(':') or '\t' in text):
+        raise FastYAMLError(f'Unsupported scalar on line {line}')
+    return text
+
+
+def _single_quoted_scalar(text, line):
+    """Parse a single-quoted scalar."""
+    end = 1
+    while True:
+        end = text.find("'", end)
+        if end < 0:
+            raise FastYAMLError(f'Unterminated string on line {line}')
+        if text[end + 1:end + 2] != "'":
+            break
+        end += 2
+    rest = text[end + 1:].strip(' ')
+    if rest and not rest.startswith('#'):
+        raise FastYAMLError(f'Unexpected characters on line {line}')
+    return text[1:end].replace("''", "'")
+
+
+def _scalar(text, line):
+    """Parse a scalar value."""
+    text = text.lstrip(' ')
+    if text.startswith("'"):
+        return _single_quoted_scalar(text, line)
+    return _plain_scalar(text, line)
+
+
+def _number(text, line):
+    """Parse a number (the w key of weighted items)."""
+    value = _plain_scalar(text, line)
+    if _NUMBER.match(value) is None:
+        raise FastYAMLError(f'Unsupported number on line {line}')
+    return float(value)
+
+
+def _parse_items(lines, kind):
+    """Parse items of a section, lines are (line number, text) tuples."""
+    items = []
+    lines = iter(lines)
+    for number, text in lines:
+        if kind == KIND_STRINGS and text.startswith('- '):
+            items.append(_scalar(text[2:], number))
+        elif kind == KIND_WEIGHTED and text.startswith('- v: '):
+            value = _scalar(text[5:], number)
+            number, text = next(lines, (number, ''))
+            if not text.startswith('  w: '):
+                raise FastYAMLError(f'Expected weight on line {number}')
+            items.append({'v': value, 'w': _number(text[5:], number)})
+        elif kind == KIND_GROUPS and text.startswith('- - '):
+            items.append([_scalar(text[4:], number)])
+        elif kind == KIND_GROUPS and text.startswith('  - ') and items:
+            items[-1].append(_scalar(text[4:], number))
+        else:
+            raise FastYAMLError(f'Unexpected content on line {number}')
+    if not items:
+        raise FastYAMLError('Empty section')
+    return items
+
+
+def parse(text, kinds, optional=()):
+    """Parse and validate the YAML NPC data.
+
+    Kinds map the section names to their kinds (KIND_STRINGS,
+    KIND_WEIGHTED or KIND_GROUPS), all the sections are required except
+    for the optional ones. Returns a dictionary with the same data
+    StrictYAML would give, raises FastYAMLError otherwise.
+    """
+    sections = {}
+    name = None
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip(' ') or line.lstrip(' ').startswith('#'):
+            continue
+        match = _SECTION.match(line)
+        if match is not None:
+            name = match.group(1)
+            if name not in kinds or name in sections:
+                raise FastYAMLError(
+                    f'Unknown or duplicate section on line {number}'
+                )
+            sections[name] = []
+        elif name is None:
+            raise FastYAMLError(f'Unexpected content on line {number}')
+        else:
+            sections[name].append((number, line))
+
+    missing = set(kinds) - set(optional) - set(sections)
+    if missing:
+        raise FastYAMLError(f'Missing sections: {", ".join(sorted(missing))}')
+    return {
+        name: _parse_items(lines, kinds[name])
+        for name, lines in sections.items()
+    }
@@ -1,12 +1,19 @@
 """Module for generating NPCs."""
 
-import hashlib
-import json
+import functools
+import itertools
 import os
 import random
+import re
+import sys
+import threading
 from collections import namedtuple
+from collections.abc import Mapping
 
-from strictyaml import Float, load, Map, Seq, Str
+from loreroll import fastyaml, profiling
+from loreroll.bundle import BundleError, read_bundle
+from loreroll.rng import indexed_seeds
+from loreroll.sampling import AliasSampler, TraitSampler, WeightedSampler
 
 
 NPC = namedtuple(
@@ -20,87 +27,392 @@ NPC = namedtuple(
     ]
 )
 
+ENGINES = ('python', 'numpy')
+# Number of NPCs generated at once by the numpy engine.
+ITER_CHUNK_SIZE = 65536
+# Number of names generated at once by iter_name_chunks().
+NAME_CHUNK_SIZE = 65536
+# NPC fields holding a list of traits.
+TRAIT_SECTIONS = ('physical', 'personality')
+# Sections of the NPC data and the kinds of their items.
+SECTION_KINDS = {
+    'races': fastyaml.KIND_WEIGHTED,
+    'classes': fastyaml.KIND_STRINGS,
+    'age': fastyaml.KIND_WEIGHTED,
+    'physical': fastyaml.KIND_STRINGS,
+    'personality': fastyaml.KIND_STRINGS,
+    'physical_exclusive': fastyaml.KIND_GROUPS,
+    'personality_exclusive': fastyaml.KIND_GROUPS,
+    'names': fastyaml.KIND_STRINGS,
+}
+# Sections the NPC data don't need to contain.
+OPTIONAL_SECTIONS = ('physical_exclusive', 'personality_exclusive')
+# Sections the prepared samplers depend on.
+PREPARED_SECTIONS = ('age', 'classes', 'races')
+TRAIT_SAMPLER_SECTIONS = TRAIT_SECTIONS + OPTIONAL_SECTIONS
+# Number of filter combinations to keep prepared data for.
+PREPARED_CACHE_SIZE = 128
+# Quota filters mapped to the NPC fields and data sections they apply to.
+QUOTA_FILTERS = {
+    'ages_quota': ('age', 'age'),
+    'classes_quota': ('class_', 'classes'),
+    'races_quota': ('race', 'races'),
+}
+
 NPC_FILENAME = os.path.join(os.path.dirname(__file__), 'data/npc.yaml')
-NPC_JSON_FILENAME = os.path.join(os.path.dirname(__file__), 'data/npc.json')
+NPC_BUNDLE_FILENAME = os.path.join(os.path.dirname(__file__), 'data/npc.bin')
+
+
+def _section_schemas(kinds):
+    """Return StrictYAML schemas of sections of the given kinds.
+
+    Kinds map section names to kinds of their items, see SECTION_KINDS.
+
+    StrictYAML is imported here rather than at module level as it's only
+    needed when the YAML data can't be parsed by the fast parser (see
+    _load_yaml()) and importing it takes a considerable part of the startup
+    time.
+    """
+    # pylint: disable=import-outside-toplevel
+    from strictyaml import Float, Map, Seq, Str
+
+    schemas = {
+        fastyaml.KIND_STRINGS: lambda: Seq(Str()),
+        fastyaml.KIND_WEIGHTED: lambda: Seq(Map({'v': Str(), 'w': Float()})),
+        fastyaml.KIND_GROUPS: lambda: Seq(Seq(Str())),
+    }
+    return {name: schemas[kind]() for name, kind in kinds.items()}
+
+
+def _strict_schema(kinds, optional=()):
+    """Return StrictYAML schema of the given kinds of sections.
+
+    All the sections are required except for the optional ones.
+    """
+    # pylint: disable=import-outside-toplevel
+    from strictyaml import Map, Optional
+
+    return Map({
+        Optional(name) if name in optional else name: schema
+        for name, schema in _section_schemas(kinds).items()
+    })
+
+
+def _check_exclusive(data, sections=TRAIT_SECTIONS):
+    """Check groups of mutually exclusive traits of the given sections.
+
+    The groups may only contain known traits, each of them in at most one
+    group. ValueError is raised if they don't.
+    """
+    for section in sections:
+        groups = data.get(f'{section}_exclusive', [])
+        unknown = {trait for group in groups for trait in group}
+        unknown.difference_update(data[section])
+        if unknown:
+            raise ValueError(f'Unknown traits in {section}_exclusive: '
+                             f'{", ".join(sorted(unknown))}')
+        # Raises ValueError for traits in more than one group.
+        TraitSampler(data[section], groups)
+
+
+def _load_yaml(text, kinds, optional=()):
+    """Parse and validate YAML text holding the given kinds of sections.
+
+    The fast parser (see loreroll.fastyaml) is tried first. StrictYAML is
+    only used if the fast parser refuses the text - mostly to give detailed
+    error messages about invalid data.
+    """
+    try:
+        return fastyaml.parse(text, kinds, optional)
+    except fastyaml.FastYAMLError:
+        pass
+
+    # pylint: disable=import-outside-toplevel
+    from strictyaml import load
+
+    return load(text, _strict_schema(kinds, optional)).data
+
+
+def _parse_yaml(yaml_filename):
+    """Parse and validate the YAML NPC data.
+
+    Besides the schema, the groups of mutually exclusive traits are checked
+    (see _check_exclusive()).
+    """
+    with open(yaml_filename, 'r', encoding='utf-8') as yaml_datafile:
+        data = _load_yaml(yaml_datafile.read(), SECTION_KINDS,
+                          OPTIONAL_SECTIONS)
+
+    _check_exclusive(data)
+    return data
 
-NPC_SCHEMA = Map({
-    'races': Seq(Map({'v': Str(), 'w': Float()})),
-    'classes': Seq(Str()),
-    'age': Seq(Map({'v': Str(), 'w': Float()})),
-    'physical': Seq(Str()),
-    'personality': Seq(Str()),
-    'names': Seq(Str()),
-})
+
+def _split_yaml(text):
+    """Split the YAML NPC data into top-level sections.
+
+    Returns a dictionary mapping section names to (line, text) tuples
+    where line is the number of lines preceding the section in the file.
+    Comments and blank lines belong to the preceding section. The text
+    isn't validated in any way.
+    """
+    sections = {}
+    name, start, lines = None, 0, text.splitlines(keepends=True)
+    for number, line in enumerate(lines + ['end:']):
+        match = re.match(r'([A-Za-z_]\w*):\s*$', line)
+        if match is None:
+            continue
+        if name is not None:
+            sections[name] = (start, ''.join(lines[start:number]))
+        name, start = match.group(1), number
+    return sections
+
+
+def _parse_yaml_sections(sections):
+    """Parse and validate the given sections of the YAML NPC data.
+
+    Sections is a dictionary returned by _split_yaml() (or its part), each
+    section is parsed on its own. Error messages refer to the same line
+    numbers as when the whole file is parsed.
+    """
+    data = {}
+    for name, (line, text) in sections.items():
+        if name not in SECTION_KINDS:
+            raise ValueError(f'Unknown NPC data section "{name}"')
+        data[name] = _load_yaml('\n' * line + text,
+                                {name: SECTION_KINDS[name]})[name]
+    return data
 
 
 def _read_data():
     """Read NPC data.
 
-    Parsing StrictYAML turned out to be really slow -> The function attempts
-    to read the pre-parsed JSON version. If that fails or if it has been
-    generated for a different YAML data version, read the source YAML and try
-    and store the data in JSON format for future runs.
+    Parsing StrictYAML turned out to be really slow -> The function reads
+    the pre-compiled binary bundle (see loreroll.bundle) which is built ahead
+    of time with `loreroll compile-data`. The bundle is memory-mapped and its
+    sections are only decoded when accessed.
 
-    Note that this approach could theoretically cause trouble if the user
-    didn't have write permission to the JSON file but if the appropriate JSON
-    data is shipped along with YAML source data, this shouldn't be an issue.
-    JSON will only be regenerated if YAML changes and if user can modify YAML,
-    write permission to JSON should be available as well since these two are in
-    the same directory. And even if that somehow isn't true, the consequence is
-    "only" a performance drop.
+    The YAML file is not even read when the bundle is up to date - that is
+    when the file has the size the bundle was compiled from and it hasn't
+    been modified after the bundle (see Bundle.is_compiled_from()). If the
+    bundle is missing or out of date, the source YAML is parsed instead (see
+    _load_yaml()). `loreroll verify-data` compares the checksum of the YAML
+    data the bundle remembers.
 
-    Still there probably is a better solution - see github issue #53:
+    Nothing is ever written at runtime so the package directory may be
+    read-only; the consequence of a stale bundle is "only" a performance
+    drop.
+
+    See also github issue #53:
     https://github.com/geckon/rollthelore/issues/53
     """
-    def _handle_caching_error(operation, error):
-        """Print just a warning.
+    with profiling.stage('load data'):
+        try:
+            bundle = read_bundle(NPC_BUNDLE_FILENAME)
+            if bundle.is_compiled_from(NPC_FILENAME):
+                profiling.note('data source', 'bundle')
+                return bundle
+            reason = 'it is out of date, run `loreroll compile-data`'
+        except (OSError, BundleError) as error:
+            reason = error
 
-        This is "caching" and we want to continue in any case."""
         print(
-            f'WARNING: Could not {operation} the cache JSON file '
-            f'("{NPC_JSON_FILENAME}"): {error}'
+            f'WARNING: Could not use the data bundle '
+            f'("{NPC_BUNDLE_FILENAME}"): {reason}',
+            file=sys.stderr
         )
+        profiling.note('data source', f'YAML (bundle not used: {reason})')
+        return _parse_yaml(NPC_FILENAME)
 
-    with open(NPC_FILENAME, 'r') as yaml_datafile:
-        yaml_data = yaml_datafile.read()
-        yaml_data_checksum = hashlib.sha512(yaml_data.encode()).hexdigest()
 
-        # Try to read NPC_JSON_FILENAME ("cached"  version).
-        try:
-            with open(NPC_JSON_FILENAME, 'r') as json_datafile:
-                npc_data = json.load(json_datafile)
-                checksum = npc_data.pop('yaml_datafile_checksum')
-                if checksum == yaml_data_checksum:
-                    return npc_data
-        except Exception as error:
-            _handle_caching_error('read', error)
-
-        # At this point we indeed need to parse the YAML data. Let's do so and
-        # try and store the parsed data into a JSON file for future runs.
-        npc_data = load(yaml_data, NPC_SCHEMA).data
-        try:
-            npc_data['yaml_datafile_checksum'] = yaml_data_checksum
-            with open(NPC_JSON_FILENAME, 'w') as json_datafile:
-                json.dump(npc_data, json_datafile)
-        except Exception as error:
-            _handle_caching_error('store', error)
-        return npc_data
+class DataProvider(Mapping):  # pylint: disable=too-many-instance-attributes
+    """Lazily loaded NPC data.
 
+    Nothing is read until the data are needed for the first time, then the
+    data source is opened and each section (names, races, ...) is loaded on
+    its first access. The provider is thread-safe.
 
-NPC_DATA = _read_data()
+    Tests and applications embedding RollTheLore may inject their own data
+    set with set_data() or replace only some sections with update().
 
+    Version is increased every time the data change, section_version()
+    only changes when the given sections change. Anything derived from the
+    data may subscribe() to be notified about the changes.
 
-def _weighted_random(data_set):
+    Providers are compared by identity so that they can be used as cache
+    keys.
+    """
+
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __init__(self, loader=_read_data):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._source = None
+        self._overrides = {}
+        self._sections = {}
+        self._callbacks = []
+        self._section_versions = {}
+        self._reset_version = 0
+        self.version = 0
+
+    def _get_source(self):
+        """Return the data source, load it if needed.
+
+        Must be called with the lock held.
+        """
+        if self._source is None:
+            self._source = self._loader()
+        return self._source
+
+    def __getitem__(self, name):
+        try:
+            return self._sections[name]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if name not in self._sections:
+                self._sections[name] = self._get_source()[name]
+            return self._sections[name]
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(dict.fromkeys(
+                itertools.chain(self._get_source(), self._overrides)
+            )))
+
+    def __len__(self):
+        with self._lock:
+            return len(set(self._get_source()) | set(self._overrides))
+
+    def load(self):
+        """Load the data source now, e.g. to find out about errors early.
+
+        Returns the provider itself.
+        """
+        with self._lock:
+            self._get_source()
+        return self
+
+    def subscribe(self, callback, sections=None):
+        """Call the given callback (without arguments) on data changes.
+
+        If sections are given, the callback is only called when any of the
+        given sections change.
+        """
+        self._callbacks.append(
+            (callback, None if sections is None else frozenset(sections))
+        )
+
+    def section_version(self, *names):
+        """Return version of the given sections.
+
+        The version changes whenever any of the sections change so it can
+        be used as a cache key of data derived from the sections.
+        """
+        return max(
+            [self._reset_version]
+            + [self._section_versions.get(name, 0) for name in names]
+        )
+
+    def set_data(self, data):
+        """Use the given mapping of sections as NPC data."""
+        with self._lock:
+            self._source = data
+            self._overrides = {}
+            self._sections = {}
+            self.version += 1
+            self._reset_version = self.version
+            self._section_versions = {}
+        for callback, _ in self._callbacks:
+            callback()
+
+    def update(self, sections):
+        """Replace the given sections of the NPC data, keep the others.
+
+        Sections is a mapping of section names to their new data. All the
+        sections are replaced at once. Only callbacks subscribed to any of
+        the replaced sections (or to all changes) are called.
+        """
+        with self._lock:
+            self._overrides = {**self._overrides, **sections}
+            self._sections = {**self._sections, **sections}
+            self.version += 1
+            self._section_versions = {
+                **self._section_versions,
+                **dict.fromkeys(sections, self.version),
+            }
+        for callback, subscribed in self._callbacks:
+            if subscribed is None or not subscribed.isdisjoint(sections):
+                callback()
+
+    def reset(self):
+        """Forget loaded or injected data, load them again when needed."""
+        self.set_data(None)
+
+
+NPC_DATA = DataProvider()
+
+
+def _get_data(data):
+    """Return the given data provider or NPC_DATA if None."""
+    return NPC_DATA if data is None else data
+
+
+def _weighted_random(data_set, rng=None):
     """Returns a weighted random option from data_set.
 
     The data_set needs to be a sequence of dict-like objects with at
     least 'v' (value) and 'w' (weight) keys. Weights need to be
     convertible to float.
+
+    Use WeightedSampler directly when drawing from the same data_set
+    repeatedly.
+    """
+    return WeightedSampler(data_set).sample(_get_rng(rng))
+
+
+def _get_rng(rng):
+    """Return the given random generator or the random module if None."""
+    return random if rng is None else rng
+
+
+def _as_sampler(data_set):
+    """Return a weighted sampler for the given data set.
+
+    Samplers are returned unchanged so that they can be prepared once and
+    then shared.
+    """
+    if isinstance(data_set, (WeightedSampler, AliasSampler)):
+        return data_set
+    return WeightedSampler(data_set)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_filter(allowed, disallowed):
+    """Compile the given filters into a predicate.
+
+    The allowed and disallowed need to be tuples of strings. The returned
+    function takes a string value and returns True if the value contains
+    any of the allowed strings (or allowed is empty) and none of the
+    disallowed strings.
+
+    Each of the filters is compiled into a single regular expression so
+    a value is checked in one pass regardless of the number of terms.
+    Compiled filters are cached.
     """
-    return random.choices(
-        [x['v'] for x in data_set],
-        [float(x['w']) for x in data_set]
-    )[0]
+    def _compile(terms):
+        return re.compile('|'.join(map(re.escape, terms))).search
+
+    allowed_search = _compile(allowed) if allowed else None
+    disallowed_search = _compile(disallowed) if disallowed else None
+
+    def matches(value):
+        if allowed_search is not None and allowed_search(value) is None:
+            return False
+        return disallowed_search is None or disallowed_search(value) is None
+    return matches
 
 
 def _filter_string_data(data_set, allowed=(), disallowed=()):
@@ -112,7 +424,8 @@ def _filter_string_data(data_set, allowed=(), disallowed=()):
 
     A data_set item will be a part of the result only if its value
     contains any of the allowed values as a substring unless it also
-    contains any of the disallowed values as a substring.
+    contains any of the disallowed values as a substring. Each item is
+    included at most once and the order of items is kept.
 
     If allowed sequence is not provided, all items in data_set are
     allowed. If disallowed sequence is not provided, no items are
@@ -121,17 +434,8 @@ def _filter_string_data(data_set, allowed=(), disallowed=()):
     if not allowed and not disallowed:
         return data_set
 
-    if allowed:
-        filtered = []
-        for item in allowed:
-            filtered += [x for x in data_set if item in x]
-    else:
-        filtered = data_set
-
-    if disallowed:
-        for item in disallowed:
-            filtered = [x for x in filtered if item not in x]
-    return filtered
+    matches = _compile_filter(tuple(allowed or ()), tuple(disallowed or ()))
+    return [x for x in data_set if matches(x)]
 
 
 def _filter_structured_data(data_set, allowed=None, disallowed=None):
@@ -144,7 +448,8 @@ def _filter_structured_data(data_set, allowed=None, disallowed=None):
 
     A data_set item will be a part of the result only if its value
     contains any of the allowed values as a substring unless it also
-    contains any of the disallowed values as a substring.
+    contains any of the disallowed values as a substring. Each item is
+    included at most once and the order of items is kept.
 
     If allowed sequence is not provided, all items in data_set are
     allowed. If disallowed sequence is not provided, no items are
@@ -153,49 +458,119 @@ def _filter_structured_data(data_set, allowed=None, disallowed=None):
     if not allowed and not disallowed:
         return data_set
 
-    if allowed:
-        filtered = []
-        for item in allowed:
-            filtered += [x for x in data_set if item in x['v']]
-    else:
-        filtered = data_set
+    matches = _compile_filter(tuple(allowed or ()), tuple(disallowed or ()))
+    return [x for x in data_set if matches(x['v'])]
+
+
+def generate_name(rng=None, data=None):
+    """Generate a random NPC name.
+
+    See generate_npc() for the rng and data parameters.
+    """
+    names = _get_data(data)['names']
+    return str(_get_rng(rng).choice(names))  # nosec
+
+
+def iter_name_chunks(number=1, unique=False, rng=None, data=None):
+    """Generate random NPC names in lists of up to NAME_CHUNK_SIZE names.
 
-    if disallowed:
-        for item in disallowed:
-            filtered = [x for x in filtered if item not in x['v']]
-    return filtered
+    All the names of a chunk are drawn at once which is much faster than
+    calling generate_name() repeatedly. If number is None, names are
+    generated endlessly.
 
+    If unique is True, no name is repeated until all the names have been
+    used - the names are drawn from random permutations of the whole name
+    pool, one permutation after another.
 
-def generate_name():
-    return str(random.choice(NPC_DATA['names']))  # nosec
+    See generate_npc() for the rng and data parameters.
+    """
+    rng = _get_rng(rng)
+    names = [str(name) for name in _get_data(data)['names']]
+    if unique:
+        names = list(dict.fromkeys(names))
+    permutation, position = [], 0
+
+    remaining = number
+    while remaining is None or remaining > 0:
+        size = NAME_CHUNK_SIZE
+        if remaining is not None:
+            size = min(size, remaining)
+            remaining -= size
+        if not unique:
+            yield rng.choices(names, k=size)  # nosec
+            continue
+
+        chunk = []
+        while len(chunk) < size:
+            if position == len(permutation):
+                permutation, position = rng.sample(names, len(names)), 0
+                if not permutation:
+                    raise IndexError('Cannot choose from an empty sequence')
+            end = min(position + size - len(chunk), len(permutation))
+            chunk.extend(permutation[position:end])
+            position = end
+        yield chunk
+
+
+def generate_names(number=1, unique=False, rng=None, data=None):
+    """Generate a list of random NPC names.
+
+    See iter_name_chunks() for the parameters, use it to generate large
+    numbers of names with constant memory use.
+    """
+    return list(itertools.chain.from_iterable(
+        iter_name_chunks(number, unique, rng, data)
+    ))
 
 
-def generate_npc(traits, ages=None, classes=None, races=None):
+def generate_npc(traits, ages=None, classes=None, races=None, rng=None,
+                 data=None):
     """Generate an NPC.
 
     Traits parameter determines how many physical and personality traits
-    will be generated.
+    will be generated. Traits are never repeated and at most one trait of
+    each group of mutually exclusive traits (see physical_exclusive and
+    personality_exclusive in the NPC data) is generated so fewer traits
+    may be generated if there aren't enough of them.
+
+    Rng is the random generator to use, typically a random.Random
+    instance. Each thread or task should use its own instance to generate
+    NPCs independently and reproducibly. If None, the global random
+    module is used.
 
     Ages, classes and races are supposed to be sequences of allowed
-    ages/classes/races. If None is passed instead of any of these,
+    ages/classes/races. Ages and races may also be weighted samplers
+    prepared beforehand (see loreroll.sampling) which is much faster when
+    generating many NPCs, classes may be a weighted sampler to draw classes
+    with different weights. If None is passed instead of ages or races,
     the default set of traits will be used.
-    """
-    age = str(_weighted_random(ages))
 
-    if classes:
-        class_ = str(random.choice(classes))  # nosec
+    Data is the DataProvider to take the NPC data from, NPC_DATA if None
+    (see loreroll.datasets for other data sets).
+    """
+    rng = _get_rng(rng)
+    data = _get_data(data)
+    if ages is None:
+        ages = data['age']
+    if races is None:
+        races = data['races']
+
+    age = str(_as_sampler(ages).sample(rng))
+
+    if isinstance(classes, (WeightedSampler, AliasSampler)):
+        class_ = str(classes.sample(rng))
+    elif classes:
+        class_ = str(rng.choice(classes))  # nosec
     else:
         class_ = None
 
-    name = generate_name()
-
-    race = str(_weighted_random(races))
+    name = generate_name(rng, data)
 
-    physical = random.choices(NPC_DATA['physical'], k=traits)
-    physical = [str(trait) for trait in physical]
+    race = str(_as_sampler(races).sample(rng))
 
-    personality = random.choices(NPC_DATA['personality'], k=traits)
-    personality = [str(trait) for trait in personality]
+    physical_traits, personality_traits = _trait_samplers(data)
+    physical = physical_traits.sample(traits, rng)
+    personality = personality_traits.sample(traits, rng)
 
     return NPC(
         name=name,
@@ -207,43 +582,381 @@ def generate_npc(traits, ages=None, classes=None, races=None):
     )
 
 
-def generate_npcs(number=1, traits=2, filters=None,
-                  generate_adventurers=True):
+@functools.lru_cache(maxsize=8)
+def _prepare_traits(data, data_version):
+    """Prepare samplers of physical and personality traits.
+
+    Groups of mutually exclusive traits are compiled only once per data
+    provider and version (see _prepare_cached()), use _trait_samplers().
+    """
+    # pylint: disable=unused-argument
+    return tuple(
+        TraitSampler([str(trait) for trait in data[section]],
+                     data.get(f'{section}_exclusive', ()))
+        for section in TRAIT_SECTIONS
+    )
+
+
+NPC_DATA.subscribe(_prepare_traits.cache_clear, TRAIT_SAMPLER_SECTIONS)
+
+
+def _trait_samplers(data=None):
+    """Return samplers of physical and personality traits."""
+    data = _get_data(data)
+    return _prepare_traits(data,
+                           data.section_version(*TRAIT_SAMPLER_SECTIONS))
+
+
+def _use_numpy(engine):
+    """Check the engine, return True if the numpy engine should be used."""
+    if engine not in ENGINES:
+        raise ValueError(f'Unknown engine "{engine}", use one of {ENGINES}')
+    if engine != 'numpy':
+        return False
+
+    # pylint: disable=import-outside-toplevel
+    from loreroll import vectorized
+
+    if vectorized.available():
+        return True
+    print('WARNING: NumPy is not installed, falling back to the python '
+          'engine.', file=sys.stderr)
+    return False
+
+
+def _normalize_filters(filters):
+    """Return a canonical hashable form of the given filters.
+
+    Neither the order nor duplicates of the filter values affect the
+    filtered data so they are sorted and deduplicated. Empty filters and
+    quotas (which don't affect the prepared data) are left out.
+    """
+    if not filters:
+        return ()
+    return tuple(sorted(
+        (key, tuple(sorted(set(values))))
+        for key, values in filters.items()
+        if values and key not in QUOTA_FILTERS
+    ))
+
+
+@functools.lru_cache(maxsize=PREPARED_CACHE_SIZE)
+def _prepare_cached(data, data_version, filters_key, generate_adventurers):
+    """Filter the data and prepare samplers for generating NPCs.
+
+    The data_version is not used directly, it only makes sure data prepared
+    from different data versions are cached separately.
+    """
+    # pylint: disable=unused-argument
+    filters = dict(filters_key)
+
+    with profiling.stage('filter'):
+        ages = _filter_structured_data(data['age'], filters.get('ages_yes'),
+                                       filters.get('ages_no'))
+
+        # classes are only generated for adventurers
+        if generate_adventurers:
+            classes = _filter_string_data(data['classes'],
+                                          filters.get('classes_yes'),
+                                          filters.get('classes_no'))
+        else:
+            classes = []
+
+        races = _filter_structured_data(data['races'],
+                                        filters.get('races_yes'),
+                                        filters.get('races_no'))
+
+    if profiling.active() is not None:
+        for section, filtered in (('age', ages), ('classes', classes),
+                                  ('races', races)):
+            profiling.note(f'filter {section}',
+                           f'{len(filtered)} of {len(data[section])} passed')
+    return WeightedSampler(ages), classes, WeightedSampler(races)
+
+
+NPC_DATA.subscribe(_prepare_cached.cache_clear, PREPARED_SECTIONS)
+
+
+def prepared_cache_info():
+    """Return statistics of the prepared data cache.
+
+    The result is a named tuple with hits, misses, maxsize and currsize
+    as returned by functools.lru_cache.
+    """
+    # pylint: disable=no-value-for-parameter
+    return _prepare_cached.cache_info()
+
+
+def _prepare_data(filters, generate_adventurers, data=None):
+    """Return filtered data and samplers for generating NPCs.
+
+    Returns a tuple of (ages, classes, races) suitable for generate_npc().
+    The results are cached for the PREPARED_CACHE_SIZE most recently used
+    combinations of data providers, filters and generate_adventurers, the
+    cache is cleared whenever any of PREPARED_SECTIONS of NPC_DATA change
+    (other providers are cached per version of the sections).
+    """
+    data = _get_data(data)
+    key = (data, data.section_version(*PREPARED_SECTIONS),
+           _normalize_filters(filters), bool(generate_adventurers))
+    if profiling.active() is None:
+        return _prepare_cached(*key)
+
+    misses = prepared_cache_info().misses
+    prepared = _prepare_cached(*key)
+    if prepared_cache_info().misses == misses:
+        profiling.count('prepared cache hits')
+    else:
+        profiling.count('prepared cache misses')
+    return prepared
+
+
+def _allocate_quota(number, shares):
+    """Return exact numbers of NPCs for the given shares of the number.
+
+    Shares are fractions of the number. Numbers are rounded by the largest
+    remainder method so that they add up to the rounded total share.
+    """
+    if any(not 0 <= share <= 1 for share in shares):
+        raise ValueError('Quota shares must be between 0 and 1')
+    if sum(shares) > 1 + 1e-9:
+        raise ValueError('Quota shares must not add up to more than 100 %')
+    exact = [number * share for share in shares]
+    counts = [int(value) for value in exact]
+    missing = min(round(sum(exact)), number) - sum(counts)
+    by_remainder = sorted(range(len(exact)),
+                          key=lambda index: counts[index] - exact[index])
+    for index in by_remainder[:missing]:
+        counts[index] += 1
+    return counts
+
+
+def _iter_quota(number, quota, rest, rng):
+    """Yield values with the given quota in a random order.
+
+    Quota maps values to their shares of the number of values, the rest is
+    drawn from the rest weighted sampler (or sequence). Values are drawn
+    without replacement from the allocated counts so any prefix of the values
+    is a random sample and the whole sequence has the exact counts.
+    """
+    values = list(quota)
+    remaining = _allocate_quota(number, list(quota.values()))
+    remaining.append(number - sum(remaining))
+    if remaining[-1] and not rest:
+        raise ValueError('No values left for the rest of the quota')
+    total = number
+    while total:
+        pick, index = rng.randrange(total), 0
+        while pick >= remaining[index]:
+            pick -= remaining[index]
+            index += 1
+        remaining[index] -= 1
+        total -= 1
+        if index < len(values):
+            yield values[index]
+        elif isinstance(rest, (WeightedSampler, AliasSampler)):
+            yield str(rest.sample(rng))
+        else:
+            yield str(rng.choice(rest))  # nosec
+
+
+def _quota_rest(data, key, quota, filters):
+    """Return sampler (or sequence) of values not in the quota.
+
+    Only values passing the filters are returned. Values of the quota need
+    to pass them too, ValueError is raised otherwise.
+    """
+    name = key[:-len('_quota')]
+    section = QUOTA_FILTERS[key][1]
+    allowed, disallowed = filters.get(f'{name}_yes'), filters.get(f'{name}_no')
+    if section == 'classes':
+        passed = _filter_string_data(data[section], allowed, disallowed)
+        known = set(passed)
+        rest = [value for value in passed if value not in quota]
+    else:
+        passed = _filter_structured_data(data[section], allowed, disallowed)
+        known = {item['v'] for item in passed}
+        rest = WeightedSampler(
+            [item for item in passed if item['v'] not in quota]
+        )
+    unknown = set(quota) - known
+    if unknown:
+        raise ValueError(f'Unknown or filtered out values in {key}: '
+                         f'{", ".join(sorted(unknown))}')
+    return rest
+
+
+def _quota_values(number, filters, generate_adventurers, rng, data):
+    """Return iterators of values of NPC fields with quotas.
+
+    Returns a dictionary mapping NPC fields to iterators of their values.
+    Quota values need to be in the data and pass the other filters, the
+    rest is drawn from the other values passing the filters.
+    """
+    data = _get_data(data)
+    iterators = {}
+    for key, (field, _) in QUOTA_FILTERS.items():
+        quota = filters.get(key)
+        if not quota:
+            continue
+        if field == 'class_' and not generate_adventurers:
+            raise ValueError('Class quotas can only be used for adventurers')
+        if number is None:
+            raise ValueError('Quotas need a number of NPCs')
+        rest = _quota_rest(data, key, quota, filters)
+        iterators[field] = _iter_quota(number, quota, rest, rng)
+    return iterators
+
+
+def _has_quotas(filters):
+    """Check whether the filters contain any quotas."""
+    return bool(filters) and any(filters.get(key) for key in QUOTA_FILTERS)
+
+
+def _iter_quota_npcs(number, traits, samplers, filters, generate_adventurers,
+                     rng, data):
+    """Generate NPCs one by one with the quotas of the filters.
+
+    The samplers are ages, classes and races as returned by _prepare_data()
+    for the filters.
+    """
+    ages, classes, races = samplers
+    quotas = _quota_values(number, filters, generate_adventurers, rng, data)
+    yield from profiling.timed('generate', (
+        generate_npc(traits, ages, classes, races, rng, data)._replace(
+            **dict(zip(quotas, values))
+        )
+        for values in zip(*quotas.values())
+    ), 'npcs')
+
+
+def iter_npcs(number=1, traits=2, filters=None, generate_adventurers=True,
+              engine='python', rng=None, data=None):
+    """Generate NPCs one by one.
+
+    This is a generator version of generate_npcs() taking the same
+    parameters. NPCs are yielded as soon as they are generated so memory
+    use doesn't grow with the number of NPCs. If number is None, NPCs are
+    generated endlessly.
+
+    The numpy engine generates NPCs in chunks of ITER_CHUNK_SIZE, the same
+    chunks generate_npcs() draws so both give the same NPCs for a seed.
+    """
+    rng = _get_rng(rng)
+    ages, classes, races = _prepare_data(filters, generate_adventurers, data)
+
+    if _has_quotas(filters):
+        if _use_numpy(engine):
+            print('WARNING: Quotas are not supported by the numpy engine, '
+                  'falling back to the python engine.', file=sys.stderr)
+        yield from _iter_quota_npcs(number, traits, (ages, classes, races),
+                                    filters, generate_adventurers, rng, data)
+        return
+
+    if _use_numpy(engine):
+        # pylint: disable=import-outside-toplevel
+        from loreroll import vectorized
+
+        chunks = vectorized.iter_npc_chunks(number, ITER_CHUNK_SIZE, traits,
+                                            ages, classes, races, rng, data)
+        for chunk in profiling.timed('generate', chunks):
+            profiling.count('npcs', len(chunk))
+            yield from chunk
+        return
+
+    counter = itertools.repeat(None) if number is None else range(number)
+    yield from profiling.timed('generate', (
+        generate_npc(traits, ages, classes, races, rng, data) for _ in counter
+    ), 'npcs')
+
+
+def generate_npcs(number=1, traits=2, filters=None, generate_adventurers=True,
+                  engine='python', rng=None, data=None):
     """Generate a number of NPCs.
 
     Traits parameter affects how much detailed the generated NPCs will
     be. Non-negative integer is expected, higher number means more
-    details. Default is meant to give the best results and with certain
-    level of detail the NPCs tend to start getting contradictory traits
-    (like fat and slim at the same time).
+    details. Traits are distinct and never contradictory (like fat and
+    slim at the same time), see generate_npc().
 
     Filters are expected to be a dictionary with string keys like
     'races_yes' and 'races_no' and sequence values with traits that are
     supposed to be included and excluded respectively while generating
     NPCs. Properties currently supporting filters are ages, classes and
     races.
+
+    Filters may also set exact shares of some ages, classes or races with
+    'ages_quota', 'classes_quota' and 'races_quota' keys mapping values to
+    fractions, e.g. {'races_quota': {'human': 0.4, 'dwarf (hill)': 0.25}}.
+    The numbers of NPCs with the values are allocated up front and rounded
+    to whole NPCs, the rest of the NPCs get other values passing the
+    filters with the usual weights. Quotas need a number of NPCs and the
+    python engine.
+
+    Engine is one of ENGINES. The default 'python' engine returns a list of
+    NPCs. The 'numpy' engine generates the NPCs in bulk which is much
+    faster for large numbers of NPCs and returns a sequence of NPCs stored
+    column-wise (see loreroll.vectorized.NPCColumns). It draws the NPCs in
+    chunks of ITER_CHUNK_SIZE like iter_npcs() does, so seeded results
+    depend on the chunk size. If NumPy isn't installed, the 'python' engine
+    is used instead.
+
+    Rng is the random generator and data the NPC data to use, see
+    generate_npc().
+
+    See iter_npcs() for generating large numbers of NPCs with constant
+    memory use.
     """
-    # filter the data
-    if filters is None:
-        filters = {}
+    if not _has_quotas(filters) and _use_numpy(engine):
+        # pylint: disable=import-outside-toplevel
+        from loreroll import vectorized
+
+        ages, classes, races = _prepare_data(filters, generate_adventurers,
+                                             data)
+        with profiling.stage('generate'):
+            npcs = vectorized.generate_npcs(number, traits, ages, classes,
+                                            races, _get_rng(rng), data,
+                                            ITER_CHUNK_SIZE)
+        profiling.count('npcs', number)
+        return npcs
+
+    return list(iter_npcs(number, traits, filters, generate_adventurers,
+                          engine, rng, data))
+
+
+def iter_npc_range(seed, start=0, stop=None, traits=2, filters=None,
+                   generate_adventurers=True, data=None):
+    """Generate NPCs start to stop (exclusive) of the seed's NPC sequence.
+
+    Unlike generate_npcs() which draws all the NPCs from a single random
+    stream, each NPC is generated by a random generator seeded from the
+    seed and the NPC's index (see loreroll.rng.indexed_seeds()). Any NPC or
+    range of NPCs can be generated without generating the preceding ones
+    and the NPCs are the same however the sequence is split into pages or
+    parallel shards. If stop is None, NPCs are generated endlessly.
+
+    See generate_npcs() for the other parameters, quotas can't be used as
+    they are allocated for the whole number of NPCs.
+    """
+    if _has_quotas(filters):
+        raise ValueError('Quotas can not be used for ranges of NPCs')
+    ages, classes, races = _prepare_data(filters, generate_adventurers, data)
+    rng = random.Random()  # nosec
 
-    ages = _filter_structured_data(NPC_DATA['age'],
-                                   filters.get('ages_yes'),
-                                   filters.get('ages_no'))
+    def generate(index_seed):
+        rng.seed(index_seed)
+        return generate_npc(traits, ages, classes, races, rng, data)
 
-    # classes are only generated for adventurers
-    if generate_adventurers:
-        classes = _filter_string_data(NPC_DATA['classes'],
-                                      filters.get('classes_yes'),
-                                      filters.get('classes_no'))
-    else:
-        classes = []
+    yield from profiling.timed('generate', map(
+        generate, indexed_seeds(seed, start, stop)
+    ), 'npcs')
 
-    races = _filter_structured_data(NPC_DATA['races'],
-                                    filters.get('races_yes'),
-                                    filters.get('races_no'))
 
-    npcs = []
-    for _ in range(number):
-        npcs.append(generate_npc(traits, ages, classes, races))
-    return npcs
+def npc_at(seed, index, traits=2, filters=None, generate_adventurers=True,
+           data=None):
+    """Generate the NPC at the given index of the seed's NPC sequence.
+
+    See iter_npc_range().
+    """
+    return next(iter_npc_range(seed, index, index + 1, traits, filters,
+                               generate_adventurers, data))
@@ -0,0 +1,137 @@
+"""Parallel NPC generation using multiple processes.
+
+A large request is split into shards of SHARD_SIZE NPCs which are
+generated by a pool of worker processes. Each shard is seeded with a seed
+derived from the user's seed and the shard index so the results only
+depend on the seed - they are the same regardless of the number of workers
+and they are always returned in the same order.
+
+Seekable generation (see loreroll.npc.iter_npc_range()) doesn't even depend
+on the shard size, the NPCs are the same as when generated by a single
+process.
+"""
+
+import os
+import random
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from loreroll.datasets import layered_data
+from loreroll.npc import _has_quotas, generate_npcs, iter_npc_range
+from loreroll.rng import derive_seed
+
+
+SHARD_SIZE = 10000
+
+
+def _generate_shard(seed, start, number, traits, filters,
+                    generate_adventurers, engine, formatter, data_files):
+    """Generate one shard of NPCs in a worker process.
+
+    If start is not None, NPCs start to start + number of the seed's
+    seekable NPC sequence are generated.
+    """
+    data = layered_data(data_files) if data_files else None
+    if start is None:
+        npcs = generate_npcs(number, traits, filters, generate_adventurers,
+                             engine, random.Random(seed), data)  # nosec
+    else:
+        npcs = list(iter_npc_range(seed, start, start + number, traits,
+                                   filters, generate_adventurers, data))
+    if formatter is not None:
+        return ''.join(map(formatter, npcs))
+    return npcs
+
+
+def _shards(number, seed, shard_size, start):
+    """Yield (seed, start, number of NPCs) for each shard.
+
+    Start is the index of the first NPC of a seekable generation, None
+    otherwise.
+    """
+    for index, offset in enumerate(range(0, number, shard_size)):
+        shard_number = min(shard_size, number - offset)
+        if start is None:
+            yield derive_seed(seed, index), None, shard_number
+        else:
+            yield seed, start + offset, shard_number
+
+
+def iter_shards_parallel(number=1, traits=2, filters=None,
+                         generate_adventurers=True, engine='python',
+                         seed=None, workers=None, shard_size=SHARD_SIZE,
+                         formatter=None, data_files=(), start=None):
+    """Generate NPCs in parallel, yield whole shards in order.
+
+    Number, traits, filters, generate_adventurers and engine have the same
+    meaning as for generate_npcs(). Workers is the number of worker
+    processes, by default the number of CPUs. If seed is None, it is drawn
+    from the random module so random.seed() still determines the results.
+
+    Each shard is a sequence of NPCs unless a formatter is given. The
+    formatter needs to be a picklable function taking an NPC and returning
+    a string; the workers then format the NPCs and each shard is a string
+    with all its NPCs formatted. This way even the formatting is done in
+    parallel.
+
+    Data files are YAML data files to layer over the package NPC data (see
+    loreroll.datasets.layered_data()); data providers can't be passed to
+    the worker processes so they load the layered data themselves.
+
+    If start is given, NPCs from the start index of the seed's seekable
+    NPC sequence are generated (see loreroll.npc.iter_npc_range()), the
+    engine is not used in such a case.
+
+    Only a limited number of shards is being generated ahead of the
+    consumer so memory use doesn't grow with the number of NPCs.
+
+    Quotas (see generate_npcs()) are not supported.
+    """
+    if _has_quotas(filters):
+        raise ValueError('Quotas are not supported by parallel generation')
+    if seed is None:
+        seed = random.randrange(sys.maxsize)  # nosec
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    with ProcessPoolExecutor(workers) as executor:
+        max_pending = 2 * workers
+        pending = deque()
+        for shard in _shards(number, seed, shard_size, start):
+            pending.append(executor.submit(
+                _generate_shard, *shard, traits, filters,
+                generate_adventurers, engine, formatter, data_files
+            ))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_npcs_parallel(number=1, traits=2, filters=None,
+                       generate_adventurers=True, engine='python',
+                       seed=None, workers=None, shard_size=SHARD_SIZE,
+                       data_files=(), start=None):
+    """Generate NPCs in parallel, yield them one by one in order.
+
+    See iter_shards_parallel() for description of the parameters.
+    """
+    for shard in iter_shards_parallel(number, traits, filters,
+                                      generate_adventurers, engine, seed,
+                                      workers, shard_size,
+                                      data_files=data_files, start=start):
+        yield from shard
+
+
+def generate_npcs_parallel(number=1, traits=2, filters=None,
+                           generate_adventurers=True, engine='python',
+                           seed=None, workers=None, shard_size=SHARD_SIZE,
+                           data_files=(), start=None):
+    """Generate a list of NPCs in parallel.
+
+    See iter_shards_parallel() for description of the parameters.
+    """
+    return list(iter_npcs_parallel(number, traits, filters,
+                                   generate_adventurers, engine, seed,
+                                   workers, shard_size, data_files, start))
@@ -0,0 +1,406 @@
+"""Compact storage of large numbers of NPCs.
+
+Every NPC value comes from a small vocabulary (the NPC data) so instead of
+keeping an NPC tuple with its own lists per NPC, a Population stores each
+value once in a string table and keeps only small integer indices into
+the tables in array-backed columns. NPCs are materialized as lightweight
+views on demand.
+
+IndexedPopulation also keeps inverted indexes - for each value of the
+indexed fields, the sorted list of indices of NPCs having it - so queries
+like "old tieflings with a scar" don't need to scan the whole population:
+
+    population = IndexedPopulation()
+    for node in iter_settlement(city, seed=1):
+        population.extend(node.npcs, group=node.path)
+    scarred = population.query(age='old', race='tiefling', physical='scar')
+    rogue = population.query(class_='rogue',
+                             group=('Waterdeep', 'Dock Ward')).choice()
+"""
+
+from array import array
+from collections.abc import Sequence
+from itertools import chain
+
+from loreroll.npc import _compile_filter, _get_rng, NPC
+
+
+# NPC fields holding a single value.
+SCALAR_FIELDS = ('name', 'age', 'race', 'class_')
+# NPC fields holding a list of traits.
+TRAIT_FIELDS = ('physical', 'personality')
+FIELDS = SCALAR_FIELDS + TRAIT_FIELDS
+# Fields with inverted indexes in IndexedPopulation.
+INDEXED_FIELDS = ('age', 'race', 'class_') + TRAIT_FIELDS
+
+
+class NPCView:
+    """A read-only view of an NPC stored in a Population.
+
+    Provides the same attributes as NPC, use to_npc() to get a real NPC.
+    """
+
+    __slots__ = ('_population', '_index')
+
+    def __init__(self, population, index):
+        self._population = population
+        self._index = index
+
+    @property
+    def name(self):
+        """Name of the NPC."""
+        return self._population.value('name', self._index)
+
+    @property
+    def age(self):
+        """Age of the NPC."""
+        return self._population.value('age', self._index)
+
+    @property
+    def race(self):
+        """Race of the NPC."""
+        return self._population.value('race', self._index)
+
+    @property
+    def class_(self):
+        """Class of the NPC, None for civilians."""
+        return self._population.value('class_', self._index)
+
+    @property
+    def physical(self):
+        """List of physical traits of the NPC."""
+        return self._population.traits('physical', self._index)
+
+    @property
+    def personality(self):
+        """List of personality traits of the NPC."""
+        return self._population.traits('personality', self._index)
+
+    def to_npc(self):
+        """Return the viewed NPC as an NPC tuple."""
+        return NPC(
+            name=self.name,
+            age=self.age,
+            race=self.race,
+            class_=self.class_,
+            physical=self.physical,
+            personality=self.personality,
+        )
+
+    def __eq__(self, other):
+        if isinstance(other, (NPCView, NPC)):
+            return tuple(self.to_npc()) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.name, self.age, self.race, self.class_,
+                     tuple(self.physical), tuple(self.personality)))
+
+    def __iter__(self):
+        return iter(self.to_npc())
+
+    def __repr__(self):
+        return repr(self.to_npc()).replace('NPC(', 'NPCView(', 1)
+
+
+class Population(Sequence):
+    """Compact container of NPCs.
+
+    Values of each field are interned in a table per field; columns store
+    indices into the tables in arrays of unsigned shorts (switching to
+    unsigned ints if a table ever grows too big). Class index 0 means no
+    class, other class indices are shifted by one. Traits of all NPCs are
+    stored in one flat column per trait field along with a column of end
+    offsets.
+
+    Indexing returns NPCView instances.
+    """
+
+    def __init__(self, npcs=()):
+        self.tables = {field: [] for field in FIELDS}
+        self._lookup = {field: {} for field in FIELDS}
+        self.columns = {field: array('H') for field in FIELDS}
+        self.ends = {field: array('I') for field in TRAIT_FIELDS}
+        # class_ index 0 is reserved for "no class"
+        self.tables['class_'].append(None)
+        self._lookup['class_'][None] = 0
+        self.extend(npcs)
+
+    def _intern(self, field, value):
+        """Return index of the value in the field's table, add it if new."""
+        lookup = self._lookup[field]
+        try:
+            return lookup[value]
+        except KeyError:
+            pass
+        index = len(self.tables[field])
+        if index == 2 ** 16:
+            self.columns[field] = array('I', self.columns[field])
+        self.tables[field].append(value)
+        lookup[value] = index
+        return index
+
+    def append(self, npc):
+        """Add an NPC (or any object with NPC attributes)."""
+        # Interning may replace the column so it must be done first.
+        for field in SCALAR_FIELDS:
+            index = self._intern(field, getattr(npc, field))
+            self.columns[field].append(index)
+        for field in TRAIT_FIELDS:
+            indices = [
+                self._intern(field, trait) for trait in getattr(npc, field)
+            ]
+            column = self.columns[field]
+            column.extend(indices)
+            self.ends[field].append(len(column))
+
+    def extend(self, npcs):
+        """Add all the given NPCs."""
+        for npc in npcs:
+            self.append(npc)
+
+    def extend_columns(self, tables, columns, ends):
+        """Add NPCs stored column-wise in the same way as in Population.
+
+        Tables, columns and ends are dictionaries like the attributes of the
+        same names. Indices in the columns are remapped to this population's
+        tables so the NPCs don't need to be materialized.
+        """
+        for field in FIELDS:
+            remap = [self._intern(field, value) for value in tables[field]]
+            self.columns[field].extend(
+                remap[index] for index in columns[field]
+            )
+        for field in TRAIT_FIELDS:
+            offset = len(self.columns[field]) - len(columns[field])
+            self.ends[field].extend(end + offset for end in ends[field])
+
+    def __len__(self):
+        return len(self.columns['name'])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [NPCView(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('NPC index out of range')
+        return NPCView(self, index)
+
+    def value(self, field, index):
+        """Return value of a scalar field of the NPC at the given index."""
+        return self.tables[field][self.columns[field][index]]
+
+    def traits(self, field, index):
+        """Return list of traits of the NPC at the given index."""
+        ends = self.ends[field]
+        start = ends[index - 1] if index else 0
+        table = self.tables[field]
+        return [table[i] for i in self.columns[field][start:ends[index]]]
+
+
+class QueryResult(Sequence):
+    """NPCs of a population matching a query.
+
+    Holds sorted indices of the NPCs in the population, indexing returns
+    NPCView instances. Results of queries of the same population can be
+    combined with & (NPCs in both) and | (NPCs in either).
+    """
+
+    def __init__(self, population, indices):
+        self.population = population
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [NPCView(self.population, i) for i in self.indices[index]]
+        return NPCView(self.population, self.indices[index])
+
+    def _combine(self, other, indices):
+        if other.population is not self.population:
+            raise ValueError('Cannot combine results of different populations')
+        return QueryResult(self.population, array('I', sorted(indices)))
+
+    def __and__(self, other):
+        if not isinstance(other, QueryResult):
+            return NotImplemented
+        return self._combine(
+            other, set(self.indices).intersection(other.indices)
+        )
+
+    def __or__(self, other):
+        if not isinstance(other, QueryResult):
+            return NotImplemented
+        return self._combine(other, set(self.indices).union(other.indices))
+
+    def choice(self, rng=None):
+        """Return a random NPC of the result.
+
+        Rng is the random generator to use, the random module if None.
+        IndexError is raised if the result is empty.
+        """
+        if not self.indices:
+            raise IndexError('Cannot choose from an empty query result')
+        rng = _get_rng(rng)
+        return self[rng.randrange(len(self.indices))]  # nosec
+
+    def sample(self, k, rng=None):
+        """Return a list of k distinct random NPCs of the result.
+
+        See choice() for the rng parameter.
+        """
+        rng = _get_rng(rng)
+        return [self[i] for i in rng.sample(range(len(self.indices)), k)]
+
+
+class IndexedPopulation(Population):
+    """Population with inverted indexes for fast queries.
+
+    Indexes of INDEXED_FIELDS are updated as NPCs are added, at the cost of
+    an index entry (four bytes) per NPC and indexed value. NPCs may also be
+    added to a group, e.g. a location (any hashable value like a settlement
+    path), to query the NPCs of the group.
+    """
+
+    def __init__(self, npcs=(), group=None):
+        super().__init__()
+        # group index 0 is reserved for "no group"
+        self.tables['group'] = [None]
+        self._lookup['group'] = {None: 0}
+        self.columns['group'] = array('H')
+        self.postings = {
+            field: [] for field in INDEXED_FIELDS + ('group',)
+        }
+        self.extend(npcs, group)
+
+    def _post(self, field, value_index, index):
+        """Add the NPC index to the posting list of the value."""
+        postings = self.postings[field]
+        while len(postings) <= value_index:
+            postings.append(array('I'))
+        posting = postings[value_index]
+        # Repeated traits are indexed only once.
+        if not posting or posting[-1] != index:
+            posting.append(index)
+
+    def _index(self, start, group):
+        """Add NPCs from the start index on to the group and the indexes."""
+        group_index = self._intern('group', group)
+        columns, ends = self.columns, self.ends
+        for index in range(start, len(self)):
+            columns['group'].append(group_index)
+            self._post('group', group_index, index)
+            for field in SCALAR_FIELDS[1:]:
+                self._post(field, columns[field][index], index)
+            for field in TRAIT_FIELDS:
+                trait_start = ends[field][index - 1] if index else 0
+                for value_index in columns[field][
+                        trait_start:ends[field][index]]:
+                    self._post(field, value_index, index)
+
+    def append(self, npc, group=None):
+        """Add an NPC (or any object with NPC attributes) to the group."""
+        super().append(npc)
+        self._index(len(self) - 1, group)
+
+    def extend(self, npcs, group=None):
+        """Add all the given NPCs to the group."""
+        for npc in npcs:
+            self.append(npc, group)
+
+    def extend_columns(self, tables, columns, ends, group=None):
+        """Add NPCs stored column-wise to the group.
+
+        See Population.extend_columns().
+        """
+        start = len(self)
+        super().extend_columns(tables, columns, ends)
+        self._index(start, group)
+
+    def group(self, index):
+        """Return group of the NPC at the given index."""
+        return self.value('group', index)
+
+    def _matching(self, field, values):
+        """Return indices of the field's table values matching the values.
+
+        Groups match if they're equal or if the group is a path (tuple)
+        starting with the value. Other fields match if they contain any of
+        the values like filters of generate_npcs().
+        """
+        table = self.tables[field]
+        if field == 'group':
+            return {
+                index for index, group in enumerate(table) if index and any(
+                    group == value or isinstance(group, tuple)
+                    and isinstance(value, tuple)
+                    and group[:len(value)] == value
+                    for value in values
+                )
+            }
+        matches = _compile_filter(tuple(values), ())
+        return {
+            index for index, value in enumerate(table)
+            if value is not None and matches(value)
+        }
+
+    def _has(self, field, index, value_indices):
+        """Check whether the NPC at the index has any of the values."""
+        if field not in TRAIT_FIELDS:
+            return self.columns[field][index] in value_indices
+        ends = self.ends[field]
+        start = ends[index - 1] if index else 0
+        return not value_indices.isdisjoint(
+            self.columns[field][start:ends[index]]
+        )
+
+    def query(self, **criteria):
+        """Return QueryResult of the NPCs matching all the criteria.
+
+        Keys of the criteria are INDEXED_FIELDS or group, values are either
+        a single value or a list (or set) of values of which any has to
+        match. Values match if they are substrings of the NPC values (see
+        the filters of generate_npcs()), groups need to be equal or
+        a prefix of a path group. For example, query(age=['old', 'ancient'],
+        race='tiefling', physical='scar') returns old, older, very old or
+        ancient tieflings with a scar or scars.
+
+        Without criteria, all the NPCs are returned.
+        """
+        matching = {}
+        for field, values in criteria.items():
+            if field not in self.postings:
+                raise ValueError(f'Unknown query field "{field}", use one '
+                                 f'of {INDEXED_FIELDS + ("group",)}')
+            if not isinstance(values, (list, set, frozenset)):
+                values = [values]
+            matching[field] = self._matching(field, values)
+        if not matching:
+            return QueryResult(self, array('I', range(len(self))))
+
+        # Start with the field having the fewest matching NPCs and check the
+        # other fields of those NPCs only.
+        def size(field):
+            postings = self.postings[field]
+            return sum(len(postings[index]) for index in matching[field]
+                       if index < len(postings))
+
+        first = min(matching, key=size)
+        postings = self.postings[first]
+        candidates = [postings[index] for index in matching[first]
+                      if index < len(postings)]
+        if len(candidates) == 1:
+            indices = candidates[0]
+        else:
+            indices = sorted(set(chain.from_iterable(candidates)))
+        others = [(field, value_indices)
+                  for field, value_indices in matching.items()
+                  if field != first]
+        return QueryResult(self, array('I', (
+            index for index in indices
+            if all(self._has(field, index, value_indices)
+                   for field, value_indices in others)
+        )))
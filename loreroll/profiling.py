@@ -0,0 +1,182 @@
+"""Opt-in profiling of NPC generation.
+
+When a large generation is slow, the stats tell where the time goes - data
+loading, filtering, sampling or output - along with counters like the
+number of generated NPCs, prepared data cache hits or sizes of the
+filtered data:
+
+    with profile() as stats:
+        generate_npcs(100000)
+    print(stats.report(), file=sys.stderr)
+
+Stage times are exclusive - time spent in a nested stage (e.g. generating
+NPCs while formatting them lazily) only counts towards the nested stage.
+
+Profiling is disabled by default. The module-level helpers (stage(),
+count(), note() and timed()) then do nothing and the generators only check
+whether profiling is enabled once per call, not per NPC. Only the current
+process is profiled, worker processes (see loreroll.parallel) are not.
+"""
+
+import contextlib
+import threading
+import time
+
+
+# Stats being collected, None when profiling is disabled.
+_stats = None  # pylint: disable=invalid-name
+
+
+class Stats:
+    """Profiling statistics - stage timings, counters and notes."""
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.notes = {}
+        self.started = time.perf_counter()
+        self.finished = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def elapsed(self):
+        """Seconds since the profiling started (until it finished)."""
+        end = time.perf_counter() if self.finished is None else self.finished
+        return end - self.started
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measure the time spent in the with block as the given stage."""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        # Time spent in nested stages is subtracted from this one.
+        frame = [0.0]
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            with self._lock:
+                calls, seconds = self.stages.get(name, (0, 0.0))
+                self.stages[name] = (calls + 1, seconds + elapsed - frame[0])
+
+    def count(self, name, number=1):
+        """Increase the given counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + number
+
+    def note(self, name, value):
+        """Remember a value, e.g. why the data bundle couldn't be used."""
+        self.notes[name] = value
+
+    def timed(self, name, iterable, counter=None):
+        """Yield items of the iterable measuring each step as a stage.
+
+        If counter is given, the items are counted in the counter.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            if counter is not None:
+                self.count(counter)
+            yield item
+
+    def as_dict(self):
+        """Return the stats as a dictionary, e.g. for JSON export."""
+        return {
+            'elapsed': self.elapsed,
+            'stages': {
+                name: {'calls': calls, 'seconds': seconds}
+                for name, (calls, seconds) in self.stages.items()
+            },
+            'counters': dict(self.counters),
+            'notes': dict(self.notes),
+        }
+
+    def report(self):
+        """Return a human-readable report of the stats."""
+        elapsed = self.elapsed
+        lines = [f'{"Stage":<20} {"Calls":>10} {"Seconds":>10} {"Share":>7}']
+        for name, (calls, seconds) in sorted(self.stages.items(),
+                                             key=lambda item: -item[1][1]):
+            share = seconds / elapsed if elapsed else 0.0
+            lines.append(f'{name:<20} {calls:>10} {seconds:>10.4f} '
+                         f'{share:>7.1%}')
+        lines.append(f'{"Total":<20} {"":>10} {elapsed:>10.4f}')
+
+        npcs = self.counters.get('npcs', 0)
+        if npcs and elapsed:
+            lines.append(f'NPCs: {npcs} ({npcs / elapsed:,.0f} NPCs/s)')
+        for name, value in sorted(self.counters.items()):
+            if name != 'npcs':
+                lines.append(f'{name}: {value}')
+        for name, value in sorted(self.notes.items()):
+            lines.append(f'{name}: {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def enable(stats=None):
+    """Start profiling into the given (or new) stats, return the stats."""
+    global _stats  # pylint: disable=global-statement
+    _stats = Stats() if stats is None else stats
+    return _stats
+
+
+def disable():
+    """Stop profiling, return the stats collected (None if not enabled)."""
+    global _stats  # pylint: disable=global-statement
+    stats, _stats = _stats, None
+    if stats is not None:
+        stats.finished = time.perf_counter()
+    return stats
+
+
+def active():
+    """Return the stats being collected, None if profiling is disabled."""
+    return _stats
+
+
+@contextlib.contextmanager
+def profile(stats=None):
+    """Profile the with block, the stats are the with target."""
+    stats = enable(stats)
+    try:
+        yield stats
+    finally:
+        disable()
+
+
+def stage(name):
+    """Measure the with block as the given stage if profiling is enabled."""
+    if _stats is None:
+        return contextlib.nullcontext()
+    return _stats.stage(name)
+
+
+def count(name, number=1):
+    """Increase the given counter if profiling is enabled."""
+    if _stats is not None:
+        _stats.count(name, number)
+
+
+def note(name, value):
+    """Remember the given value if profiling is enabled."""
+    if _stats is not None:
+        _stats.note(name, value)
+
+
+def timed(name, iterable, counter=None):
+    """Measure iterating over the iterable if profiling is enabled."""
+    if _stats is None:
+        return iterable
+    return _stats.timed(name, iterable, counter)
@@ -0,0 +1,143 @@
+"""Reloading NPC data in long-running processes.
+
+NPC data are loaded only once per process. DataWatcher keeps track of the
+YAML data file and when it changes, it reparses only the changed top-level
+sections (races, names, ...) and swaps them into NPC_DATA at once. Only the
+prepared samplers depending on the changed sections are dropped.
+
+    watcher = DataWatcher()
+    watcher.start()     # poll the file in a background thread
+    ...
+    watcher.stop()
+
+Or call reload_data() (or DataWatcher.check()) to reload on demand.
+"""
+
+import hashlib
+import os
+import sys
+import threading
+from collections import ChainMap
+
+from loreroll.npc import (
+    _check_exclusive,
+    _parse_yaml_sections,
+    _split_yaml,
+    NPC_DATA,
+    NPC_FILENAME,
+    OPTIONAL_SECTIONS,
+    TRAIT_SECTIONS,
+)
+
+
+# Seconds between checks of the watched file.
+POLL_INTERVAL = 2.0
+
+
+def _digest(text):
+    """Return digest of a section text."""
+    return hashlib.sha256(text.encode()).digest()
+
+
+class DataWatcher:
+    """Reloads changed sections of the YAML NPC data.
+
+    The file is expected to hold the data currently used by the provider
+    when the watcher is created. A check is a single os.stat() call unless
+    the file's size or modification time change.
+    """
+
+    def __init__(self, provider=NPC_DATA, path=NPC_FILENAME):
+        self.provider = provider
+        self.path = path
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._stat, self._digests = self._snapshot()[:2]
+
+    def _snapshot(self):
+        """Return stat, section digests and sections of the file."""
+        with open(self.path, 'r', encoding='utf-8') as yaml_file:
+            stat = os.fstat(yaml_file.fileno())
+            sections = _split_yaml(yaml_file.read())
+        digests = {
+            name: _digest(text) for name, (_, text) in sections.items()
+        }
+        return (stat.st_size, stat.st_mtime_ns), digests, sections
+
+    def check(self, force=False):
+        """Reload the changed sections if the file has changed.
+
+        Returns a set of names of the reloaded sections. If force is True,
+        all the sections are reloaded. Errors in the data are raised and the
+        current data are kept in such a case.
+        """
+        with self._lock:
+            if not force:
+                stat = os.stat(self.path)
+                if (stat.st_size, stat.st_mtime_ns) == self._stat:
+                    return set()
+
+            stat, digests, sections = self._snapshot()
+            self._stat = stat
+            changed = {
+                name for name, digest in digests.items()
+                if force or self._digests.get(name) != digest
+            }
+            data = _parse_yaml_sections(
+                {name: sections[name] for name in changed}
+            )
+            for name in set(self._digests) - set(digests):
+                if name not in OPTIONAL_SECTIONS:
+                    raise ValueError(f'NPC data section "{name}" is missing')
+                data[name] = []
+
+            _check_exclusive(ChainMap(data, self.provider), [
+                section for section in TRAIT_SECTIONS
+                if {section, f'{section}_exclusive'} & set(data)
+            ])
+            if data:
+                self.provider.update(data)
+            self._digests = digests
+            return set(data)
+
+    def _run(self, interval):
+        """Check the file periodically until stopped."""
+        while not self._stopped.wait(interval):
+            try:
+                changed = self.check()
+            # pylint: disable-next=broad-exception-caught
+            except Exception as error:
+                print(f'WARNING: Could not reload "{self.path}": {error}',
+                      file=sys.stderr)
+                continue
+            if changed:
+                print(f'Reloaded NPC data: {", ".join(sorted(changed))}',
+                      file=sys.stderr)
+
+    def start(self, interval=POLL_INTERVAL):
+        """Start checking the file every interval seconds in a thread."""
+        if self._thread is not None:
+            raise RuntimeError('The watcher is already running')
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), daemon=True,
+            name='loreroll-data-watcher'
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the watcher thread and wait for it to finish."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+
+def reload_data(provider=NPC_DATA, path=NPC_FILENAME):
+    """Reload all the sections of the YAML NPC data into the provider.
+
+    Prefer DataWatcher.check() which only reparses the changed sections.
+    """
+    return DataWatcher(provider, path).check(force=True)
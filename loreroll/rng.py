@@ -0,0 +1,36 @@
+"""Helpers for random number generation."""
+
+import hashlib
+import itertools
+
+
+def derive_seed(seed, *keys):
+    """Derive a new seed from the given seed and keys.
+
+    The same seed and keys always give the same result so that e.g. each
+    shard of a parallel generation gets its own independent yet
+    reproducible seed. The seed and keys are compared by their string
+    representations (seed 42 and '42' derive the same seeds).
+    """
+    material = '\x1f'.join(str(part) for part in (seed, *keys))
+    digest = hashlib.sha256(material.encode()).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+def indexed_seeds(seed, start=0, stop=None):
+    """Yield seeds of items start to stop (exclusive) of a seekable sequence.
+
+    Each item of the sequence gets its own seed derived from the seed and
+    the item's index so any item or range of items can be generated without
+    generating the preceding ones. If stop is None, seeds are yielded
+    endlessly.
+
+    The seed is only hashed once, the index is then appended to the hash so
+    that seeding a generator for each item stays cheap.
+    """
+    if start < 0:
+        raise ValueError('Index must not be negative')
+    base = derive_seed(seed, 'indexed') << 64
+    indices = itertools.count(start) if stop is None else range(start, stop)
+    for index in indices:
+        yield base | index
@@ -0,0 +1,183 @@
+"""Reusable random samplers for NPC data."""
+
+import random
+from bisect import bisect
+from itertools import accumulate
+
+
+class WeightedSampler:
+    """Draws weighted random values from a data set.
+
+    The data_set needs to be a sequence of dict-like objects with at
+    least 'v' (value) and 'w' (weight) keys. Weights need to be
+    convertible to float.
+
+    Values and cumulative weights are computed only once so the sampler
+    should be created once and then reused for all draws. Each draw is
+    a binary search and the results are exactly the same as those of
+    random.choices() called with the same data and random state.
+    """
+
+    __slots__ = ('values', 'cum_weights', '_total', '_hi')
+
+    def __init__(self, data_set):
+        self.values = [x['v'] for x in data_set]
+        self.cum_weights = list(accumulate(float(x['w']) for x in data_set))
+        self._total = self.cum_weights[-1] + 0.0 if self.cum_weights else 0.0
+        self._hi = len(self.values) - 1
+
+    def __len__(self):
+        return len(self.values)
+
+    def _check(self):
+        """Raise the same errors random.choices() would."""
+        if not self.values:
+            raise IndexError('Cannot choose from an empty data set')
+        raise ValueError('Total of weights must be greater than zero')
+
+    def sample_index(self, rng=random):
+        """Return index of a weighted random value."""
+        if self._total <= 0.0:
+            self._check()
+        return bisect(self.cum_weights, rng.random() * self._total,
+                      0, self._hi)
+
+    def sample(self, rng=random):
+        """Return a weighted random value."""
+        return self.values[self.sample_index(rng)]
+
+
+class AliasSampler:
+    """Draws weighted random values in constant time.
+
+    Uses Vose's alias method - every draw costs one random number and one
+    comparison regardless of the data set size. The data_set has the same
+    format as for WeightedSampler.
+
+    Note that the results differ from those of WeightedSampler (and
+    random.choices()) for the same random state so switching between the two
+    changes what a given seed generates.
+    """
+
+    __slots__ = ('values', '_probabilities', '_aliases')
+
+    def __init__(self, data_set):
+        self.values = [x['v'] for x in data_set]
+        weights = [float(x['w']) for x in data_set]
+        total = sum(weights)
+        if not weights:
+            raise IndexError('Cannot choose from an empty data set')
+        if total <= 0.0:
+            raise ValueError('Total of weights must be greater than zero')
+
+        count = len(weights)
+        scaled = [weight * count / total for weight in weights]
+        self._probabilities = [1.0] * count
+        self._aliases = list(range(count))
+        small = [i for i, weight in enumerate(scaled) if weight < 1.0]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._probabilities[less] = scaled[less]
+            self._aliases[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+
+    def __len__(self):
+        return len(self.values)
+
+    def sample_index(self, rng=random):
+        """Return index of a weighted random value."""
+        column = rng.random() * len(self._aliases)
+        index = int(column)
+        if column - index < self._probabilities[index]:
+            return index
+        return self._aliases[index]
+
+    def sample(self, rng=random):
+        """Return a weighted random value."""
+        return self.values[self.sample_index(rng)]
+
+
+class TraitSampler:
+    """Draws distinct traits honouring groups of mutually exclusive traits.
+
+    Values are the traits to choose from, groups a sequence of groups of
+    mutually exclusive traits - at most one trait of each group is drawn.
+    A trait may only be a part of one group, group traits not present in
+    values are ignored. Equal values are never drawn twice either.
+
+    Conflicts are precompiled into bitsets (Python integers with a bit per
+    trait) so each draw is a random index and a bit test and drawing k
+    traits costs about k draws as long as the groups are small compared
+    to the number of traits.
+    """
+
+    __slots__ = ('values', 'group_ids', 'group_count', '_conflicts',
+                 '_sizes')
+
+    def __init__(self, values, groups=()):
+        self.values = list(values)
+
+        group_of = {}
+        for group_id, group in enumerate(groups):
+            for value in group:
+                if group_of.get(value, group_id) != group_id:
+                    raise ValueError(
+                        f'Trait "{value}" is in more than one group'
+                    )
+                group_of[value] = group_id
+
+        # Traits of a group share the group's ID, other traits get an ID
+        # per distinct value.
+        keys = [
+            (True, group_of[value]) if value in group_of else (False, value)
+            for value in self.values
+        ]
+        ids = {}
+        self.group_ids = [ids.setdefault(key, len(ids)) for key in keys]
+        self.group_count = len(ids)
+
+        masks = [0] * self.group_count
+        for index, group_id in enumerate(self.group_ids):
+            masks[group_id] |= 1 << index
+        self._conflicts = [masks[group_id] for group_id in self.group_ids]
+        self._sizes = [mask.bit_count() for mask in self._conflicts]
+
+    def __len__(self):
+        return len(self.values)
+
+    def sample_indices(self, k, rng=random):
+        """Return indices of k distinct random traits.
+
+        Fewer than k indices are returned if there aren't enough
+        non-conflicting traits.
+        """
+        size = len(self.values)
+        k = min(k, self.group_count)
+        randrange = rng.randrange
+        conflicts = self._conflicts
+        chosen = []
+        blocked = 0
+        blocked_count = 0
+        while len(chosen) < k:
+            if blocked_count * 2 > size:
+                # Mostly blocked, choose only from the free traits.
+                free = [i for i in range(size) if not blocked >> i & 1]
+                index = free[randrange(len(free))]
+            else:
+                index = randrange(size)
+                if blocked >> index & 1:
+                    continue
+            chosen.append(index)
+            blocked |= conflicts[index]
+            blocked_count += self._sizes[index]
+        return chosen
+
+    def sample(self, k, rng=random):
+        """Return a list of k distinct random traits."""
+        values = self.values
+        return [values[index] for index in self.sample_indices(k, rng)]
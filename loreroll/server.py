@@ -0,0 +1,296 @@
+"""Long-running NPC generation server.
+
+Starting Python and loading the data costs much more than generating a few
+NPCs. The server keeps the data and prepared samplers warm and generates
+NPCs on request over a minimal HTTP interface, either on a TCP port or on
+a Unix socket:
+
+    GET /npcs?number=3&race-allowed=elf&seed=42&format=jsonl
+
+Query parameters are the long options of the rollnpc command line tool:
+adventurers (true/false), age-allowed, age-disallowed, class-allowed,
+class-disallowed, race-allowed, race-disallowed (all may be repeated),
+names-only, number, seed, start, traits, unique-names and format (text,
+jsonl or csv). The seed used is sent in the X-Seed response header.
+
+With start, NPCs from the given index of the seed's NPC sequence are
+generated (see loreroll.npc.iter_npc_range()) which lets clients page
+through the sequence:
+
+    GET /npcs?seed=42&start=100&number=100
+
+Each request uses its own random generator so concurrent requests don't
+affect each other and the same seed always gives the same NPCs. NPCs are
+generated and sent in batches of BATCH_SIZE, waiting for the client to
+receive each batch before generating the next one.
+
+The server may watch the YAML NPC data and reload them when they change
+without dropping any requests.
+"""
+
+import asyncio
+import random
+import sys
+from urllib.parse import parse_qs, urlsplit
+
+from loreroll.export import CSV_HEADER, LINE_FORMATTERS
+from loreroll.npc import (
+    _prepare_data,
+    iter_name_chunks,
+    iter_npc_range,
+    iter_npcs,
+    NPC_DATA,
+)
+from loreroll.reload import DataWatcher
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8053
+
+BATCH_SIZE = 256
+MAX_TRAITS = 9
+
+CONTENT_TYPES = {
+    'text': 'text/plain; charset=utf-8',
+    'jsonl': 'application/jsonl; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+# Query parameters mapped to generate_npcs() filters.
+FILTER_PARAMETERS = {
+    'age-allowed': 'ages_yes',
+    'age-disallowed': 'ages_no',
+    'class-allowed': 'classes_yes',
+    'class-disallowed': 'classes_no',
+    'race-allowed': 'races_yes',
+    'race-disallowed': 'races_no',
+}
+
+
+class RequestError(Exception):
+    """Raised for invalid requests."""
+
+
+def _single(params, name, default):
+    """Return the single value of the given query parameter."""
+    values = params.get(name)
+    if not values:
+        return default
+    if len(values) > 1:
+        raise RequestError(f'Parameter "{name}" may only be used once')
+    return values[0]
+
+
+def _integer(params, name, default, minimum, maximum=None):
+    """Return the query parameter as an integer within the limits."""
+    value = _single(params, name, None)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError as error:
+        raise RequestError(f'Parameter "{name}" must be an integer') from error
+    if value < minimum or (maximum is not None and value > maximum):
+        raise RequestError(f'Parameter "{name}" is out of range')
+    return value
+
+
+def _boolean(params, name, default):
+    """Return the query parameter as a boolean."""
+    value = _single(params, name, None)
+    if value is None:
+        return default
+    if value.lower() in ('', '1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise RequestError(f'Parameter "{name}" must be true or false')
+
+
+def parse_query(query):
+    """Parse the request query into generation options.
+
+    Returns a dictionary with 'number', 'traits', 'filters',
+    'generate_adventurers', 'names_only', 'unique_names', 'seed', 'start'
+    and 'format' keys.
+    """
+    params = parse_qs(query, keep_blank_values=True)
+    known = {'adventurers', 'format', 'names-only', 'number', 'seed',
+             'start', 'traits', 'unique-names', *FILTER_PARAMETERS}
+    for name in params:
+        if name not in known:
+            raise RequestError(f'Unknown parameter "{name}"')
+
+    format_ = _single(params, 'format', 'text')
+    if format_ not in CONTENT_TYPES:
+        raise RequestError(f'Unsupported format "{format_}"')
+
+    start = _integer(params, 'start', None, 0)
+    names_only = _boolean(params, 'names-only', False)
+    if start is not None and names_only:
+        raise RequestError('Parameter "start" can not be used with '
+                           '"names-only"')
+    if names_only and format_ != 'text':
+        raise RequestError('Parameter "names-only" can only be used with '
+                           'the text format')
+
+    seed = _single(params, 'seed', None)
+    if seed is None:
+        seed = str(random.randrange(sys.maxsize))  # nosec
+
+    return {
+        'number': _integer(params, 'number', 1, 0),
+        'traits': _integer(params, 'traits', 2, 0, MAX_TRAITS),
+        'filters': {
+            key: params.get(name, [])
+            for name, key in FILTER_PARAMETERS.items()
+        },
+        'generate_adventurers': _boolean(params, 'adventurers', True),
+        'names_only': names_only,
+        'unique_names': _boolean(params, 'unique-names', False),
+        'seed': seed,
+        'start': start,
+        'format': format_,
+    }
+
+
+def _generate_text(options):
+    """Return an iterator of formatted NPCs (or names) for the options."""
+    rng = random.Random(options['seed'])  # nosec
+    if options['names_only']:
+        return (
+            f'{name}\n'
+            for chunk in iter_name_chunks(options['number'],
+                                          options['unique_names'], rng)
+            for name in chunk
+        )
+
+    if options['start'] is not None:
+        npcs = iter_npc_range(
+            options['seed'],
+            options['start'],
+            options['start'] + options['number'],
+            traits=options['traits'],
+            filters=options['filters'],
+            generate_adventurers=options['generate_adventurers']
+        )
+        return map(LINE_FORMATTERS[options['format']], npcs)
+
+    npcs = iter_npcs(
+        options['number'],
+        traits=options['traits'],
+        filters=options['filters'],
+        generate_adventurers=options['generate_adventurers'],
+        rng=rng
+    )
+    return map(LINE_FORMATTERS[options['format']], npcs)
+
+
+async def _respond(writer, status, headers=(), body=''):
+    """Send response status line and headers (and optionally body)."""
+    lines = [f'HTTP/1.1 {status}', 'Connection: close', *headers, '', body]
+    writer.write('\r\n'.join(lines).encode())
+    await writer.drain()
+
+
+async def _handle_request(reader, writer):
+    """Handle a single request."""
+    request_line = (await reader.readline()).decode('latin-1').split()
+    # Skip the request headers.
+    while (await reader.readline()).strip():
+        pass
+
+    if len(request_line) != 3 or request_line[0] != 'GET':
+        await _respond(writer, '405 Method Not Allowed')
+        return
+    url = urlsplit(request_line[1])
+    if url.path != '/npcs':
+        await _respond(writer, '404 Not Found')
+        return
+    try:
+        options = parse_query(url.query)
+    except RequestError as error:
+        await _respond(writer, '400 Bad Request',
+                       ['Content-Type: text/plain; charset=utf-8'],
+                       f'{error}\n')
+        return
+
+    lines = _generate_text(options)
+
+    def next_batch():
+        return ''.join(line for _, line in zip(range(BATCH_SIZE), lines))
+
+    # Generate the first batch before responding so that invalid filters
+    # (nothing to choose from) get an error status.
+    try:
+        batch = next_batch()
+    except (IndexError, ValueError) as error:
+        await _respond(writer, '400 Bad Request',
+                       ['Content-Type: text/plain; charset=utf-8'],
+                       f'{error}\n')
+        return
+
+    await _respond(writer, '200 OK', [
+        f'Content-Type: {CONTENT_TYPES[options["format"]]}',
+        f'X-Seed: {options["seed"]}',
+    ])
+    if options['format'] == 'csv' and not options['names_only']:
+        writer.write(CSV_HEADER.encode())
+
+    while batch:
+        writer.write(batch.encode())
+        # Backpressure - wait for the client to receive the data, this
+        # also lets other requests be handled.
+        await writer.drain()
+        batch = next_batch()
+
+
+async def handle_connection(reader, writer):
+    """Handle a client connection."""
+    try:
+        await _handle_request(reader, writer)
+    except (ConnectionError, IndexError, ValueError) as error:
+        # Client disconnected or generation failed after responding.
+        if not isinstance(error, ConnectionError):
+            writer.write(f'ERROR: {error}\n'.encode())
+    finally:
+        writer.close()
+
+
+def warm_up():
+    """Load all the data and prepare the default samplers."""
+    for section in NPC_DATA:
+        NPC_DATA[section]  # pylint: disable=pointless-statement
+    _prepare_data(None, True)
+    _prepare_data(None, False)
+
+
+async def start_server(host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+    """Start the server, return asyncio.Server.
+
+    The server listens on the given Unix socket path if provided, on the
+    given host and port otherwise.
+    """
+    warm_up()
+    if path is not None:
+        return await asyncio.start_unix_server(handle_connection, path)
+    return await asyncio.start_server(handle_connection, host, port)
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, path=None,
+                watch=False):
+    """Run the server forever.
+
+    If watch is True, changes of the YAML NPC data are reloaded while the
+    server runs (see loreroll.reload).
+    """
+    server = await start_server(host, port, path)
+    watcher = DataWatcher() if watch else None
+    if watcher is not None:
+        watcher.start()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if watcher is not None:
+            watcher.stop()
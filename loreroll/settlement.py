@@ -0,0 +1,307 @@
+"""Generating whole settlements of NPCs.
+
+A settlement is described by a tree of nodes - e.g. a region with towns,
+their districts and households. Each node is a dictionary with the
+following (all optional) keys:
+
+* name - name of the node, 'settlement' by default; sibling nodes need
+  distinct names
+* inhabitants - number of NPCs living directly in the node, either a number
+  or a [minimum, maximum] range to draw the number from (0 by default)
+* count - number of such nodes, they are named '<name> 1', '<name> 2', ...
+* traits - number of traits of the NPCs (2 by default)
+* adventurers - whether the NPCs are adventurers (False by default)
+* filters - filters like those of generate_npcs(), lists of strings
+  narrowing the filters of the parent nodes; *_no values are added to
+  those of the parents and *_yes values of a child node replace those of
+  its parents but may only allow values the parents allow
+* mix - weights of ages, classes and races replacing the weights of the NPC
+  data, e.g. {'races': {'human': 6, 'halfling': 3}}; a mix of a section
+  replaces the mix of the parent nodes
+* children - list of child nodes
+
+Traits, adventurers, filters and mix are inherited by the child nodes.
+
+    city = {
+        'name': 'Waterdeep',
+        'mix': {'races': {'human': 6, 'dwarf (hill)': 2, 'elf (high)': 1}},
+        'children': [{
+            'name': 'Dock Ward',
+            'children': [{'name': 'household', 'count': 3000,
+                          'inhabitants': [1, 6]}],
+        }, ...],
+    }
+    for node in iter_settlement(city, seed=42):
+        print(node.path, len(node.npcs))
+
+The whole tree is planned before generating anything - nodes with the same
+filters and mix share the same prepared samplers so even thousands of
+households cost no more than generating their inhabitants. Each node gets
+its own random generator seeded from the seed and the node's path, so
+changing one district doesn't change the others.
+"""
+
+import random
+import sys
+from collections import namedtuple
+
+from loreroll.npc import (
+    _filter_string_data,
+    _filter_structured_data,
+    _get_data,
+    _normalize_filters,
+    _prepare_data,
+    generate_npc,
+    QUOTA_FILTERS,
+)
+from loreroll.rng import derive_seed
+from loreroll.sampling import WeightedSampler
+
+
+# Keys of settlement nodes.
+NODE_KEYS = ('name', 'inhabitants', 'count', 'traits', 'adventurers',
+             'filters', 'mix', 'children')
+# Mix sections mapped to sections of the NPC data and filter names.
+MIX_SECTIONS = {
+    'ages': ('age', 'ages'),
+    'classes': ('classes', 'classes'),
+    'races': ('races', 'races'),
+}
+
+# Filter names mapped to sections of the NPC data.
+FILTER_SECTIONS = {
+    filter_name: data_section
+    for data_section, filter_name in MIX_SECTIONS.values()
+}
+
+SettlementNode = namedtuple('SettlementNode', ['path', 'npcs'])
+_Plan = namedtuple('_Plan', ['path', 'inhabitants', 'traits', 'samplers'])
+
+
+class SettlementError(Exception):
+    """Raised for invalid settlement specifications."""
+
+
+def _check_node(node, path):
+    """Check keys and values of a settlement node at the given path."""
+    def fail(message):
+        raise SettlementError(f'{"/".join(path)}: {message}')
+
+    unknown = set(node) - set(NODE_KEYS)
+    if unknown:
+        fail(f'unknown keys {", ".join(sorted(unknown))}')
+    inhabitants = node.get('inhabitants', 0)
+    if isinstance(inhabitants, int):
+        inhabitants = [inhabitants, inhabitants]
+    if (not isinstance(inhabitants, (list, tuple)) or len(inhabitants) != 2
+            or not all(isinstance(value, int) for value in inhabitants)
+            or not 0 <= inhabitants[0] <= inhabitants[1]):
+        fail('inhabitants must be a number or a [minimum, maximum] range')
+    for key in ('count', 'traits'):
+        if not isinstance(node.get(key, 0), int) or node.get(key, 0) < 0:
+            fail(f'{key} must be a non-negative number')
+    if not isinstance(node.get('adventurers', False), bool):
+        fail('adventurers must be true or false')
+    if not isinstance(node.get('filters', {}), dict):
+        fail('filters must be a mapping')
+    if set(node.get('filters', {})) & set(QUOTA_FILTERS):
+        fail('quotas are not supported, use mix instead')
+    if not all(isinstance(values, list)
+               and all(isinstance(value, str) for value in values)
+               for values in node.get('filters', {}).values()):
+        fail('filter values must be lists of strings')
+    if not isinstance(node.get('children', []), list):
+        fail('children must be a list')
+
+    mix = node.get('mix', {})
+    if not isinstance(mix, dict) or not all(
+            isinstance(weights, dict) for weights in mix.values()):
+        fail('mix must be a mapping of sections to mappings of weights')
+    unknown = set(mix) - set(MIX_SECTIONS)
+    if unknown:
+        fail(f'unknown mix sections {", ".join(sorted(unknown))}')
+    if any(not isinstance(weight, (int, float)) or weight < 0
+           for weights in mix.values() for weight in weights.values()):
+        fail('mix weights must be non-negative numbers')
+
+
+def _mix_sampler(data, section, mix, filters, path):
+    """Return sampler of the mixed values of the section passing filters."""
+    data_section, filter_name = MIX_SECTIONS[section]
+    known = {
+        item['v'] if isinstance(item, dict) else item
+        for item in data[data_section]
+    }
+    unknown = set(mix) - known
+    if unknown:
+        raise SettlementError(f'{"/".join(path)}: unknown {section} in the '
+                              f'mix: {", ".join(sorted(unknown))}')
+    items = _filter_structured_data(
+        [{'v': value, 'w': weight} for value, weight in mix.items()],
+        filters.get(f'{filter_name}_yes'), filters.get(f'{filter_name}_no')
+    )
+    return WeightedSampler(items)
+
+
+class _Planner:
+    """Resolves settlement nodes into generation plans.
+
+    Samplers are prepared once per distinct combination of filters, mix and
+    adventurers and shared by all the nodes using it.
+    """
+
+    def __init__(self, data):
+        self.data = _get_data(data)
+        self._samplers = {}
+
+    def samplers(self, filters, mix, adventurers, path):
+        """Return (ages, classes, races) samplers for generate_npc()."""
+        key = (_normalize_filters(filters),
+               tuple(sorted((section, tuple(sorted(weights.items())))
+                            for section, weights in mix.items())),
+               adventurers)
+        if key in self._samplers:
+            return self._samplers[key]
+
+        ages, classes, races = _prepare_data(filters, adventurers, self.data)
+        if 'ages' in mix:
+            ages = _mix_sampler(self.data, 'ages', mix['ages'], filters,
+                                path)
+        if 'races' in mix:
+            races = _mix_sampler(self.data, 'races', mix['races'], filters,
+                                 path)
+        if adventurers and 'classes' in mix:
+            classes = _mix_sampler(self.data, 'classes', mix['classes'],
+                                   filters, path)
+
+        for section, sampler in (('ages', ages), ('races', races),
+                                 ('classes', classes)):
+            if not sampler and (section != 'classes' or adventurers):
+                raise SettlementError(f'{"/".join(path)}: no {section} left '
+                                      f'after applying filters and mix')
+            if (section in mix and sampler
+                    and (section != 'classes' or adventurers)
+                    and sampler.cum_weights[-1] <= 0):
+                raise SettlementError(f'{"/".join(path)}: all {section} '
+                                      f'left after applying filters have '
+                                      f'zero weight in the mix')
+        self._samplers[key] = (ages, classes, races)
+        return self._samplers[key]
+
+    def filters(self, inherited, own, path):
+        """Return the node's own filters merged with the inherited ones.
+
+        Disallowed values are added to the inherited ones. Allowed values
+        replace the inherited ones, SettlementError is raised if they allow
+        any value of the NPC data the inherited ones don't.
+        """
+        filters = dict(inherited)
+        for key, values in own.items():
+            if not key.endswith('_yes'):
+                filters[key] = [*filters.get(key, ()), *values]
+                continue
+            section = FILTER_SECTIONS.get(key[:-len('_yes')])
+            if section is not None and inherited.get(key):
+                data_values = [
+                    item['v'] if isinstance(item, dict) else item
+                    for item in self.data[section]
+                ]
+                widened = (
+                    set(_filter_string_data(data_values, values))
+                    - set(_filter_string_data(data_values, inherited[key]))
+                )
+                if widened:
+                    raise SettlementError(
+                        f'{"/".join(path)}: {key} allows '
+                        f'{", ".join(sorted(widened))} not allowed by the '
+                        f'parent nodes'
+                    )
+            filters[key] = list(values)
+        return filters
+
+    def plan(self, node, path=(), inherited=None):
+        """Yield plans of the node and all its descendants."""
+        inherited = inherited or {
+            'traits': 2, 'adventurers': False, 'filters': {}, 'mix': {},
+        }
+        if not isinstance(node, dict):
+            raise SettlementError(f'{"/".join(path)}: nodes must be mappings')
+        name = str(node.get('name', 'settlement'))
+        _check_node(node, path + (name,))
+
+        filters = self.filters(inherited['filters'], node.get('filters', {}),
+                               path + (name,))
+        settings = {
+            'traits': node.get('traits', inherited['traits']),
+            'adventurers': bool(node.get('adventurers',
+                                         inherited['adventurers'])),
+            'filters': filters,
+            'mix': {**inherited['mix'], **node.get('mix', {})},
+        }
+        samplers = self.samplers(settings['filters'], settings['mix'],
+                                 settings['adventurers'], path + (name,))
+
+        for number in range(1, node.get('count', 1) + 1):
+            node_path = path + (
+                f'{name} {number}' if 'count' in node else name,
+            )
+            yield _Plan(node_path, node.get('inhabitants', 0),
+                        settings['traits'], samplers)
+            for child in node.get('children', ()):
+                yield from self.plan(child, node_path, settings)
+
+
+def plan_settlement(spec, data=None):
+    """Check the settlement specification and plan its generation.
+
+    Returns a list of plans of all the nodes in the depth-first order.
+    Sibling nodes need distinct names (nodes without a name are all named
+    'settlement').
+    SettlementError is raised for invalid specifications so nothing is
+    generated unless the whole settlement can be.
+    """
+    plans = list(_Planner(data).plan(spec))
+    # Nodes are seeded and reported by their paths which must be unique.
+    paths = set()
+    for plan in plans:
+        if plan.path in paths:
+            raise SettlementError(f'{"/".join(plan.path)}: more than one '
+                                  f'node with the same path, give sibling '
+                                  f'nodes distinct names or use count')
+        paths.add(plan.path)
+    return plans
+
+
+def iter_settlement(spec, seed=None, data=None):
+    """Generate NPCs of a settlement, yield them node by node.
+
+    Spec is the root node of the settlement (see the module description).
+    Yields a SettlementNode for each node in the depth-first order - its
+    path (tuple of names from the root) and list of the node's own NPCs.
+    If seed is None, it is drawn from the random module.
+
+    Data is the DataProvider to take the NPC data from, see generate_npc().
+    """
+    if seed is None:
+        seed = random.randrange(sys.maxsize)  # nosec
+    plans = plan_settlement(spec, data)
+    rng = random.Random()  # nosec
+    for plan in plans:
+        rng.seed(derive_seed(seed, *plan.path))
+        inhabitants = plan.inhabitants
+        if not isinstance(inhabitants, int):
+            inhabitants = rng.randint(*inhabitants)
+        yield SettlementNode(plan.path, [
+            generate_npc(plan.traits, *plan.samplers, rng, data)
+            for _ in range(inhabitants)
+        ])
+
+
+def generate_settlement(spec, seed=None, data=None):
+    """Generate NPCs of a settlement, return dictionary of paths and NPCs.
+
+    See iter_settlement() for the parameters.
+    """
+    return {
+        node.path: node.npcs for node in iter_settlement(spec, seed, data)
+    }
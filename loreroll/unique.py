@@ -0,0 +1,292 @@
+"""Generating distinct NPCs.
+
+Every NPC field is drawn independently from a small vocabulary so large
+populations contain duplicates - NPCs with the same name, age, race,
+class and traits. iter_unique_npcs() redraws such duplicates:
+
+    report = space_report(1000000)
+    print(f'{report.fill:.2%} of all the possible NPCs requested')
+    npcs = generate_unique_npcs(1000000, rng=random.Random(42))
+
+Generated NPCs are remembered only as 64-bit fingerprints. Up to
+FINGERPRINT_SET_LIMIT NPCs, the fingerprints are kept in a set (some 60
+bytes per NPC), larger numbers use a Bloom filter of about two bytes per
+NPC instead. The Bloom filter never lets a duplicate through but may take
+a new NPC for a duplicate now and then (see BLOOM_ERROR_RATE) which only
+costs a redraw. Both have a fixed capacity so memory use is bounded even
+when generating endlessly - UniquenessError is raised once it's reached.
+
+The more of the combination space is requested the more redraws are
+needed, space_report() tells how close a request is to exhausting it.
+"""
+
+import hashlib
+import math
+from collections import namedtuple
+
+from loreroll import profiling
+from loreroll.npc import (
+    _get_data,
+    _get_rng,
+    _has_quotas,
+    _prepare_data,
+    _trait_samplers,
+    generate_npc,
+)
+
+
+# Largest number of NPCs whose fingerprints are kept in a set.
+FINGERPRINT_SET_LIMIT = 1000000
+# Probability of taking a new NPC for a duplicate in a full Bloom filter.
+BLOOM_ERROR_RATE = 0.001
+# Capacity of the Bloom filter for endless generation (about 18 MB).
+ENDLESS_CAPACITY = 10000000
+# Number of duplicates in a row after which generation gives up.
+MAX_REDRAWS = 1000
+
+SpaceReport = namedtuple(
+    'SpaceReport', ['combinations', 'requested', 'fill', 'expected_draws']
+)
+
+
+class UniquenessError(Exception):
+    """Raised when no more distinct NPCs can be generated."""
+
+
+def fingerprint(npc):
+    """Return a 64-bit fingerprint of the NPC.
+
+    The order of traits doesn't matter, NPCs with the same traits in
+    a different order have the same fingerprint.
+    """
+    key = '\x1f'.join((
+        npc.name, npc.age, npc.race, npc.class_ or '',
+        '\x1e'.join(sorted(npc.physical)),
+        '\x1e'.join(sorted(npc.personality)),
+    ))
+    return int.from_bytes(
+        hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little'
+    )
+
+
+class FingerprintSet:
+    """Exact set of up to capacity NPC fingerprints."""
+
+    def __init__(self, capacity=FINGERPRINT_SET_LIMIT):
+        self.capacity = capacity
+        self._fingerprints = set()
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def add(self, value):
+        """Add the fingerprint, return False if it was already present.
+
+        UniquenessError is raised if a new fingerprint doesn't fit.
+        """
+        if value in self._fingerprints:
+            return False
+        if len(self._fingerprints) >= self.capacity:
+            raise UniquenessError(f'Capacity of {self.capacity} NPCs '
+                                  f'reached')
+        self._fingerprints.add(value)
+        return True
+
+
+class BloomFilter:
+    """Bloom filter of NPC fingerprints with a fixed size.
+
+    The filter is sized for the given capacity and error rate - the
+    probability of reporting a new fingerprint as present once the filter
+    holds capacity fingerprints.
+    """
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError('Capacity must be positive and error rate '
+                             'between 0 and 1')
+        self.capacity = capacity
+        self.size = math.ceil(-capacity * math.log(error_rate)
+                              / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, value):
+        """Add the fingerprint, return False if it (probably) was present.
+
+        UniquenessError is raised if a new fingerprint doesn't fit.
+        """
+        # Double hashing - the positions are derived from the two halves.
+        first, step = value & 0xffffffff, value >> 32 | 1
+        bits, size = self._bits, self.size
+        new = False
+        for number in range(self.hashes):
+            position = (first + number * step) % size
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                if not new and self._count >= self.capacity:
+                    raise UniquenessError(f'Capacity of {self.capacity} '
+                                          f'NPCs reached')
+                bits[position >> 3] |= mask
+                new = True
+        self._count += new
+        return new
+
+
+def fingerprint_filter(number):
+    """Return a fingerprint set or filter suitable for the number of NPCs.
+
+    Endless generation (number is None) gets a Bloom filter of
+    ENDLESS_CAPACITY NPCs.
+    """
+    if number is None:
+        return BloomFilter(ENDLESS_CAPACITY)
+    if number <= FINGERPRINT_SET_LIMIT:
+        return FingerprintSet(number)
+    return BloomFilter(number)
+
+
+def _distinct_values(sampler):
+    """Return the number of distinct values with a positive weight."""
+    weights = [
+        weight - previous for previous, weight
+        in zip([0.0] + sampler.cum_weights, sampler.cum_weights)
+    ]
+    return len({
+        value for value, weight in zip(sampler.values, weights) if weight > 0
+    })
+
+
+def _trait_combinations(sampler, traits):
+    """Return the number of distinct sets of traits the sampler draws."""
+    groups = {}
+    for value, group_id in zip(sampler.values, sampler.group_ids):
+        groups.setdefault(group_id, set()).add(value)
+    # Coefficients of the product of (1 + group size * x) over the groups,
+    # the coefficient of x^k is the number of sets of k traits.
+    coefficients = [1]
+    for values in groups.values():
+        coefficients = [
+            coefficient + len(values) * previous for coefficient, previous
+            in zip(coefficients + [0], [0] + coefficients)
+        ]
+    return coefficients[min(traits, len(groups))]
+
+
+def combination_space(traits=2, filters=None, generate_adventurers=True,
+                      data=None):
+    """Return the number of distinct NPCs that can be generated.
+
+    See generate_npcs() for the parameters.
+    """
+    data = _get_data(data)
+    ages, classes, races = _prepare_data(filters, generate_adventurers, data)
+    combinations = (len(set(data['names'])) * _distinct_values(ages)
+                    * _distinct_values(races))
+    if generate_adventurers:
+        # NPCs get no class if the filters leave none.
+        combinations *= max(1, len(set(classes)))
+    for sampler in _trait_samplers(data):
+        combinations *= _trait_combinations(sampler, traits)
+    return combinations
+
+
+def space_report(number, traits=2, filters=None, generate_adventurers=True,
+                 data=None):
+    """Report how much of the combination space the number of NPCs fills.
+
+    Returns a SpaceReport with the number of possible combinations, the
+    requested number, the fill ratio and the expected number of draws
+    needed to generate the number of distinct NPCs. The expectation assumes
+    all the combinations are equally likely, weighted ages and races need
+    more draws. Expected draws are infinite if the number exceeds the
+    combinations. See generate_npcs() for the other parameters.
+    """
+    combinations = combination_space(traits, filters, generate_adventurers,
+                                     data)
+    if number > combinations:
+        expected = math.inf
+    else:
+        # Coupon collector - drawing the k-th distinct NPC takes
+        # combinations / (combinations - k) draws on average.
+        expected = combinations * _harmonic_difference(
+            combinations, combinations - number
+        )
+    fill = number / combinations if combinations else math.inf
+    return SpaceReport(combinations, number, fill, expected)
+
+
+def _harmonic_difference(high, low):
+    """Return H(high) - H(low) of harmonic numbers, approximated if large."""
+    if low >= 1000:
+        return (math.log1p((high - low) / low) + 1 / (2 * high)
+                - 1 / (2 * low) - 1 / (12 * high ** 2) + 1 / (12 * low ** 2))
+    if high < 1000:
+        return math.fsum(1 / k for k in range(low + 1, high + 1))
+    return (_harmonic_difference(high, 1000)
+            + math.fsum(1 / k for k in range(low + 1, 1001)))
+
+
+def iter_unique_npcs(number=1, traits=2, filters=None,
+                     generate_adventurers=True, rng=None, data=None,
+                     seen=None):
+    """Generate distinct NPCs one by one.
+
+    Takes the same parameters as iter_npcs() except for the engine, quotas
+    are not supported. Duplicates of already generated NPCs are redrawn,
+    UniquenessError is raised when the number exceeds the combination space
+    (see space_report()), after MAX_REDRAWS duplicates in a row or when
+    the capacity of seen is reached.
+
+    Seen is the fingerprint set or filter to remember the NPCs in (see
+    fingerprint_filter()), pass the same one to several calls to keep the
+    NPCs of all of them distinct.
+    """
+    if _has_quotas(filters):
+        raise ValueError('Quotas are not supported by unique generation')
+    rng = _get_rng(rng)
+    if seen is None:
+        seen = fingerprint_filter(number)
+    if number is not None:
+        combinations = combination_space(traits, filters,
+                                         generate_adventurers, data)
+        if number > combinations:
+            raise UniquenessError(f'Only {combinations} distinct NPCs can be '
+                                  f'generated, {number} requested')
+    ages, classes, races = _prepare_data(filters, generate_adventurers, data)
+    return profiling.timed('generate', _iter_distinct(
+        number, lambda: generate_npc(traits, ages, classes, races, rng, data),
+        seen
+    ), 'npcs')
+
+
+def _iter_distinct(number, generate, seen):
+    """Yield number of NPCs from generate() not present in seen."""
+    generated, redraws = 0, 0
+    while number is None or generated < number:
+        npc = generate()
+        if seen.add(fingerprint(npc)):
+            generated, redraws = generated + 1, 0
+            yield npc
+            continue
+        profiling.count('duplicates redrawn')
+        redraws += 1
+        if redraws >= MAX_REDRAWS:
+            raise UniquenessError(f'No distinct NPC found in {redraws} '
+                                  f'draws after {generated} NPCs, the '
+                                  f'combination space is exhausted')
+
+
+def generate_unique_npcs(number=1, traits=2, filters=None,
+                         generate_adventurers=True, rng=None, data=None,
+                         seen=None):
+    """Generate a list of distinct NPCs.
+
+    See iter_unique_npcs() for the parameters.
+    """
+    return list(iter_unique_npcs(number, traits, filters,
+                                 generate_adventurers, rng, data, seen))
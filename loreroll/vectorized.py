@@ -0,0 +1,242 @@
+"""Vectorized bulk NPC generation.
+
+Generating NPCs one by one in Python is slow for very large numbers of
+NPCs. This module draws all the random indices at once as NumPy arrays and
+returns them column-wise; NPC tuples are only created when accessed.
+
+NumPy is an optional dependency (`pip install rollthelore[numpy]`), use
+available() to check whether the engine can be used.
+"""
+
+import random
+from collections.abc import Sequence
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from loreroll.npc import _get_data, _trait_samplers, NPC
+
+
+# Columns holding a single index per NPC.
+SCALAR_COLUMNS = ('name', 'age', 'race', 'class_')
+# Columns holding 'traits' indices per NPC.
+TRAIT_COLUMNS = ('physical', 'personality')
+
+
+def available():
+    """Check whether NumPy is available."""
+    return numpy is not None
+
+
+def _index_dtype(table):
+    """Return the smallest dtype able to index the given table."""
+    return numpy.uint16 if len(table) < 2 ** 16 else numpy.uint32
+
+
+class NPCColumns(Sequence):
+    """NPCs stored as columns of indices into string tables.
+
+    Tables map column names (see SCALAR_COLUMNS and TRAIT_COLUMNS) to lists
+    of strings, columns map the same names to NumPy index arrays. Trait
+    columns are two-dimensional with a row per NPC. Class index -1 means
+    there is no class (civilians).
+
+    Indexing returns NPC tuples, slicing returns another NPCColumns sharing
+    the same tables.
+    """
+
+    def __init__(self, tables, columns):
+        self.tables = tables
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['name'])
+
+    def __iter__(self):
+        # Converting whole columns to lists at once is much faster than
+        # indexing NumPy arrays NPC by NPC.
+        names, ages, races, classes, physical, personality = (
+            self.tables[key] for key in SCALAR_COLUMNS + TRAIT_COLUMNS
+        )
+        rows = zip(*(self.columns[key].tolist()
+                     for key in SCALAR_COLUMNS + TRAIT_COLUMNS))
+        for name, age, race, class_, physical_row, personality_row in rows:
+            yield NPC(
+                name=names[name],
+                age=ages[age],
+                race=races[race],
+                class_=classes[class_] if class_ >= 0 else None,
+                physical=[physical[i] for i in physical_row],
+                personality=[personality[i] for i in personality_row],
+            )
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return NPCColumns(
+                self.tables,
+                {key: column[index] for key, column in self.columns.items()}
+            )
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('NPC index out of range')
+
+        class_index = self.columns['class_'][index]
+        return NPC(
+            name=self.tables['name'][self.columns['name'][index]],
+            age=self.tables['age'][self.columns['age'][index]],
+            race=self.tables['race'][self.columns['race'][index]],
+            class_=(self.tables['class_'][class_index]
+                    if class_index >= 0 else None),
+            physical=[self.tables['physical'][i]
+                      for i in self.columns['physical'][index]],
+            personality=[self.tables['personality'][i]
+                         for i in self.columns['personality'][index]],
+        )
+
+
+def _weighted_indices(rng, sampler, number):
+    """Draw a number of weighted indices from the given WeightedSampler."""
+    if not sampler.values:
+        raise IndexError('Cannot choose from an empty data set')
+    cum_weights = numpy.asarray(sampler.cum_weights)
+    if cum_weights[-1] <= 0.0:
+        raise ValueError('Total of weights must be greater than zero')
+    indices = numpy.searchsorted(
+        cum_weights, rng.random(number) * cum_weights[-1], side='right'
+    )
+    numpy.minimum(indices, len(cum_weights) - 1, out=indices)
+    return indices.astype(_index_dtype(sampler.values))
+
+
+def _trait_indices(rng, sampler, number, traits):
+    """Draw trait indices for a number of NPCs from the TraitSampler.
+
+    Returns a two-dimensional array with a row of distinct non-conflicting
+    traits per NPC with the same distribution TraitSampler.sample_indices()
+    gives. Traits are drawn column by column, the (few) NPCs whose trait
+    conflicts with one of their previous traits draw it again.
+    """
+    traits = min(traits, sampler.group_count)
+    result = numpy.empty((number, traits),
+                         dtype=_index_dtype(sampler.values))
+    group_ids = numpy.asarray(sampler.group_ids, dtype=numpy.int64)
+    groups = numpy.empty((number, traits), dtype=numpy.int64)
+    for column in range(traits):
+        rows = numpy.arange(number)
+        while len(rows):
+            indices = rng.integers(len(sampler.values), size=len(rows),
+                                   dtype=result.dtype)
+            index_groups = group_ids[indices]
+            conflicts = (
+                groups[rows, :column] == index_groups[:, numpy.newaxis]
+            ).any(axis=1)
+            accepted = rows[~conflicts]
+            result[accepted, column] = indices[~conflicts]
+            groups[accepted, column] = index_groups[~conflicts]
+            rows = rows[conflicts]
+    return result
+
+
+def _numpy_rng(rng):
+    """Return a NumPy Generator for the given random generator.
+
+    NumPy Generators are returned unchanged, a new Generator is seeded from
+    a random.Random instance (or the random module if rng is None) so the
+    results are still determined by its seed.
+    """
+    if isinstance(rng, numpy.random.Generator):
+        return rng
+    if rng is None:
+        rng = random
+    return numpy.random.default_rng(rng.getrandbits(128))  # nosec
+
+
+def _tables(ages, classes, races, data):
+    """Return the string tables of NPCs drawn from the given samplers."""
+    return {
+        'name': [str(name) for name in data['names']],
+        'age': [str(age) for age in ages.values],
+        'race': [str(race) for race in races.values],
+        'class_': [str(class_) for class_ in classes],
+        'physical': [str(trait) for trait in data['physical']],
+        'personality': [str(trait) for trait in data['personality']],
+    }
+
+
+def _columns(number, traits, ages, classes, races, rng, tables, data):
+    """Draw the index columns of a number of NPCs."""
+    columns = {
+        'age': _weighted_indices(rng, ages, number),
+        'name': rng.integers(len(tables['name']), size=number,
+                             dtype=_index_dtype(tables['name'])),
+        'race': _weighted_indices(rng, races, number),
+    }
+    if classes:
+        columns['class_'] = rng.integers(len(classes), size=number,
+                                         dtype=numpy.int32)
+    else:
+        columns['class_'] = numpy.full(number, -1, dtype=numpy.int32)
+    for key, sampler in zip(TRAIT_COLUMNS, _trait_samplers(data)):
+        columns[key] = _trait_indices(rng, sampler, number, traits)
+    return columns
+
+
+def iter_npc_chunks(number, chunk_size, traits, ages, classes, races,
+                    rng=None, data=None):
+    """Generate NPCs in chunks of chunk_size NPCs.
+
+    Takes the same parameters as generate_npcs(), yields NPCColumns of
+    chunk_size NPCs (the last chunk may be smaller). If number is None,
+    chunks are generated endlessly.
+
+    All the chunks are drawn from the same NumPy Generator. The NPCs of a
+    seed depend on the chunk size, the whole chunks don't depend on the
+    number of NPCs.
+    """
+    rng = _numpy_rng(rng)
+    data = _get_data(data)
+    tables = _tables(ages, classes, races, data)
+
+    remaining = number
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size,
+                                                        remaining)
+        if remaining is not None:
+            remaining -= size
+        yield NPCColumns(tables, _columns(size, traits, ages, classes,
+                                          races, rng, tables, data))
+
+
+def generate_npcs(number, traits, ages, classes, races, rng=None,
+                  data=None, chunk_size=None):
+    """Generate a number of NPCs at once.
+
+    Ages and races need to be WeightedSampler instances, classes a sequence
+    of allowed classes (empty for civilians). The rng is either a NumPy
+    Generator or a random.Random instance to seed one from. If not given,
+    a Generator is seeded from the random module so the results are still
+    determined by random.seed(). Data is the DataProvider to take names and
+    traits from, NPC_DATA if None.
+
+    If chunk_size is given, the NPCs are drawn in chunks like
+    iter_npc_chunks() draws them so both give the same NPCs for the same
+    seed.
+
+    Returns NPCColumns.
+    """
+    if chunk_size is not None and number > chunk_size:
+        chunks = list(iter_npc_chunks(number, chunk_size, traits, ages,
+                                      classes, races, rng, data))
+        return NPCColumns(chunks[0].tables, {
+            key: numpy.concatenate([chunk.columns[key] for chunk in chunks])
+            for key in SCALAR_COLUMNS + TRAIT_COLUMNS
+        })
+
+    rng = _numpy_rng(rng)
+    data = _get_data(data)
+    tables = _tables(ages, classes, races, data)
+    return NPCColumns(tables, _columns(number, traits, ages, classes, races,
+                                       rng, tables, data))
@@ -2,90 +2,420 @@
 
 """Simple CLI tool for generating NPCs."""
 
+import itertools
+import json
+import os
 import random
 import sys
 
 import click
 
-from loreroll.npc import generate_name, generate_npcs
+from loreroll import profiling
+from loreroll.export import (
+    CSV_HEADER,
+    format_text as format_npc,
+    FORMATS,
+    iter_serialized,
+    LINE_FORMATTERS,
+    npc_to_dict,
+)
+from loreroll.npc import (
+    ENGINES,
+    iter_name_chunks,
+    iter_npc_range,
+    iter_npcs,
+    QUOTA_FILTERS,
+)
+
+
+# Defaults of loreroll.server, repeated here so that the server (and asyncio)
+# is only imported when serving.
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8053
+# Share of all the possible NPCs above which --unique warns.
+UNIQUE_WARNING_FILL = 0.1
 
 
 def print_npc(npc):
     """Print the given NPC."""
-    print(f'Name: {npc.name}')
-    print(f'Age: {npc.age}')
-    print(f'Race: {npc.race}')
-    if npc.class_:
-        print(f'Class: {npc.class_}')
-    if npc.physical:
-        print(f'Appearance: {", ".join(npc.physical)}')
-    if npc.personality:
-        print(f'Personality: {", ".join(npc.personality)}')
-    print()
+    print(format_npc(npc), end='')
+
+
+def write_output(chunks, binary=False):
+    """Write the given text (or binary) chunks to the standard output.
+
+    Chunks are written as they come so that even endless NPC streams can be
+    piped to other programs. Closing the pipe on the other end quietly ends
+    the output.
+    """
+    stream = sys.stdout.buffer if binary else sys.stdout
+    try:
+        stream.writelines(chunks)
+        stream.flush()
+    except BrokenPipeError:
+        # Python flushes standard output once more at exit, point it to
+        # devnull to avoid another BrokenPipeError.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+
+def format_settlement_node(node, format_):
+    """Return NPCs of the settlement node formatted as text or JSON lines."""
+    if format_ == 'jsonl':
+        return ''.join(
+            json.dumps({'location': list(node.path), **npc_to_dict(npc)},
+                       ensure_ascii=False) + '\n'
+            for npc in node.npcs
+        )
+    if not node.npcs:
+        return ''
+    return f'# {" / ".join(node.path)}\n\n' + ''.join(
+        map(format_npc, node.npcs)
+    )
+
+
+def parse_quota(ctx, param, values):
+    """Parse VALUE=SHARE quota options into a dictionary of fractions.
+
+    Shares are either fractions (0.4) or percentages (40%).
+    """
+    # pylint: disable=unused-argument
+    quota = {}
+    for option in values:
+        value, separator, share = option.rpartition('=')
+        try:
+            if not separator or not value:
+                raise ValueError
+            if share.endswith('%'):
+                quota[value] = float(share[:-1]) / 100
+            else:
+                quota[value] = float(share)
+        except ValueError as error:
+            raise click.BadParameter(
+                f'"{option}" is not in the VALUE=SHARE format, e.g. '
+                f'human=40%'
+            ) from error
+    return quota
+
+
+def check_options(engine, filters, format_, names_only, start, unique,
+                  unique_names, workers):
+    """Raise UsageError for options that can't be used together."""
+    if unique_names and not names_only:
+        raise click.UsageError('--unique-names can only be used with '
+                               '--names-only.')
+    if names_only and format_ != 'text':
+        raise click.UsageError('--names-only can only be used with the text '
+                               'format.')
+    if start is not None and (names_only or engine != 'python'):
+        raise click.UsageError('--start can only be used to generate NPCs '
+                               'by the python engine.')
+    quotas = any(filters.get(key) for key in QUOTA_FILTERS)
+    if quotas and (workers > 1 or start is not None):
+        raise click.UsageError('Quotas can not be used with --workers or '
+                               '--start.')
+    sequential = engine == 'python' and workers == 1 and start is None
+    if unique and (names_only or quotas or not sequential):
+        raise click.UsageError('--unique can only be used to generate NPCs '
+                               'by the python engine in a single process, '
+                               'without --start or quotas.')
+
+
+def unique_npcs(number, traits, filters, adventurers, rng, data):
+    """Generate distinct NPCs, warn if they nearly exhaust the possible ones.
+    """
+    # pylint: disable=import-outside-toplevel
+    from loreroll.unique import (
+        iter_unique_npcs,
+        space_report,
+        UniquenessError,
+    )
+
+    report = space_report(number, traits, filters, adventurers, data)
+    profiling.note('combinations', report.combinations)
+    if UNIQUE_WARNING_FILL < report.fill <= 1:
+        print(f'WARNING: {number} NPCs are {report.fill:.1%} of the '
+              f'{report.combinations} possible ones, expect about '
+              f'{report.expected_draws:,.0f} draws or fewer NPCs than '
+              f'requested.', file=sys.stderr)
+    try:
+        yield from iter_unique_npcs(number, traits, filters, adventurers,
+                                    rng, data)
+    except UniquenessError as error:
+        raise click.ClickException(str(error)) from error
+
+
+def check_first(npcs):
+    """Generate the first NPC to report invalid options before any output.
+
+    Filters leaving nothing to choose from are reported too. Returns an
+    iterator of all the NPCs.
+    """
+    try:
+        first = next(npcs)
+    except StopIteration:
+        return npcs
+    except (IndexError, ValueError) as error:
+        raise click.ClickException(str(error)) from error
+    return itertools.chain([first], npcs)
+
+
+def report_profile():
+    """Stop profiling and print the report to stderr."""
+    stats = profiling.disable()
+    if stats is not None:
+        print(f'\nProfile:\n{stats.report()}', end='', file=sys.stderr)
 
 
 # pylint: disable=too-many-arguments
-@click.command()
+@click.group(invoke_without_command=True)
 @click.option('--adventurers/--no-adventurers', default=True,
               help='Generate adventurers or civilians?')
 @click.option('--age-allowed', '-a', 'ages_yes', multiple=True,
               help='Allowed age(s).')
 @click.option('--age-disallowed', '-A', 'ages_no', multiple=True,
               help='Disallowed age(s).')
+@click.option('--age-quota', 'ages_quota', multiple=True,
+              callback=parse_quota, metavar='AGE=SHARE',
+              help='Exact share of NPCs of the given age, e.g. young=50%.')
 @click.option('--class-allowed', '-c', 'classes_yes', multiple=True,
               help='Allowed class(es).')
 @click.option('--class-disallowed', '-C', 'classes_no', multiple=True,
               help='Disallowed class(es).')
+@click.option('--class-quota', 'classes_quota', multiple=True,
+              callback=parse_quota, metavar='CLASS=SHARE',
+              help='Exact share of NPCs of the given class, e.g. bard=0.1.')
+@click.option('--data', 'data_files', multiple=True,
+              type=click.Path(exists=True, dir_okay=False),
+              help='YAML data file to add to (or replace parts of) the NPC '
+                   'data, e.g. homebrew races. May be repeated.')
+@click.option('--engine', type=click.Choice(ENGINES), default='python',
+              help='Generation engine, numpy is much faster for large '
+                   'numbers of NPCs.')
+@click.option('--format', '-f', 'format_',
+              type=click.Choice(('text',) + FORMATS), default='text',
+              help='Output format. Machine-readable formats are written '
+                   'without the seed message (it goes to stderr instead).')
 @click.option('--names-only', is_flag=True, default=False,
               help='Generate only NPC names')
 @click.option('--number', '-n', default=1,
               help='Number of NPCs to generate.')
+@click.option('--profile', is_flag=True, default=False,
+              help='Report time spent in the generation stages and other '
+                   'statistics to stderr.')
 @click.option('--race-allowed', '-r', 'races_yes', multiple=True,
               help='Allowed race(s).')
 @click.option('--race-disallowed', '-R', 'races_no', multiple=True,
               help='Disallowed race(s).')
+@click.option('--race-quota', 'races_quota', multiple=True,
+              callback=parse_quota, metavar='RACE=SHARE',
+              help='Exact share of NPCs of the given race, e.g. human=40%. '
+                   'Other races get the rest of the NPCs as usual. May be '
+                   'repeated.')
 @click.option('--seed', '-s', 'seed', default=None,
               help='Seed number used to generate NPCs. The same seed will '
                    'produce the same results.')
+@click.option('--start', type=click.IntRange(0), default=None,
+              help='Generate NPCs from the given index of the seed\'s NPC '
+                   'sequence. Each NPC then only depends on the seed and its '
+                   'index, regardless of the number of workers.')
 @click.option('--traits', '-t', 'traits', type=click.IntRange(0, 9),
               default=2, help='Number of traits generated.')
-def generate(adventurers, ages_yes, ages_no, classes_yes, classes_no,
-             names_only, number, races_yes, races_no, seed, traits):
-    """Generate 'number' of NPCs and print them."""
+@click.option('--unique', is_flag=True, default=False,
+              help='Generate distinct NPCs, redrawing NPCs with the same '
+                   'name, age, race, class and traits.')
+@click.option('--unique-names', is_flag=True, default=False,
+              help='Do not repeat names until all of them have been used '
+                   '(only with --names-only).')
+@click.option('--workers', '-w', 'workers', type=click.IntRange(1),
+              default=1, help='Number of worker processes. Parallel '
+                              'generation gives different results than a '
+                              'single process but they do not depend on the '
+                              'number of workers.')
+@click.pass_context
+def generate(ctx, adventurers, ages_yes, ages_no, ages_quota, classes_yes,
+             classes_no, classes_quota, data_files, engine, format_,
+             names_only, number, profile, races_yes, races_no, races_quota,
+             seed, start, traits, unique, unique_names, workers):
+    """Generate 'number' of NPCs and print them.
+
+    Use the 'serve' command to keep generating NPCs on request instead.
+    """
+    if ctx.invoked_subcommand is not None:
+        return
+
     filters = {
         'ages_no': ages_no,
+        'ages_quota': ages_quota,
         'ages_yes': ages_yes,
         'classes_no': classes_no,
+        'classes_quota': classes_quota,
         'classes_yes': classes_yes,
         'races_no': races_no,
+        'races_quota': races_quota,
         'races_yes': races_yes,
     }
+    check_options(engine, filters, format_, names_only, start, unique,
+                  unique_names, workers)
+
+    if profile:
+        profiling.enable()
+        ctx.call_on_close(report_profile)
+
+    data = None
+    if data_files:
+        # pylint: disable=import-outside-toplevel
+        from loreroll.datasets import DatasetError, layered_data
+
+        try:
+            data = layered_data(data_files).load()
+        except DatasetError as error:
+            raise click.ClickException(str(error)) from error
 
     # Seed properly - use either the value from command line or seed randomly.
     if seed is None:
         # String needed instead of int because command line options are also
         # strings.
         seed = str(random.randrange(sys.maxsize))  # nosec
-    random.seed(seed)
-    print(f"Seed used: '{seed}'. Run with '-s {seed}' to get the same "
-          f"result.\n")
+    rng = random.Random(seed)  # nosec
+    options = f'-s {seed}' if start is None else f'-s {seed} --start {start}'
+    print(f"Seed used: '{seed}'. Run with '{options}' to get the same "
+          f"result.\n", file=sys.stdout if format_ == 'text' else sys.stderr)
 
     if names_only:
-        for _ in range(number):
-            print(generate_name())
+        chunks = iter_name_chunks(number, unique_names, rng, data)
+        with profiling.stage('output'):
+            write_output('\n'.join(chunk) + '\n'
+                         for chunk in profiling.timed('generate', chunks))
+        profiling.count('names', number)
         return
 
-    npcs = generate_npcs(
-        number,
-        traits=traits,
-        filters=filters,
-        generate_adventurers=adventurers
-    )
+    if workers > 1:
+        # pylint: disable=import-outside-toplevel
+        from loreroll.parallel import iter_shards_parallel
 
-    for npc in npcs:
-        print_npc(npc)
+        # Let the workers format the NPCs unless the output is columnar.
+        formatter = LINE_FORMATTERS.get(format_)
+        shards = check_first(iter_shards_parallel(
+            number,
+            traits=traits,
+            filters=filters,
+            generate_adventurers=adventurers,
+            engine=engine,
+            seed=seed,
+            workers=workers,
+            formatter=formatter,
+            data_files=data_files,
+            start=start
+        ))
+        shards = profiling.timed('wait for workers', shards)
+        if formatter is not None:
+            if format_ == 'csv':
+                shards = itertools.chain([CSV_HEADER], shards)
+            with profiling.stage('output'):
+                write_output(shards)
+            return
+        npcs = itertools.chain.from_iterable(shards)
+    elif unique:
+        npcs = check_first(unique_npcs(number, traits, filters, adventurers,
+                                       rng, data))
+    elif start is not None:
+        npcs = check_first(iter_npc_range(
+            seed,
+            start,
+            start + number,
+            traits=traits,
+            filters=filters,
+            generate_adventurers=adventurers,
+            data=data
+        ))
+    else:
+        npcs = iter_npcs(
+            number,
+            traits=traits,
+            filters=filters,
+            generate_adventurers=adventurers,
+            engine=engine,
+            rng=rng,
+            data=data
+        )
+        npcs = check_first(npcs)
+
+    with profiling.stage('output'):
+        write_output(
+            profiling.timed('format', iter_serialized(npcs, format_)),
+            binary=format_ == 'columnar'
+        )
 # pylint: enable=too-many-arguments
 
 
+@generate.command()
+@click.option('--host', default=SERVER_HOST, show_default=True,
+              help='Host to listen on.')
+@click.option('--port', '-p', default=SERVER_PORT, show_default=True,
+              help='Port to listen on.')
+@click.option('--socket', 'path', type=click.Path(dir_okay=False),
+              help='Listen on the given Unix socket instead of a port.')
+@click.option('--watch', is_flag=True,
+              help='Reload the NPC data when the YAML data file changes.')
+def serve(host, port, path, watch):
+    """Generate NPCs on request.
+
+    Requests are HTTP GET requests to /npcs with the long options of this
+    tool as query parameters, e.g. /npcs?number=3&race-allowed=elf.
+    """
+    # pylint: disable=import-outside-toplevel
+    import asyncio
+
+    from loreroll import server
+
+    address = path if path is not None else f'http://{host}:{port}/npcs'
+    click.echo(f'Serving NPCs on {address}', err=True)
+    try:
+        asyncio.run(server.serve(host, port, path, watch))
+    except KeyboardInterrupt:
+        pass
+
+
+@generate.command()
+@click.argument('spec_file', type=click.File('r', encoding='utf-8'))
+@click.option('--data', 'data_files', multiple=True,
+              type=click.Path(exists=True, dir_okay=False),
+              help='YAML data file to add to (or replace parts of) the NPC '
+                   'data. May be repeated.')
+@click.option('--format', '-f', 'format_',
+              type=click.Choice(('text', 'jsonl')), default='text',
+              help='Output format, JSON lines have the location of each NPC.')
+@click.option('--seed', '-s', 'seed', default=None,
+              help='Seed used to generate the settlement.')
+def settlement(spec_file, data_files, format_, seed):
+    """Generate inhabitants of a settlement described in SPEC_FILE.
+
+    SPEC_FILE is a JSON file with a tree of settlement nodes - e.g. a town
+    with districts and households, see loreroll.settlement for details.
+    """
+    # pylint: disable=import-outside-toplevel
+    from loreroll.datasets import DatasetError, layered_data
+    from loreroll.settlement import iter_settlement, SettlementError
+
+    try:
+        spec = json.load(spec_file)
+        data = layered_data(data_files).load() if data_files else None
+        if seed is None:
+            seed = str(random.randrange(sys.maxsize))  # nosec
+        nodes = iter_settlement(spec, seed, data)
+        # Plan the whole settlement first to report errors before any output.
+        first = next(nodes, None)
+    except (ValueError, DatasetError, SettlementError) as error:
+        raise click.ClickException(str(error)) from error
+
+    click.echo(f"Seed used: '{seed}'. Run with '-s {seed}' to get the same "
+               f"result.\n", err=format_ != 'text')
+    if first is not None:
+        nodes = itertools.chain([first], nodes)
+        write_output(format_settlement_node(node, format_) for node in nodes)
+
+
 if __name__ == '__main__':
     generate()  # pylint: disable=no-value-for-parameter
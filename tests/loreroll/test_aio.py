@@ -0,0 +1,93 @@
+"""Tests for aio.py"""
+
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from loreroll.aio import agenerate_npcs, aiter_npc_batches, aiter_npcs
+from loreroll.npc import generate_npcs
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """Thread pool counting the submitted jobs."""
+
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+@pytest.mark.parametrize('batch_size', [1, 7, 256])
+def test_agenerate_npcs(batch_size):
+    """Test that async generation gives the same NPCs as generate_npcs()."""
+    expected = generate_npcs(100, rng=random.Random(1))
+    with ThreadPoolExecutor() as executor:
+        for pool in (None, executor):
+            npcs = asyncio.run(agenerate_npcs(
+                100, rng=random.Random(1), batch_size=batch_size,
+                executor=pool
+            ))
+            assert npcs == expected
+
+
+def test_aiter_npcs_concurrent():
+    """Test that concurrent iterations interleave and don't interfere."""
+    events = []
+
+    async def consume(seed):
+        npcs = []
+        async for npc in aiter_npcs(50, rng=random.Random(seed),
+                                    batch_size=10):
+            events.append(seed)
+            npcs.append(npc)
+        return npcs
+
+    async def run():
+        return await asyncio.gather(consume(1), consume(2))
+
+    first, second = asyncio.run(run())
+    assert first == generate_npcs(50, rng=random.Random(1))
+    assert second == generate_npcs(50, rng=random.Random(2))
+    # Each iteration yields control after every batch.
+    assert events[:20] == [1] * 10 + [2] * 10
+
+
+def test_aiter_npc_batches_backpressure():
+    """Test that a slow consumer stops the generation in the executor."""
+    async def run(executor):
+        batches = aiter_npc_batches(None, batch_size=10, executor=executor,
+                                    prefetch=2)
+        consumed = []
+        async for batch in batches:
+            consumed.append(batch)
+            await asyncio.sleep(0.01)
+            if len(consumed) == 5:
+                break
+        await batches.aclose()
+        return consumed
+
+    with CountingExecutor() as executor:
+        consumed = asyncio.run(run(executor))
+    assert [len(batch) for batch in consumed] == [10] * 5
+    # Consumed batches, the full queue and the batch waiting to be queued.
+    assert executor.submitted <= 5 + 2 + 1
+
+
+def test_aiter_npcs_errors():
+    """Test that generation errors are raised to the consumer."""
+    async def run(**kwargs):
+        async for _ in aiter_npcs(10, filters={'races_yes': ['unicorn']},
+                                  **kwargs):
+            pass
+
+    with ThreadPoolExecutor() as executor:
+        for pool in (None, executor):
+            with pytest.raises(IndexError):
+                asyncio.run(run(executor=pool))
+    with pytest.raises(ValueError):
+        asyncio.run(run(batch_size=0))
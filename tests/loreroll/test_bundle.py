@@ -0,0 +1,150 @@
+"""Tests for bundle.py"""
+
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from loreroll import bundle as bundle_module, npc, profiling
+from loreroll.__main__ import cli
+from loreroll.bundle import (
+    Bundle,
+    BundleError,
+    compile_bundle,
+    MTIME_TOLERANCE_NS,
+    read_bundle,
+)
+from loreroll.npc import (
+    _parse_yaml,
+    _read_data,
+    NPC_BUNDLE_FILENAME,
+    NPC_FILENAME,
+)
+
+
+DATA = {
+    'races': [{'v': 'elf', 'w': 0.5}, {'v': 'dwarf', 'w': 2}],
+    'names': ['Frodo', 'Éowyn', ''],
+    'classes': [],
+    'physical_exclusive': [['fat', 'slim'], [], ['tall', 'short', 'tiny']],
+}
+
+
+@pytest.fixture
+def yaml_file(tmp_path):
+    """Create a fake YAML source file."""
+    path = tmp_path / 'npc.yaml'
+    path.write_text('fake YAML data')
+    return path
+
+
+def test_round_trip(tmp_path, yaml_file):
+    """Test that compiled data are read back unchanged."""
+    bundle_path = tmp_path / 'npc.bin'
+    compile_bundle(DATA, bundle_path, yaml_file)
+
+    bundle = read_bundle(bundle_path)
+    assert isinstance(bundle, Bundle)
+    assert dict(bundle) == {
+        'races': [{'v': 'elf', 'w': 0.5}, {'v': 'dwarf', 'w': 2.0}],
+        'names': ['Frodo', 'Éowyn', ''],
+        'classes': [],
+        'physical_exclusive': [['fat', 'slim'], [],
+                               ['tall', 'short', 'tiny']],
+    }
+    assert list(bundle.weights('races')) == [0.5, 2.0]
+    assert bundle.strings('races') == ['elf', 'dwarf']
+    assert bundle.strings('physical_exclusive') == [
+        'fat', 'slim', 'tall', 'short', 'tiny'
+    ]
+    with pytest.raises(BundleError):
+        bundle.weights('names')
+    bundle.close()
+
+
+def test_is_compiled_from(tmp_path, yaml_file, monkeypatch):
+    """Test detection of stale bundles."""
+    bundle_path = tmp_path / 'npc.bin'
+    compile_bundle(DATA, bundle_path, yaml_file)
+    bundle = read_bundle(bundle_path)
+    assert bundle.is_compiled_from(yaml_file, verify=True)
+
+    # The YAML file isn't read unless verifying
+    with monkeypatch.context() as patch:
+        patch.setattr(bundle_module, '_yaml_fingerprint', None)
+        assert bundle.is_compiled_from(yaml_file)
+
+    # Written anew shortly after the bundle (checkout, installation)
+    later = bundle.mtime_ns + MTIME_TOLERANCE_NS // 2
+    os.utime(yaml_file, ns=(later, later))
+    assert bundle.is_compiled_from(yaml_file)
+
+    # Same size, different contents, modified after the bundle
+    yaml_file.write_text('fake YAML date')
+    later = bundle.mtime_ns + 2 * MTIME_TOLERANCE_NS
+    os.utime(yaml_file, ns=(later, later))
+    assert not bundle.is_compiled_from(yaml_file)
+
+    # Same size, different contents, only caught by verifying
+    os.utime(yaml_file, ns=(bundle.mtime_ns, bundle.mtime_ns))
+    assert bundle.is_compiled_from(yaml_file)
+    assert not bundle.is_compiled_from(yaml_file, verify=True)
+
+    # Different size
+    yaml_file.write_text('new fake YAML data')
+    os.utime(yaml_file, ns=(bundle.mtime_ns, bundle.mtime_ns))
+    assert not bundle.is_compiled_from(yaml_file)
+
+
+def test_verify_data(tmp_path, yaml_file):
+    """Test verifying a data bundle from the command line."""
+    bundle_path = tmp_path / 'npc.bin'
+    compile_bundle(DATA, bundle_path, yaml_file)
+    args = ['verify-data', '--source', str(yaml_file), '-b', str(bundle_path)]
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0
+    assert 'is up to date' in result.output
+
+    yaml_file.write_text('fake YAML date')
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code != 0
+    assert 'is out of date' in result.output
+
+
+def test_invalid_bundles(tmp_path, yaml_file):
+    """Test that invalid bundles are rejected."""
+    bundle_path = tmp_path / 'npc.bin'
+    for contents in (b'', b'RTLB', b'X' * 1024):
+        bundle_path.write_bytes(contents)
+        with pytest.raises(BundleError):
+            read_bundle(bundle_path)
+
+    with pytest.raises(BundleError):
+        compile_bundle({'names': [1, {'v': 'x'}]}, bundle_path, yaml_file)
+
+
+def test_shipped_bundle_is_up_to_date():
+    """Test that the shipped bundle matches the shipped YAML data."""
+    bundle = read_bundle(NPC_BUNDLE_FILENAME)
+    assert bundle.is_compiled_from(NPC_FILENAME, verify=True)
+    assert dict(bundle) == _parse_yaml(NPC_FILENAME)
+
+
+def test_load_detects_same_size_edit(monkeypatch, tmp_path, capsys):
+    """Test that an edit keeping the YAML file size isn't loaded stale."""
+    yaml_path = tmp_path / 'npc.yaml'
+    with open(NPC_FILENAME, encoding='utf-8') as source:
+        contents = source.read()
+    edited = contents.replace('- v: human\n  w: 2\n', '- v: human\n  w: 0\n')
+    assert len(edited) == len(contents) and edited != contents
+    yaml_path.write_text(edited, encoding='utf-8')
+    # Edited well after the bundle has been compiled
+    edited_ns = (os.stat(NPC_BUNDLE_FILENAME).st_mtime_ns
+                 + 2 * MTIME_TOLERANCE_NS)
+    os.utime(yaml_path, ns=(edited_ns, edited_ns))
+    monkeypatch.setattr(npc, 'NPC_FILENAME', str(yaml_path))
+    with profiling.profile() as stats:
+        data = _read_data()
+    assert stats.notes['data source'].startswith('YAML')
+    assert 'out of date' in capsys.readouterr().err
+    assert {'v': 'human', 'w': 0.0} in data['races']
@@ -0,0 +1,122 @@
+"""Tests for datasets.py"""
+
+import pytest
+
+from loreroll import datasets
+from loreroll.bundle import Bundle
+from loreroll.datasets import (
+    DatasetError,
+    get_dataset,
+    layered_data,
+    merge_layers,
+    register_dataset,
+)
+from loreroll.npc import generate_npcs, NPC_DATA
+
+
+HOMEBREW_YAML = '''\
+races:
+- v: kender
+  w: 5
+- v: elf (high)
+  w: 0
+
+physical:
+- glowing skin
+- dull skin
+
+physical_exclusive:
+- - glowing skin
+  - dull skin
+'''
+
+SETTING_YAML = '''\
+replace:
+- names
+names:
+- Geralt
+- Yennefer
+'''
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    """Use a temporary cache directory."""
+    path = tmp_path / 'cache'
+    monkeypatch.setenv('ROLLTHELORE_CACHE_DIR', str(path))
+    return path
+
+
+@pytest.fixture
+def layers(tmp_path):
+    """Create layer YAML files."""
+    homebrew = tmp_path / 'homebrew.yaml'
+    homebrew.write_text(HOMEBREW_YAML, encoding='utf-8')
+    setting = tmp_path / 'setting.yaml'
+    setting.write_text(SETTING_YAML, encoding='utf-8')
+    return homebrew, setting
+
+
+def test_merge_layers(layers):
+    """Test merging layers into the package data."""
+    data = merge_layers(layers)
+    races = {race['v']: race['w'] for race in data['races']}
+    assert races['kender'] == 5
+    assert races['elf (high)'] == 0
+    assert len(races) == len(NPC_DATA['races']) + 1
+    assert data['physical'] == [*NPC_DATA['physical'], 'glowing skin',
+                                'dull skin']
+    assert data['physical_exclusive'][-1] == ['glowing skin', 'dull skin']
+    assert data['names'] == ['Geralt', 'Yennefer']
+    assert data['classes'] == NPC_DATA['classes']
+
+
+def test_merge_layers_invalid(tmp_path, layers):
+    """Test that invalid layers are refused."""
+    invalid = tmp_path / 'invalid.yaml'
+    invalid.write_text('replace:\n- dragons\n', encoding='utf-8')
+    with pytest.raises(DatasetError, match='dragons'):
+        merge_layers([invalid])
+    invalid.write_text('names:\n- Frodo: Baggins\n', encoding='utf-8')
+    with pytest.raises(DatasetError, match='invalid.yaml'):
+        merge_layers([invalid])
+    # The skin traits would be in two groups
+    with pytest.raises(DatasetError, match='skin'):
+        merge_layers([layers[0], layers[0]])
+
+
+def test_layered_data(cache, layers):
+    """Test that layered data are cached and shared."""
+    data = layered_data(layers)
+    assert layered_data([str(path) for path in layers]) is data
+    assert layered_data([]) is NPC_DATA
+    for npc in generate_npcs(20, data=data,
+                             filters={'races_no': ['human']}):
+        assert npc.name in ('Geralt', 'Yennefer')
+        assert 'elf (high)' != npc.race
+        assert not {'glowing skin', 'dull skin'} <= set(npc.physical)
+    assert len(list(cache.iterdir())) == 1
+
+    # A new provider reads the cached bundle
+    # pylint: disable=protected-access
+    data_layers = tuple(str(path) for path in layers)
+    cached = datasets.DataProvider(
+        lambda: datasets._load_layers(data_layers)
+    )
+    assert isinstance(cached.load()._source, Bundle)
+    assert dict(cached) == dict(data)
+
+
+def test_registry(layers):
+    """Test registering data sets."""
+    register_dataset('homebrew', layers[:1])
+    register_dataset('setting', layers[1:], base='homebrew')
+    assert {'default', 'homebrew', 'setting'} <= set(datasets.datasets())
+    assert get_dataset() is NPC_DATA
+    assert get_dataset('setting') is layered_data(layers)
+    with pytest.raises(DatasetError):
+        get_dataset('dragonlance')
+    with pytest.raises(DatasetError):
+        register_dataset('missing', ['missing.yaml'])
+    with pytest.raises(DatasetError):
+        register_dataset('default', layers)
@@ -0,0 +1,72 @@
+"""Tests for export.py"""
+
+import io
+import random
+
+import pytest
+
+from loreroll.export import (
+    ExportError,
+    FORMATS,
+    read_columnar,
+    read_npcs,
+    write_columnar,
+    write_npcs,
+)
+from loreroll.npc import generate_npcs, NPC
+from loreroll.population import Population
+
+
+NPCS = [
+    NPC('Sirius', 'old', 'dwarf (hill)', 'barbarian',
+        ['spots', 'hook instead of a hand'], ['funny', 'rude']),
+    NPC('Yve', 'very old', 'aasimar', None, ['tall'], []),
+    NPC('Quoted, "Name"', 'young', 'elf', 'bard', [], ['new\nline']),
+    NPC('Žofie', 'adult', 'human', None, [], []),
+]
+
+
+def _round_trip(npcs, format_, chunk_size=3):
+    """Write and read back the NPCs in the given format."""
+    if format_ == 'columnar':
+        stream = io.BytesIO()
+    else:
+        stream = io.StringIO(newline='')
+    write_npcs(npcs, stream, format_, chunk_size)
+    stream.seek(0)
+    return list(read_npcs(stream, format_))
+
+
+@pytest.mark.parametrize('format_', FORMATS)
+def test_round_trip(format_):
+    """Test that NPCs are read back unchanged."""
+    assert _round_trip(NPCS, format_) == NPCS
+    assert not _round_trip([], format_)
+
+    npcs = generate_npcs(100, traits=3, rng=random.Random(1))
+    npcs += generate_npcs(100, traits=0, generate_adventurers=False,
+                          rng=random.Random(2))
+    assert _round_trip(npcs, format_, chunk_size=64) == npcs
+
+
+def test_read_columnar():
+    """Test that columnar data are read into a Population."""
+    stream = io.BytesIO()
+    write_columnar(NPCS * 10, stream, chunk_size=7)
+    stream.seek(0)
+    population = read_columnar(stream)
+    assert isinstance(population, Population)
+    assert list(population) == NPCS * 10
+    # Dictionaries of all the row groups are merged.
+    assert len(population.tables['name']) == len(NPCS)
+
+
+def test_read_columnar_invalid():
+    """Test that invalid columnar data are refused."""
+    stream = io.BytesIO()
+    write_columnar(NPCS, stream)
+    data = stream.getvalue()
+    for invalid in (b'', b'XXXX\x01\x00', data[:4] + b'\x09\x00' + data[6:],
+                    data[:-1], data + b'\x01'):
+        with pytest.raises(ExportError):
+            read_columnar(io.BytesIO(invalid))
@@ -0,0 +1,104 @@
+"""Tests for fastyaml.py"""
+
+import pytest
+from strictyaml import load, YAMLValidationError
+
+from loreroll import fastyaml
+from loreroll.npc import (
+    _load_yaml,
+    _strict_schema,
+    NPC_FILENAME,
+    OPTIONAL_SECTIONS,
+    SECTION_KINDS,
+)
+
+
+KINDS = {
+    'races': fastyaml.KIND_WEIGHTED,
+    'names': fastyaml.KIND_STRINGS,
+    'groups': fastyaml.KIND_GROUPS,
+}
+
+
+def _strict_load(text, kinds, optional=()):
+    """Parse the text by StrictYAML with the same schema."""
+    return load(text, _strict_schema(kinds, optional)).data
+
+
+def test_parse_shipped_data():
+    """Test that the fast parser gives the same data as StrictYAML."""
+    with open(NPC_FILENAME, encoding='utf-8') as yaml_file:
+        text = yaml_file.read()
+    assert (fastyaml.parse(text, SECTION_KINDS, OPTIONAL_SECTIONS)
+            == _strict_load(text, SECTION_KINDS, OPTIONAL_SECTIONS))
+
+
+def test_parse_scalars():
+    """Test parsing of comments, quoted strings and numbers."""
+    text = (
+        '# comment\n'
+        'races:\n'
+        '- v: elf  # comment\n'
+        '  # comment\n'
+        '  w: 1e3\n'
+        "- v: 'half-elf: #1'\n"
+        '  w: .5\n'
+        '\n'
+        'names:\n'
+        "- Mi'talrythin\n"
+        "-   'It''s me'\n"
+        '- Frodo#Baggins\n'
+        '- yes\n'
+        'groups:\n'
+        '- - fat\n'
+        '  - slim\n'
+        '- - tall\n'
+    )
+    data = fastyaml.parse(text, KINDS)
+    assert data == {
+        'races': [{'v': 'elf', 'w': 1000.0}, {'v': 'half-elf: #1', 'w': 0.5}],
+        'names': ["Mi'talrythin", "It's me", 'Frodo#Baggins', 'yes'],
+        'groups': [['fat', 'slim'], ['tall']],
+    }
+    assert data == _strict_load(text, KINDS)
+
+
+@pytest.mark.parametrize('text', [
+    'names:\n- [Frodo, Sam]\n',
+    'names:\n- &hobbit Frodo\n- *hobbit\n',
+    'names:\n- "Frodo"\n',
+    'names:\n- Frodo\n  Baggins\n',
+    'names:\n-\tFrodo\n',
+    'names:\n- Frodo: Baggins\n',
+    'names:\n',
+    'names:\n- Frodo\nnames:\n- Sam\n',
+    'names:\n- Frodo\nhobbits:\n- Sam\n',
+    '---\nnames:\n- Frodo\n',
+    'races:\n- w: 1\n  v: elf\n',
+    'races:\n- v: elf\n  w: a lot\n',
+    'races:\n- v: elf\n',
+    'groups:\n  - fat\n',
+])
+def test_parse_refused(text):
+    """Test that anything unusual is left for StrictYAML."""
+    with pytest.raises(fastyaml.FastYAMLError):
+        fastyaml.parse(text, {'names': fastyaml.KIND_STRINGS,
+                              'races': fastyaml.KIND_WEIGHTED,
+                              'groups': fastyaml.KIND_GROUPS},
+                       optional=('names', 'races', 'groups'))
+
+
+def test_parse_missing_section():
+    """Test that required sections are checked."""
+    with pytest.raises(fastyaml.FastYAMLError):
+        fastyaml.parse('names:\n- Frodo\n', KINDS, optional=('races',))
+    assert fastyaml.parse('names:\n- Frodo\n', KINDS,
+                          optional=('races', 'groups')) == {'names': ['Frodo']}
+
+
+def test_load_yaml_fallback():
+    """Test that StrictYAML parses what the fast parser refuses."""
+    kinds = {'names': fastyaml.KIND_STRINGS}
+    assert _load_yaml('names:\n- "Frodo"\n', kinds) == {'names': ['Frodo']}
+    with pytest.raises(YAMLValidationError, match='line 3'):
+        _load_yaml('names:\n- Frodo\n- Sam: Gamgee\n', kinds)
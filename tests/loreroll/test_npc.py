@@ -1,12 +1,29 @@
 """Tests for npc.py"""
 
+import collections
+import itertools
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
 from loreroll.npc import (
+    _allocate_quota,
     _filter_string_data,
     _filter_structured_data,
+    _parse_yaml,
     _weighted_random,
+    DataProvider,
+    generate_names,
     generate_npc,
     generate_npcs,
+    iter_name_chunks,
+    iter_npc_range,
+    iter_npcs,
     NPC_DATA,
+    NPC_FILENAME,
+    npc_at,
+    prepared_cache_info,
 )
 
 
@@ -132,6 +149,16 @@ def test_filter_string_data():
         LOTR_LIST, HOBBITS_LIST + ['Gimli'], ('Gimli',)
     ) == HOBBITS_LIST
 
+    # Items matching more allowed values are only included once
+    assert _filter_string_data(LOTR_LIST, ('a', 'r', 'Sam')) == [
+        'Gandalf', 'Frodo', 'Sam', 'Aragorn', 'Legolas', 'Merry', 'Boromir'
+    ]
+
+    # Special characters are matched literally
+    assert _filter_string_data(['a.b', 'axb', '(c)'], ('.', '(')) == [
+        'a.b', '(c)'
+    ]
+
 
 def test_filter_structured_data():
     """Test _filter_structured_data() function."""
@@ -161,6 +188,17 @@ def test_filter_structured_data():
         LOTR_DATA_SET, HOBBITS_LIST + ['Gimli'], ('Gimli',)
     ) == HOBBITS_DATA_SET
 
+    # Items matching more allowed values are only included once
+    assert _filter_structured_data(
+        LOTR_DATA_SET, ('Frodo', 'o', 'Sam'), ('Boromir',)
+    ) == [
+        {'v': 'Frodo', 'w': 42},
+        {'v': 'Sam', 'w': 11.0},
+        {'v': 'Aragorn', 'w': '4.2'},
+        {'v': 'Legolas', 'w': 5.1},
+        {'v': 'Sauron', 'w': 0},
+    ]
+
 
 def _assert_npc_data_from_the_data_file(npc):
     """Test that the given NPC is generated from RollTheLore data set.
@@ -199,6 +237,110 @@ def test_generate_npcs():
             _assert_npc_data_from_the_data_file(npc)
 
 
+def test_generate_npcs_exclusive_traits():
+    """Test that generated traits are distinct and not contradictory."""
+    groups = {
+        section: {
+            trait: index
+            for index, group in enumerate(NPC_DATA[f'{section}_exclusive'])
+            for trait in group
+        }
+        for section in ('physical', 'personality')
+    }
+    for npc in generate_npcs(200, traits=9):
+        for section in ('physical', 'personality'):
+            traits = getattr(npc, section)
+            assert len(traits) == 9
+            assert len(set(traits)) == 9
+            trait_groups = [groups[section][trait] for trait in traits
+                            if trait in groups[section]]
+            assert len(trait_groups) == len(set(trait_groups))
+
+
+def test_parse_yaml_invalid_exclusive(tmp_path):
+    """Test that exclusive groups may only contain known traits."""
+    with open(NPC_FILENAME, encoding='utf-8') as yaml_file:
+        data = yaml_file.read()
+    path = tmp_path / 'npc.yaml'
+    path.write_text(data.replace('  - slim\n', '  - slim\n  - hairy feet\n'),
+                    encoding='utf-8')
+    with pytest.raises(ValueError, match='hairy feet'):
+        _parse_yaml(path)
+
+
+def test_iter_npcs():
+    """Test iter_npcs() function."""
+    random.seed('iter')
+    npcs = list(iter_npcs(20, 3, {'races_yes': ['elf']}))
+    random.seed('iter')
+    assert npcs == generate_npcs(20, 3, {'races_yes': ['elf']})
+
+    # Endless generation
+    npcs = iter_npcs(None, generate_adventurers=False)
+    for npc in itertools.islice(npcs, 100):
+        assert npc.class_ is None
+        _assert_npc_data_from_the_data_file(npc)
+
+
+def test_generate_names(monkeypatch):
+    """Test generating names in bulk."""
+    names = generate_names(1000, rng=random.Random('names'))
+    assert len(names) == 1000
+    assert set(names) <= set(NPC_DATA['names'])
+    assert names == generate_names(1000, rng=random.Random('names'))
+    assert not generate_names(0)
+
+    monkeypatch.setattr('loreroll.npc.NAME_CHUNK_SIZE', 7)
+    data = DataProvider(lambda: {'names': ['Frodo', 'Sam', 'Sam', 'Pippin']})
+    chunks = list(iter_name_chunks(20, unique=True, data=data))
+    assert [len(chunk) for chunk in chunks] == [7, 7, 6]
+    names = list(itertools.chain.from_iterable(chunks))
+    # No repeated names until all of them have been used
+    for start in range(0, 18, 3):
+        assert sorted(names[start:start + 3]) == ['Frodo', 'Pippin', 'Sam']
+
+    chunks = iter_name_chunks(None, unique=True, data=data)
+    assert len(list(itertools.islice(chunks, 5))) == 5
+    with pytest.raises(IndexError):
+        generate_names(1, unique=True,
+                       data=DataProvider(lambda: {'names': []}))
+
+
+def test_iter_npc_range():
+    """Test generating NPCs of the seekable NPC sequence."""
+    filters = {'races_yes': ['elf']}
+    npcs = list(iter_npc_range('seek', 0, 30, 3, filters))
+    assert len(npcs) == 30
+    assert all('elf' in npc.race for npc in npcs)
+    assert list(iter_npc_range('seek', 10, 20, 3, filters)) == npcs[10:20]
+    assert npc_at('seek', 29, 3, filters) == npcs[29]
+    assert npc_at(42, 3) == npc_at('42', 3)
+    assert npc_at('seek', 0, 3, filters) != npc_at('keep', 0, 3, filters)
+
+    endless = iter_npc_range('seek', 25, traits=3, filters=filters)
+    assert list(itertools.islice(endless, 5)) == npcs[25:]
+    with pytest.raises(ValueError):
+        npc_at('seek', -1)
+
+
+def test_generate_npcs_rng():
+    """Test generate_npcs() with own random generators."""
+    random.seed('global')
+    state = random.getstate()
+    npcs = generate_npcs(20, rng=random.Random('rng'))
+    assert random.getstate() == state
+
+    # Concurrent generation with the same seed gives the same results
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(
+            lambda _: generate_npcs(20, rng=random.Random('rng')), range(8)
+        ))
+    assert all(result == npcs for result in results)
+
+    random.seed('rng')
+    assert generate_npcs(20) == npcs
+
+
 def test_generate_npcs_filters():
     """Test generate_npcs() function filters."""
     npcs_count = 50
@@ -233,3 +375,120 @@ def test_generate_npcs_filters():
                              filters={'races_yes': ['kobold', 'not-a-race']}):
         assert npc.race == 'kobold'
         _assert_npc_data_from_the_data_file(npc)
+
+
+def test_allocate_quota():
+    """Test allocating exact numbers of NPCs for quota shares."""
+    assert _allocate_quota(7, [0.4, 0.25]) == [3, 2]
+    assert _allocate_quota(10, [0.5, 0.5]) == [5, 5]
+    assert _allocate_quota(3, [1 / 3, 1 / 3, 1 / 3]) == [1, 1, 1]
+    assert _allocate_quota(0, [0.4]) == [0]
+    for shares in ([0.7, 0.4], [-0.1], [1.5]):
+        with pytest.raises(ValueError):
+            _allocate_quota(10, shares)
+
+
+def test_generate_npcs_quotas():
+    """Test generating exact shares of races, ages and classes."""
+    filters = {
+        'races_quota': {'human': 0.4, 'dwarf (hill)': 0.25},
+        'ages_quota': {'young': 0.5},
+        'classes_quota': {'bard': 1},
+        'races_no': ['elf'],
+    }
+    info = prepared_cache_info()
+    npcs = generate_npcs(1000, filters=filters, rng=random.Random('quota'))
+    # The samplers are prepared once for the quotas too
+    assert (prepared_cache_info().hits + prepared_cache_info().misses
+            == info.hits + info.misses + 1)
+    races = collections.Counter(npc.race for npc in npcs)
+    assert races['human'] == 400
+    assert races['dwarf (hill)'] == 250
+    assert not any('elf' in race for race in races)
+    assert len(races) > 3
+    assert sum(npc.age == 'young' for npc in npcs) == 500
+    assert all(npc.class_ == 'bard' for npc in npcs)
+    assert npcs == generate_npcs(1000, filters=filters,
+                                 rng=random.Random('quota'))
+    assert list(iter_npcs(1000, filters=filters,
+                          rng=random.Random('quota'))) == npcs
+
+    for invalid in ({'races_quota': {'dragon': 0.5}},
+                    {'races_quota': {'human': 0.5}, 'races_no': ['human']},
+                    {'races_yes': ['human'], 'races_quota': {'human': 0.5}},
+                    {'races_quota': {'human': 0.6, 'elf (high)': 0.6}}):
+        with pytest.raises(ValueError):
+            generate_npcs(10, filters=invalid)
+    with pytest.raises(ValueError):
+        generate_npcs(10, filters={'classes_quota': {'bard': 1}},
+                      generate_adventurers=False)
+    with pytest.raises(ValueError):
+        next(iter_npcs(None, filters={'races_quota': {'human': 1}}))
+    with pytest.raises(ValueError):
+        next(iter_npc_range('seed', filters={'races_quota': {'human': 1}}))
+
+
+def test_data_provider_is_lazy():
+    """Test that DataProvider loads the data only when needed."""
+    loads = []
+
+    def loader():
+        loads.append(True)
+        return {'names': LOTR_LIST, 'classes': ['hobbit']}
+
+    provider = DataProvider(loader)
+    assert not loads
+    assert provider['names'] == LOTR_LIST
+    assert provider['classes'] == ['hobbit']
+    assert set(provider) == {'names', 'classes'}
+    assert len(loads) == 1
+
+    provider.reset()
+    assert len(provider) == 2
+    assert len(loads) == 2
+
+
+def test_data_provider_set_data():
+    """Test injecting data into NPC_DATA."""
+    try:
+        NPC_DATA.set_data({
+            'names': ['Frodo'],
+            'races': HOBBITS_DATA_SET,
+            'classes': [],
+            'age': [{'v': 'young', 'w': 1}],
+            'physical': ['hairy feet', 'short', 'tall'],
+            'physical_exclusive': [['short', 'tall']],
+            'personality': ['brave'],
+        })
+        for npc in generate_npcs(10):
+            assert npc.name == 'Frodo'
+            assert npc.race in HOBBITS_LIST
+            assert len(npc.physical) == 2
+            assert 'hairy feet' in npc.physical
+            assert npc.personality == ['brave']
+    finally:
+        NPC_DATA.reset()
+    assert NPC_DATA['names'] == ALL_NAMES
+
+
+def test_prepared_data_cache():
+    """Test that prepared data are cached per filters."""
+    generate_npcs(1, filters={'races_yes': ['elf', 'gnome']})
+    info = prepared_cache_info()
+
+    # Order and duplicates of filter values don't matter
+    generate_npcs(1, filters={'races_yes': ('gnome', 'elf', 'elf'),
+                              'races_no': []})
+    assert prepared_cache_info().hits == info.hits + 1
+    assert prepared_cache_info().misses == info.misses
+
+    generate_npcs(1, filters={'races_yes': ['elf', 'gnome']},
+                  generate_adventurers=False)
+    assert prepared_cache_info().misses == info.misses + 1
+
+    # Data changes clear the cache
+    NPC_DATA.reset()
+    assert prepared_cache_info().currsize == 0
+    for npc in generate_npcs(10, filters={'races_yes': ['elf', 'gnome']}):
+        assert 'elf' in npc.race or 'gnome' in npc.race
+    assert prepared_cache_info().currsize == 1
@@ -0,0 +1,62 @@
+"""Tests for parallel.py"""
+
+import pytest
+
+from loreroll.npc import iter_npc_range
+from loreroll.parallel import (
+    generate_npcs_parallel,
+    iter_shards_parallel,
+)
+from loreroll.rng import derive_seed
+
+
+def test_derive_seed():
+    """Test derive_seed() function."""
+    assert derive_seed(42, 0) == derive_seed('42', 0)
+    assert derive_seed(42, 0) != derive_seed(42, 1)
+    assert derive_seed(42, 0) != derive_seed(43, 0)
+    assert derive_seed(42, 1, 0) != derive_seed(42, 10)
+
+
+def test_generate_npcs_parallel():
+    """Test that parallel results only depend on the seed."""
+    npcs = generate_npcs_parallel(25, filters={'races_yes': ['elf']},
+                                  seed='foo', workers=2, shard_size=7)
+    assert len(npcs) == 25
+    assert all('elf' in npc.race for npc in npcs)
+
+    assert npcs == generate_npcs_parallel(
+        25, filters={'races_yes': ['elf']}, seed='foo', workers=3,
+        shard_size=7
+    )
+    assert npcs != generate_npcs_parallel(
+        25, filters={'races_yes': ['elf']}, seed='bar', workers=2,
+        shard_size=7
+    )
+
+
+def test_iter_shards_parallel_formatter():
+    """Test formatting shards in the workers."""
+    shards = list(iter_shards_parallel(10, seed=1, workers=2, shard_size=4,
+                                       formatter=repr))
+    assert len(shards) == 3
+    assert all(isinstance(shard, str) for shard in shards)
+    assert ''.join(shards) == ''.join(
+        map(repr, generate_npcs_parallel(10, seed=1, shard_size=4))
+    )
+
+
+def test_generate_npcs_parallel_seekable():
+    """Test that seekable parallel results don't depend on the shards."""
+    npcs = generate_npcs_parallel(25, seed='foo', workers=2, shard_size=7,
+                                  start=100)
+    assert npcs == list(iter_npc_range('foo', 100, 125))
+    assert npcs == generate_npcs_parallel(25, seed='foo', workers=3,
+                                          shard_size=4, start=100)
+
+
+def test_generate_npcs_parallel_quotas():
+    """Test that quotas are refused by parallel generation."""
+    with pytest.raises(ValueError):
+        generate_npcs_parallel(10, filters={'races_quota': {'human': 1}},
+                               workers=2)
@@ -0,0 +1,142 @@
+"""Tests for population.py"""
+
+import io
+import random
+import tracemalloc
+
+import pytest
+
+from loreroll.npc import generate_npcs, iter_npcs, NPC
+from loreroll.export import read_columnar, write_columnar
+from loreroll.population import IndexedPopulation, NPCView, Population
+
+
+def test_population():
+    """Test that Population stores NPCs without changes."""
+    npcs = generate_npcs(200, traits=3, rng=random.Random(1))
+    npcs += generate_npcs(200, traits=1, generate_adventurers=False,
+                          rng=random.Random(2))
+    population = Population(npcs)
+
+    assert len(population) == len(npcs)
+    for npc, view in zip(npcs, population):
+        assert isinstance(view, NPCView)
+        assert view == npc
+        assert view.to_npc() == npc
+        assert view.physical == npc.physical
+        assert view.class_ == npc.class_
+    assert population[-1] == npcs[-1]
+    assert population[10:13] == npcs[10:13]
+    with pytest.raises(IndexError):
+        population[len(npcs)]  # pylint: disable=pointless-statement
+
+    # Views behave like NPCs
+    assert NPC(*population[0]) == npcs[0]
+    assert repr(population[0]).startswith('NPCView(name=')
+
+
+def test_population_big_tables():
+    """Test that tables can grow beyond the limits of unsigned shorts."""
+    population = Population(
+        NPC(f'NPC {i}', 'old', 'elf', None, [], []) for i in range(70000)
+    )
+    assert population[69999].name == 'NPC 69999'
+    assert population[0].name == 'NPC 0'
+    assert len(population.tables['race']) == 1
+
+
+def test_population_memory():
+    """Test that Population takes much less memory than a list of NPCs."""
+    number = 20000
+
+    tracemalloc.start()
+    try:
+        npcs = generate_npcs(number, traits=3, rng=random.Random(1))
+        list_size = tracemalloc.get_traced_memory()[0]
+        del npcs
+        tracemalloc.clear_traces()
+
+        npcs = iter_npcs(number, traits=3, rng=random.Random(1))
+        population = Population(npcs)
+        population_size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    assert len(population) == number
+    assert population_size * 5 < list_size
+
+
+def _scan(npcs, age, race, trait):
+    """Return indices of the NPCs matching the criteria by a linear scan."""
+    return [
+        index for index, npc in enumerate(npcs)
+        if age in npc.age and race in npc.race
+        and any(trait in value for value in npc.physical)
+    ]
+
+
+def test_indexed_population_query():
+    """Test that queries match a linear scan over the NPCs."""
+    npcs = generate_npcs(3000, traits=3, rng=random.Random(1))
+    population = IndexedPopulation(npcs[:1000], group='first')
+    population.extend(npcs[1000:], group='rest')
+    assert population[:] == npcs
+
+    result = population.query(age='old', race='tiefling', physical='scar')
+    assert list(result.indices) == _scan(npcs, 'old', 'tiefling', 'scar')
+    assert result[:] == [npcs[i] for i in result.indices]
+
+    rogues = population.query(class_='rogue', group='first')
+    assert {npc.class_ for npc in rogues} == {'rogue'}
+    assert all(index < 1000 for index in rogues.indices)
+    assert population.group(rogues.indices[0]) == 'first'
+
+    either = population.query(class_=['rogue', 'bard'])
+    assert either[:] == (population.query(class_='rogue')
+                         | population.query(class_='bard'))[:]
+    assert (either & rogues)[:] == rogues[:]
+    assert len(population.query()) == 3000
+    assert not population.query(race='unicorn')
+    with pytest.raises(ValueError):
+        population.query(name='Sirius')
+
+
+def test_indexed_population_groups_and_sampling():
+    """Test path groups and random sampling of query results."""
+    population = IndexedPopulation()
+    for seed, path in enumerate((('town', 'inn'), ('town', 'house 1'),
+                                 ('village',))):
+        population.extend(generate_npcs(50, rng=random.Random(seed)), path)
+    town = population.query(group=('town',))
+    assert list(town.indices) == list(range(100))
+    assert len(population.query(group=[('village',), ('town', 'inn')])) == 100
+
+    rng = random.Random(1)
+    assert town.choice(rng) in town[:]
+    sample = town.sample(10, rng)
+    # Views compare and hash by the NPCs and the town NPCs are all distinct.
+    assert len(set(town)) == len(town)
+    assert len(sample) == len(set(sample)) == 10
+    assert set(sample) <= set(town)
+    with pytest.raises(IndexError):
+        population.query(race='unicorn').choice()
+
+
+def test_indexed_population_columns():
+    """Test indexing NPCs added column-wise."""
+    npcs = generate_npcs(100, rng=random.Random(1))
+    stream = io.BytesIO()
+    write_columnar(npcs, stream)
+    stream.seek(0)
+    loaded = read_columnar(stream)
+
+    population = IndexedPopulation(npcs[:10])
+    population.extend_columns(loaded.tables, loaded.columns, loaded.ends,
+                              group='loaded')
+    assert len(population) == 110
+    assert list(population.query(group='loaded').indices) == list(
+        range(10, 110)
+    )
+    elves = population.query(race='elf')
+    assert elves[:] == [npc for npc in npcs[:10] + npcs
+                        if 'elf' in npc.race]
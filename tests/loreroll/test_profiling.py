@@ -0,0 +1,59 @@
+"""Tests for profiling.py"""
+
+import random
+
+from loreroll import profiling
+from loreroll.npc import generate_npcs, NPC_DATA
+
+
+def test_profiling_disabled():
+    """Test that the helpers do nothing unless profiling is enabled."""
+    assert profiling.active() is None
+    items = [1, 2]
+    assert profiling.timed('generate', items) is items
+    with profiling.stage('generate'):
+        profiling.count('npcs')
+        profiling.note('data source', 'bundle')
+    assert profiling.disable() is None
+
+
+def test_stats_nested_stages():
+    """Test that nested stages are subtracted from the outer ones."""
+    stats = profiling.Stats()
+    with stats.stage('output'):
+        items = list(stats.timed('generate', range(3), 'npcs'))
+        with stats.stage('format'):
+            pass
+    assert items == [0, 1, 2]
+    assert stats.stages['generate'][0] == 4
+    assert stats.stages['format'][0] == stats.stages['output'][0] == 1
+    assert stats.counters == {'npcs': 3}
+    assert sum(seconds for _, seconds in stats.stages.values()) <= (
+        stats.elapsed
+    )
+    assert set(stats.as_dict()) == {'elapsed', 'stages', 'counters',
+                                    'notes'}
+
+
+def test_profile_generation():
+    """Test profiling generation of NPCs."""
+    NPC_DATA.reset()
+    with profiling.profile() as stats:
+        generate_npcs(10, filters={'races_yes': ['elf']},
+                      rng=random.Random(1))
+        generate_npcs(5, filters={'races_yes': ['elf']})
+    assert profiling.active() is None
+    assert stats.counters == {
+        'npcs': 15,
+        'prepared cache hits': 1,
+        'prepared cache misses': 1,
+    }
+    assert {'load data', 'filter', 'generate'} <= set(stats.stages)
+    assert stats.notes['data source'] == 'bundle'
+    assert stats.notes['filter races'].endswith(
+        f' of {len(NPC_DATA["races"])} passed'
+    )
+
+    report = stats.report()
+    assert 'NPCs: 15 (' in report
+    assert 'prepared cache hits: 1' in report
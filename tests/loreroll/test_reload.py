@@ -0,0 +1,144 @@
+"""Tests for reload.py"""
+
+import pytest
+
+from loreroll.npc import (
+    _parse_yaml,
+    _trait_samplers,
+    DataProvider,
+    generate_npcs,
+    NPC_DATA,
+    prepared_cache_info,
+)
+from loreroll.reload import DataWatcher, reload_data
+
+
+YAML_DATA = '''\
+races:
+- v: hobbit
+  w: 1
+
+classes:
+- burglar
+
+age:
+- v: young
+  w: 1
+
+physical:
+- short
+- tall
+- hairy feet
+
+physical_exclusive:
+- - short
+  - tall
+
+personality:
+- brave
+
+names:
+- Frodo
+- Sam
+'''
+
+
+@pytest.fixture
+def yaml_file(tmp_path):
+    """Create a small YAML data file."""
+    path = tmp_path / 'npc.yaml'
+    path.write_text(YAML_DATA, encoding='utf-8')
+    return path
+
+
+def _edit(path, old, new):
+    """Replace old with new in the given file."""
+    path.write_text(path.read_text(encoding='utf-8').replace(old, new),
+                    encoding='utf-8')
+
+
+def test_data_provider_update():
+    """Test replacing only some sections of the data."""
+    calls = []
+    provider = DataProvider(lambda: {'names': ['Frodo'], 'classes': []})
+    provider.subscribe(lambda: calls.append('all'))
+    provider.subscribe(lambda: calls.append('names'), ['names'])
+    names_version = provider.section_version('names')
+    classes_version = provider.section_version('classes')
+
+    provider.update({'classes': ['burglar'], 'races': []})
+    assert calls == ['all']
+    assert dict(provider) == {
+        'names': ['Frodo'], 'classes': ['burglar'], 'races': [],
+    }
+    assert provider.section_version('names') == names_version
+    assert provider.section_version('classes') != classes_version
+
+    provider.reset()
+    assert calls == ['all', 'all', 'names']
+    assert dict(provider) == {'names': ['Frodo'], 'classes': []}
+
+
+def test_watcher_reloads_changed_sections(yaml_file):
+    """Test that only the changed sections are reloaded."""
+    provider = DataProvider(lambda: _parse_yaml(yaml_file))
+    watcher = DataWatcher(provider, yaml_file)
+    names = provider['names']
+    assert watcher.check() == set()
+
+    _edit(yaml_file, '- burglar', '- burglar\n- wizard')
+    _edit(yaml_file, '- hairy feet', '- hairy feet\n- big ears')
+    assert watcher.check() == {'classes', 'physical'}
+    assert provider['classes'] == ['burglar', 'wizard']
+    assert provider['physical'][-1] == 'big ears'
+    assert provider['names'] is names
+    assert watcher.check() == set()
+
+    assert reload_data(provider, yaml_file) == set(_parse_yaml(yaml_file))
+
+
+def test_watcher_keeps_data_on_errors(yaml_file):
+    """Test that invalid changes are refused."""
+    provider = DataProvider(lambda: _parse_yaml(yaml_file))
+    watcher = DataWatcher(provider, yaml_file)
+    assert provider['names'] == ['Frodo', 'Sam']
+
+    _edit(yaml_file, '  - tall', '  - towering')
+    with pytest.raises(ValueError, match='towering'):
+        watcher.check()
+    _edit(yaml_file, 'names:\n- Frodo\n- Sam\n', '')
+    with pytest.raises(ValueError, match='names'):
+        watcher.check()
+    assert provider['physical_exclusive'] == [['short', 'tall']]
+    assert provider['names'] == ['Frodo', 'Sam']
+
+
+def test_update_invalidates_dependent_caches():
+    """Test that only caches depending on the changed sections are cleared."""
+    try:
+        NPC_DATA.reset()
+        generate_npcs(1)
+        samplers = _trait_samplers()
+        NPC_DATA.update({'names': ['Frodo']})
+        assert prepared_cache_info().currsize == 1
+        assert _trait_samplers() is samplers
+
+        NPC_DATA.update({'races': [{'v': 'hobbit', 'w': 1}]})
+        assert prepared_cache_info().currsize == 0
+        for npc in generate_npcs(5):
+            assert npc.name == 'Frodo'
+            assert npc.race == 'hobbit'
+        assert _trait_samplers() is samplers
+    finally:
+        NPC_DATA.reset()
+
+
+def test_watcher_thread(yaml_file):
+    """Test watching the file in a thread."""
+    provider = DataProvider(lambda: _parse_yaml(yaml_file))
+    watcher = DataWatcher(provider, yaml_file)
+    watcher.start(interval=0.01)
+    with pytest.raises(RuntimeError):
+        watcher.start()
+    watcher.stop()
+    watcher.stop()
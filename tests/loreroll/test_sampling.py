@@ -0,0 +1,84 @@
+"""Tests for sampling.py"""
+
+import random
+from collections import Counter
+
+import pytest
+
+from loreroll.sampling import AliasSampler, TraitSampler, WeightedSampler
+
+
+DATA_SET = [
+    {'v': 'Gandalf', 'w': '1'},
+    {'v': 'Frodo', 'w': 42},
+    {'v': 'Sam', 'w': 11.0},
+    {'v': 'Aragorn', 'w': '4.2'},
+    {'v': 'Sauron', 'w': 0},
+]
+
+
+def test_weighted_sampler_matches_random_choices():
+    """Test that WeightedSampler gives the same results as random.choices."""
+    sampler = WeightedSampler(DATA_SET)
+    values = [x['v'] for x in DATA_SET]
+    weights = [float(x['w']) for x in DATA_SET]
+
+    expected_rng = random.Random(42)
+    rng = random.Random(42)
+    for _ in range(1000):
+        assert (sampler.sample(rng)
+                == expected_rng.choices(values, weights)[0])
+
+
+@pytest.mark.parametrize('sampler_class', (WeightedSampler, AliasSampler))
+def test_samplers_respect_weights(sampler_class):
+    """Test that samplers never return zero-weight values."""
+    sampler = sampler_class(DATA_SET)
+    assert len(sampler) == len(DATA_SET)
+
+    rng = random.Random(0)
+    counts = Counter(sampler.sample(rng) for _ in range(20000))
+    assert 'Sauron' not in counts
+    assert set(counts) == {'Gandalf', 'Frodo', 'Sam', 'Aragorn'}
+    # Frodo has ~72 % of the total weight
+    assert 0.68 < counts['Frodo'] / 20000 < 0.76
+
+
+@pytest.mark.parametrize('sampler_class', (WeightedSampler, AliasSampler))
+def test_samplers_invalid_data(sampler_class):
+    """Test that sampling from invalid data sets fails."""
+    with pytest.raises(IndexError):
+        sampler_class([]).sample()
+    with pytest.raises(ValueError):
+        sampler_class([{'v': 'Sauron', 'w': 0}]).sample()
+
+
+def test_trait_sampler():
+    """Test that TraitSampler draws distinct non-conflicting traits."""
+    sampler = TraitSampler(
+        ['fat', 'slim', 'tall', 'short', 'bald', 'tall', 'wise'],
+        [['fat', 'slim'], ['tall', 'short'], ['one-eyed']]
+    )
+    assert len(sampler) == 7
+    assert sampler.group_count == 4
+
+    rng = random.Random(0)
+    counts = Counter()
+    for _ in range(2000):
+        traits = sampler.sample(3, rng)
+        assert len(traits) == 3
+        assert len(set(traits)) == 3
+        assert not {'fat', 'slim'} <= set(traits)
+        assert not {'tall', 'short'} <= set(traits)
+        counts.update(traits)
+    assert set(counts) == {'fat', 'slim', 'tall', 'short', 'bald', 'wise'}
+
+    # Not enough groups for more traits
+    assert len(sampler.sample(9, rng)) == 4
+    assert not TraitSampler([]).sample(2, rng)
+
+
+def test_trait_sampler_invalid_groups():
+    """Test that a trait can't be in more than one group."""
+    with pytest.raises(ValueError):
+        TraitSampler(['fat', 'slim', 'tall'], [['fat', 'slim'], ['slim']])
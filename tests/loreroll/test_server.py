@@ -0,0 +1,116 @@
+"""Tests for server.py"""
+
+import asyncio
+import json
+import random
+
+import pytest
+
+from loreroll.npc import generate_npcs
+from loreroll.server import parse_query, RequestError, start_server
+
+
+async def _get(port, target):
+    """Send a GET request to the server, return (status, headers, body)."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'
+                 .encode())
+    await writer.drain()
+    response = (await reader.read()).decode()
+    writer.close()
+    head, body = response.split('\r\n\r\n', 1)
+    status, *header_lines = head.split('\r\n')
+    headers = dict(line.split(': ', 1) for line in header_lines)
+    return status, headers, body
+
+
+def _run_with_server(*targets):
+    """Start a server on a free port and request the targets concurrently."""
+    async def run():
+        server = await start_server(port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return await asyncio.gather(*(_get(port, t) for t in targets))
+    return asyncio.run(run())
+
+
+def test_parse_query():
+    """Test parsing of request queries."""
+    options = parse_query('number=5&race-allowed=elf&race-allowed=human'
+                          '&adventurers=false&seed=x&traits=3')
+    assert options == {
+        'number': 5,
+        'traits': 3,
+        'filters': {
+            'ages_yes': [],
+            'ages_no': [],
+            'classes_yes': [],
+            'classes_no': [],
+            'races_yes': ['elf', 'human'],
+            'races_no': [],
+        },
+        'generate_adventurers': False,
+        'names_only': False,
+        'unique_names': False,
+        'seed': 'x',
+        'start': None,
+        'format': 'text',
+    }
+    assert parse_query('')['number'] == 1
+    assert parse_query('names-only')['names_only']
+
+    for query in ('number=-1', 'traits=10', 'number=x', 'format=xml',
+                  'seed=1&seed=2', 'colour=red', 'adventurers=maybe',
+                  'start=-1', 'start=1&names-only',
+                  'names-only&format=jsonl'):
+        with pytest.raises(RequestError):
+            parse_query(query)
+
+
+def test_server():
+    """Test generating NPCs by the server."""
+    jsonl, text, csv, names, invalid, empty, missing = _run_with_server(
+        '/npcs?number=20&seed=42&race-allowed=elf&format=jsonl',
+        '/npcs?number=20&seed=42&race-allowed=elf',
+        '/npcs?number=2&format=csv',
+        '/npcs?number=4&names-only=1',
+        '/npcs?number=x',
+        '/npcs?race-allowed=unicorn&format=jsonl',
+        '/',
+    )
+
+    status, headers, body = jsonl
+    assert status == 'HTTP/1.1 200 OK'
+    assert headers['X-Seed'] == '42'
+    npcs = [json.loads(line) for line in body.splitlines()]
+    expected = generate_npcs(20, filters={'races_yes': ['elf']},
+                             rng=random.Random('42'))
+    assert [npc['name'] for npc in npcs] == [npc.name for npc in expected]
+    assert [npc['race'] for npc in npcs] == [npc.race for npc in expected]
+
+    assert text[2].count('Name: ') == 20
+    assert csv[2].startswith('name,age,race,class,')
+    assert len(csv[2].splitlines()) == 3
+    assert len(names[2].splitlines()) == 4
+    assert invalid[0] == 'HTTP/1.1 400 Bad Request'
+    assert empty[0] == 'HTTP/1.1 400 Bad Request'
+    assert 'X-Seed' not in empty[1]
+    assert missing[0] == 'HTTP/1.1 404 Not Found'
+
+
+def test_server_concurrent_requests():
+    """Test that concurrent requests with the same seed give the same NPCs."""
+    responses = _run_with_server(*(['/npcs?number=1000&seed=7'] * 4))
+    assert len({body for _, _, body in responses}) == 1
+    assert responses[0][2].count('Name: ') == 1000
+
+
+def test_server_pages():
+    """Test paging through the seekable NPC sequence."""
+    first, second, both = _run_with_server(
+        '/npcs?seed=x&start=0&number=5&format=jsonl',
+        '/npcs?seed=x&start=5&number=5&format=jsonl',
+        '/npcs?seed=x&start=0&number=10&format=jsonl',
+    )
+    assert first[2] + second[2] == both[2]
+    assert len(both[2].splitlines()) == 10
@@ -0,0 +1,129 @@
+"""Tests for settlement.py"""
+
+import pytest
+
+from loreroll.npc import NPC_DATA
+from loreroll.settlement import (
+    generate_settlement,
+    iter_settlement,
+    plan_settlement,
+    SettlementError,
+)
+
+
+TOWN = {
+    'name': 'Phandalin',
+    'mix': {'races': {'human': 3, 'halfling (lightfoot)': 1}},
+    'filters': {'ages_no': ['very old']},
+    'children': [{
+        'name': 'Stonehill Inn',
+        'inhabitants': 4,
+        'adventurers': True,
+        'mix': {'classes': {'fighter': 1, 'rogue': 1}},
+    }, {
+        'name': 'household',
+        'count': 50,
+        'inhabitants': [1, 5],
+        'filters': {'ages_no': ['ancient']},
+    }],
+}
+
+
+def test_generate_settlement():
+    """Test generating a settlement."""
+    settlement = generate_settlement(TOWN, seed=1)
+    assert list(settlement)[:3] == [
+        ('Phandalin',),
+        ('Phandalin', 'Stonehill Inn'),
+        ('Phandalin', 'household 1'),
+    ]
+    assert len(settlement) == 52
+    assert settlement[('Phandalin',)] == []
+
+    inn = settlement[('Phandalin', 'Stonehill Inn')]
+    assert len(inn) == 4
+    assert {npc.class_ for npc in inn} <= {'fighter', 'rogue'}
+    for path, npcs in settlement.items():
+        if path[-1].startswith('household'):
+            assert 1 <= len(npcs) <= 5
+        for npc in npcs:
+            assert npc.race in ('human', 'halfling (lightfoot)')
+            assert npc.age not in ('very old', 'ancient')
+            assert 'household' not in path[-1] or npc.class_ is None
+
+    assert generate_settlement(TOWN, seed=1) == settlement
+    assert generate_settlement(TOWN, seed=2) != settlement
+
+
+def test_settlement_nodes_are_independent():
+    """Test that changing a node doesn't change the others."""
+    town = dict(TOWN, children=[TOWN['children'][1]])
+    nodes = list(iter_settlement(TOWN, seed='x'))
+    assert list(iter_settlement(town, seed='x')) == [
+        node for node in nodes if node.path[-1] != 'Stonehill Inn'
+    ]
+
+
+def test_plan_settlement_shares_samplers():
+    """Test that nodes with the same settings share their samplers."""
+    plans = plan_settlement(TOWN)
+    households = [plan for plan in plans if plan.inhabitants == [1, 5]]
+    assert len(households) == 50
+    assert all(plan.samplers is households[0].samplers
+               for plan in households)
+
+
+def test_settlement_filters_narrow():
+    """Test that child nodes only narrow the filters of their parents."""
+    town = {
+        'name': 'Mirabar',
+        'filters': {'races_yes': ['dwarf', 'human']},
+        'children': [{
+            'name': 'Hammer Hall',
+            'inhabitants': 20,
+            'filters': {'races_yes': ['dwarf (mountain)']},
+        }],
+    }
+    hall = generate_settlement(town, seed=1)[('Mirabar', 'Hammer Hall')]
+    assert {npc.race for npc in hall} == {'dwarf (mountain)'}
+
+    town['children'][0]['filters'] = {'races_yes': ['dwarf', 'elf']}
+    with pytest.raises(SettlementError, match='not allowed by the parent'):
+        plan_settlement(town)
+
+
+@pytest.mark.parametrize('spec', [
+    {'name': 'town', 'colour': 'red'},
+    {'inhabitants': [5, 1]},
+    {'inhabitants': 'many'},
+    {'count': -1},
+    {'adventurers': 'no'},
+    {'children': {'name': 'district'}},
+    {'children': ['district']},
+    {'mix': {'races': {'dragon': 1}}},
+    {'mix': {'hair': {'red': 1}}},
+    {'mix': {'races': {'human': -1}}},
+    {'filters': {'races_quota': {'human': 0.5}}},
+    {'filters': {'races_yes': ['dwarf']},
+     'mix': {'races': {'human': 1}}},
+    {'filters': {'races_yes': 'elf'}},
+    {'filters': {'races_no': [1]}},
+    {'children': [{'mix': {'races': {'human': 0}}}]},
+    {'filters': {'races_no': ['human']},
+     'mix': {'races': {'human': 1, 'dwarf': 0}}},
+])
+def test_invalid_settlement(spec):
+    """Test that invalid specifications are refused before generating."""
+    with pytest.raises(SettlementError):
+        plan_settlement(spec, NPC_DATA)
+
+
+@pytest.mark.parametrize('children', [
+    [{'inhabitants': 3}, {'inhabitants': 3}],
+    [{'name': 'inn', 'inhabitants': 3}, {'name': 'inn', 'inhabitants': 4}],
+    [{'name': 'house', 'count': 2}, {'name': 'house 2'}],
+])
+def test_duplicate_siblings(children):
+    """Test that siblings with the same path are rejected."""
+    with pytest.raises(SettlementError, match='same path'):
+        generate_settlement({'name': 'town', 'children': children})
@@ -0,0 +1,111 @@
+"""Tests for unique.py"""
+
+import itertools
+import math
+import random
+
+import pytest
+
+from loreroll.npc import NPC_DATA
+from loreroll.unique import (
+    BloomFilter,
+    combination_space,
+    ENDLESS_CAPACITY,
+    fingerprint,
+    fingerprint_filter,
+    FingerprintSet,
+    generate_unique_npcs,
+    iter_unique_npcs,
+    space_report,
+    UniquenessError,
+)
+
+
+# A small combination space - names of a single race, age and trait set.
+SMALL = {'traits': 0, 'filters': {'races_yes': ['elf (high)'],
+                                  'ages_yes': ['adult']},
+         'generate_adventurers': False}
+
+
+def test_fingerprint():
+    """Test that fingerprints ignore the order of traits."""
+    npc = generate_unique_npcs(1, 3, rng=random.Random(1))[0]
+    shuffled = npc._replace(physical=npc.physical[::-1])
+    assert fingerprint(npc) == fingerprint(shuffled)
+    assert fingerprint(npc) != fingerprint(npc._replace(name='Other'))
+    assert 0 <= fingerprint(npc) < 2 ** 64
+
+
+@pytest.mark.parametrize('seen', [FingerprintSet(), BloomFilter(1000, 0.01)])
+def test_fingerprint_filters(seen):
+    """Test that fingerprint set and Bloom filter never miss duplicates."""
+    rng = random.Random(1)
+    values = [rng.getrandbits(64) for _ in range(1000)]
+    new = sum(seen.add(value) for value in values)
+    assert new >= 980
+    assert not any(seen.add(value) for value in values)
+    assert len(seen) == new
+
+
+@pytest.mark.parametrize('seen', [FingerprintSet(10), BloomFilter(10)])
+def test_fingerprint_filters_capacity(seen):
+    """Test that fingerprint sets and filters don't grow beyond capacity."""
+    for value in range(10):
+        assert seen.add(value << 32 | value)
+    assert not seen.add(0)
+    with pytest.raises(UniquenessError, match='Capacity'):
+        seen.add(11 << 32 | 11)
+
+    endless = fingerprint_filter(None)
+    assert isinstance(endless, BloomFilter)
+    assert endless.capacity == ENDLESS_CAPACITY
+    assert fingerprint_filter(10).capacity == 10
+
+
+def test_combination_space():
+    """Test counting the possible NPCs."""
+    space = combination_space(**SMALL)
+    assert space == len(set(NPC_DATA['names']))
+    assert combination_space(1, SMALL['filters'], False) > space
+    assert combination_space() > combination_space(generate_adventurers=False)
+    # Filters leaving no classes generate NPCs without a class.
+    assert (combination_space(filters={'classes_yes': ['zzz']})
+            == combination_space(generate_adventurers=False))
+
+
+def test_space_report():
+    """Test reporting the fill of the combination space."""
+    space = combination_space(**SMALL)
+    report = space_report(space, **SMALL)
+    assert report.fill == 1
+    assert report.expected_draws == pytest.approx(
+        space * math.fsum(1 / k for k in range(1, space + 1))
+    )
+    assert space_report(space + 1, **SMALL).expected_draws == math.inf
+    assert space_report(10).expected_draws == pytest.approx(10)
+
+
+def test_generate_unique_npcs():
+    """Test that generated NPCs are distinct and reproducible."""
+    number = combination_space(**SMALL) // 2
+    npcs = generate_unique_npcs(number, rng=random.Random(1), **SMALL)
+    assert len(npcs) == number
+    assert len({npc.name for npc in npcs}) == number
+    assert npcs == generate_unique_npcs(number, rng=random.Random(1),
+                                        **SMALL)
+
+    endless = iter_unique_npcs(None, rng=random.Random(1), **SMALL)
+    assert list(itertools.islice(endless, number)) == npcs
+
+
+def test_generate_unique_npcs_exhausted():
+    """Test that exhausting the combination space raises an error."""
+    space = combination_space(**SMALL)
+    with pytest.raises(UniquenessError, match='Only'):
+        iter_unique_npcs(space + 1, **SMALL)
+    seen = FingerprintSet()
+    generate_unique_npcs(space // 2, seen=seen, **SMALL)
+    with pytest.raises(UniquenessError, match='exhausted'):
+        generate_unique_npcs(space, seen=seen, **SMALL)
+    with pytest.raises(ValueError):
+        iter_unique_npcs(2, filters={'races_quota': {'human': 0.5}})
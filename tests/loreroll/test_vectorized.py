@@ -0,0 +1,111 @@
+"""Tests for vectorized.py"""
+
+import random
+
+import pytest
+
+from loreroll import npc as npc_module, vectorized
+from loreroll.npc import generate_npcs, iter_npcs, NPC, NPC_DATA
+from loreroll.sampling import TraitSampler
+
+numpy = pytest.importorskip('numpy')
+
+
+def test_generate_npcs_numpy():
+    """Test generate_npcs() with the numpy engine."""
+    npcs = generate_npcs(500, traits=3, engine='numpy',
+                         filters={'races_yes': ['elf'], 'classes_no': ['r']})
+    assert isinstance(npcs, vectorized.NPCColumns)
+    assert len(npcs) == 500
+    for npc in npcs:
+        assert isinstance(npc, NPC)
+        assert npc.name in NPC_DATA['names']
+        assert 'elf' in npc.race
+        assert 'r' not in npc.class_
+        assert len(npc.physical) == 3
+        assert len(npc.personality) == 3
+        assert set(npc.personality) <= set(NPC_DATA['personality'])
+
+
+def test_generate_npcs_numpy_exclusive_traits():
+    """Test that the numpy engine honours exclusive traits."""
+    sampler = TraitSampler(['fat', 'slim', 'bald', 'wise'],
+                           [['fat', 'slim']])
+    rng = numpy.random.default_rng(0)
+    # pylint: disable=protected-access
+    indices = vectorized._trait_indices(rng, sampler, 2000, 5)
+    assert indices.shape == (2000, 3)
+    for row in indices.tolist():
+        assert len({sampler.group_ids[index] for index in row}) == 3
+    assert set(indices.ravel().tolist()) == {0, 1, 2, 3}
+
+    for npc in generate_npcs(200, traits=9, engine='numpy'):
+        assert len(set(npc.physical)) == 9
+        assert len(set(npc.personality)) == 9
+        assert not {'fat', 'slim'} <= set(npc.physical)
+
+
+def test_generate_npcs_numpy_civilians():
+    """Test generating civilians with the numpy engine."""
+    npcs = generate_npcs(50, traits=0, generate_adventurers=False,
+                         engine='numpy')
+    assert all(npc.class_ is None for npc in npcs)
+    assert all(npc.physical == [] for npc in npcs)
+
+
+def test_generate_npcs_numpy_seed():
+    """Test that random.seed() determines the numpy engine results."""
+    random.seed('numpy')
+    first = list(generate_npcs(20, engine='numpy'))
+    random.seed('numpy')
+    second = list(generate_npcs(20, engine='numpy'))
+    assert first == second
+
+
+def test_generate_npcs_numpy_rng():
+    """Test the numpy engine with own random generators."""
+    state = random.getstate()
+    first = generate_npcs(20, engine='numpy', rng=random.Random(1))
+    second = generate_npcs(20, engine='numpy',
+                           rng=numpy.random.default_rng(1))
+    assert random.getstate() == state
+    assert list(first) == list(generate_npcs(20, engine='numpy',
+                                             rng=random.Random(1)))
+    assert list(second) == list(generate_npcs(20, engine='numpy',
+                                              rng=numpy.random.default_rng(1)))
+
+
+def test_iter_npcs_numpy_chunks(monkeypatch):
+    """Test that iter_npcs() and generate_npcs() draw the same chunks."""
+    monkeypatch.setattr(npc_module, 'ITER_CHUNK_SIZE', 10)
+    npcs = generate_npcs(25, engine='numpy', rng=random.Random(1))
+    assert len(npcs) == 25
+    assert list(iter_npcs(25, engine='numpy', rng=random.Random(1))) == list(
+        npcs
+    )
+    # Whole chunks don't depend on the number of NPCs
+    assert list(generate_npcs(15, engine='numpy', rng=random.Random(1))[:10]
+                ) == list(npcs[:10])
+
+
+def test_npc_columns_indexing():
+    """Test NPCColumns indexing and slicing."""
+    npcs = generate_npcs(10, engine='numpy')
+    assert npcs[-1] == npcs[9]
+    assert list(npcs[2:5]) == [npcs[2], npcs[3], npcs[4]]
+    with pytest.raises(IndexError):
+        npcs[10]  # pylint: disable=pointless-statement
+
+
+def test_generate_npcs_numpy_fallback(monkeypatch):
+    """Test that the python engine is used if NumPy is missing."""
+    monkeypatch.setattr(vectorized, 'numpy', None)
+    npcs = generate_npcs(5, engine='numpy')
+    assert isinstance(npcs, list)
+    assert len(npcs) == 5
+
+
+def test_generate_npcs_unknown_engine():
+    """Test that unknown engines are refused."""
+    with pytest.raises(ValueError):
+        generate_npcs(5, engine='abacus')
@@ -1,7 +1,25 @@
 """Tests for rollnpc.py"""
 
+import os
+import re
+import subprocess  # nosec
+import sys
+
+from click.testing import CliRunner
+
+from loreroll import server
 from loreroll.npc import NPC
-from rollnpc import print_npc
+from rollnpc import (
+    format_npc,
+    generate,
+    print_npc,
+    SERVER_HOST,
+    SERVER_PORT,
+)
+
+# Modules a plain run of rollnpc doesn't need to import.
+LAZY_MODULES = ('asyncio', 'loreroll.datasets', 'loreroll.parallel',
+                'loreroll.server', 'loreroll.settlement', 'loreroll.unique')
 
 NPCS = (
     NPC(
@@ -63,3 +81,184 @@ def test_print_npc(capsys):
         print_npc(npc[0])
         out, err = capsys.readouterr()
         assert out == npc[1]
+
+
+def test_format_npc():
+    """Test the formatting function with a few examples."""
+    for npc, text in zip(NPCS, NPCS_TEXT):
+        assert format_npc(npc) == text
+
+
+def test_generate():
+    """Test the command line interface."""
+    runner = CliRunner()
+    result = runner.invoke(generate, ['-n', '3', '-s', '42'])
+    assert result.exit_code == 0
+    assert result.output.startswith("Seed used: '42'.")
+    assert result.output.count('Name: ') == 3
+
+    # The same seed gives the same results
+    assert runner.invoke(generate, ['-n', '3', '-s', '42']).output == (
+        result.output
+    )
+
+    # Parallel output doesn't depend on the number of workers
+    result = runner.invoke(generate, ['-n', '3', '-s', '42', '-w', '2'])
+    assert result.exit_code == 0
+    assert result.output.count('Name: ') == 3
+    assert runner.invoke(
+        generate, ['-n', '3', '-s', '42', '-w', '3']
+    ).output == result.output
+
+    # Machine-readable formats
+    result = runner.invoke(generate, ['-n', '3', '-s', '42', '-f', 'jsonl'])
+    assert result.exit_code == 0
+    assert result.stdout.count('"name": ') == 3
+    assert 'Seed used' not in result.stdout
+    result = runner.invoke(generate, ['-n', '3', '-s', '42', '-f', 'csv',
+                                      '-w', '2'])
+    assert result.exit_code == 0
+    assert result.stdout.startswith('name,age,race,class,')
+    assert len(result.stdout.splitlines()) == 4
+
+    result = runner.invoke(generate, ['--names-only', '-n', '5', '-s', '42'])
+    assert result.exit_code == 0
+    assert len(result.output.splitlines()) == 7
+
+    for format_ in ('jsonl', 'csv', 'columnar'):
+        result = runner.invoke(generate, ['--names-only', '-f', format_])
+        assert result.exit_code != 0
+        assert '--names-only can only be used' in result.output
+
+
+def test_generate_data_files(tmp_path, monkeypatch):
+    """Test generating NPCs from additional data files."""
+    monkeypatch.setenv('ROLLTHELORE_CACHE_DIR', str(tmp_path / 'cache'))
+    names = tmp_path / 'names.yaml'
+    names.write_text('replace:\n- names\nnames:\n- Geralt\n',
+                     encoding='utf-8')
+    runner = CliRunner()
+    for workers in ('1', '2'):
+        result = runner.invoke(generate, ['-n', '3', '--data', str(names),
+                                          '-w', workers])
+        assert result.exit_code == 0
+        assert result.output.count('Name: Geralt') == 3
+
+    invalid = tmp_path / 'invalid.yaml'
+    invalid.write_text('names:\n- Geralt: of Rivia\n', encoding='utf-8')
+    result = runner.invoke(generate, ['--data', str(invalid)])
+    assert result.exit_code != 0
+    assert 'Invalid data file' in result.output
+
+
+def test_generate_profile():
+    """Test reporting the profile of the generation."""
+    result = CliRunner().invoke(generate, ['-n', '3', '--profile'])
+    assert result.exit_code == 0
+    assert 'Profile:' in result.output
+    assert 'NPCs: 3 (' in result.output
+
+
+def test_generate_unique_names():
+    """Test generating unique names only."""
+    result = CliRunner().invoke(generate, ['-n', '50', '--names-only',
+                                           '--unique-names', '-s', '1'])
+    assert result.exit_code == 0
+    names = result.output.splitlines()[2:]
+    assert len(names) == len(set(names)) == 50
+
+    result = CliRunner().invoke(generate, ['--unique-names'])
+    assert result.exit_code != 0
+    assert '--unique-names can only be used' in result.output
+
+
+def test_generate_start():
+    """Test generating NPCs from an index of the seed's NPC sequence."""
+    runner = CliRunner()
+    result = runner.invoke(generate, ['-n', '4', '-s', '1', '--start', '10'])
+    assert result.exit_code == 0
+    assert "Run with '-s 1 --start 10'" in result.output
+    npcs = result.output.split('\n\n')[1:]
+    for index, workers in ((12, '1'), (13, '2')):
+        result = runner.invoke(generate, ['-s', '1', '--start', str(index),
+                                          '-w', workers])
+        assert result.output.split('\n\n')[1] == npcs[index - 10]
+
+    result = runner.invoke(generate, ['--start', '1', '--names-only'])
+    assert result.exit_code != 0
+
+
+def test_generate_settlement(tmp_path):
+    """Test generating a settlement from a JSON file."""
+    spec = tmp_path / 'town.json'
+    spec.write_text('{"name": "Phandalin", "children": [{"name": "house", '
+                    '"count": 2, "inhabitants": 2}]}', encoding='utf-8')
+    result = CliRunner().invoke(generate, ['settlement', str(spec)])
+    assert result.exit_code == 0
+    assert '# Phandalin / house 2\n\nName: ' in result.output
+    assert result.output.count('Name: ') == 4
+
+    spec.write_text('{"name": "Phandalin", "size": 2}', encoding='utf-8')
+    result = CliRunner().invoke(generate, ['settlement', str(spec)])
+    assert result.exit_code != 0
+    assert 'unknown keys size' in result.output
+
+
+def test_generate_unique():
+    """Test generating distinct NPCs."""
+    runner = CliRunner()
+    args = ['-t', '0', '-a', 'adult', '-r', 'elf (high)', '--no-adventurers',
+            '--unique']
+    result = runner.invoke(generate, args + ['-n', '1000'])
+    assert result.exit_code == 0
+    names = re.findall(r'^Name: (.*)$', result.output, re.MULTILINE)
+    assert len(names) == len(set(names)) == 1000
+    assert 'WARNING' in result.output
+
+    for extra in (['-n', '100000'], ['-w', '2'], ['--names-only']):
+        result = runner.invoke(generate, args + extra)
+        assert result.exit_code != 0
+        assert 'Traceback' not in result.output
+
+
+def test_generate_quotas():
+    """Test generating exact shares of races."""
+    runner = CliRunner()
+    result = runner.invoke(generate, ['-n', '20', '-f', 'jsonl',
+                                      '--race-quota', 'human=40%',
+                                      '--race-quota', 'dwarf (hill)=0.25'])
+    assert result.exit_code == 0
+    assert result.output.count('"race": "human"') == 8
+    assert result.output.count('"race": "dwarf (hill)"') == 5
+
+    for args in (['--race-quota', 'human'], ['--race-quota', 'dragon=1'],
+                 ['--race-quota', 'human=1', '-w', '2']):
+        result = runner.invoke(generate, args)
+        assert result.exit_code != 0
+        assert 'Traceback' not in result.output
+
+
+def test_generate_nothing_to_choose():
+    """Test reporting filters that leave nothing to choose from."""
+    runner = CliRunner()
+    for extra in ([], ['-w', '2'], ['--start', '5'], ['-f', 'jsonl']):
+        result = runner.invoke(generate, ['-r', 'nonexistent'] + extra)
+        assert result.exit_code != 0
+        assert 'Error: Cannot choose from an empty data set' in result.output
+
+
+def test_lazy_imports():
+    """Test that generating NPCs doesn't import modules of other commands."""
+    code = (
+        'import sys, rollnpc\n'
+        'rollnpc.generate(["-s", "1"], standalone_mode=False)\n'
+        f'print([m for m in {LAZY_MODULES!r} if m in sys.modules])\n'
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(  # nosec
+        [sys.executable, '-c', code], capture_output=True, text=True,
+        check=True, cwd=root
+    )
+    assert result.stdout.splitlines()[-1] == '[]'
+    assert (SERVER_HOST, SERVER_PORT) == (server.DEFAULT_HOST,
+                                          server.DEFAULT_PORT)